@@ -0,0 +1,228 @@
+import platform
+import random
+import statistics
+import string
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, NamedTuple
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from apps.chats.codecs import get_codec
+from apps.chats.ids import uuid7
+from apps.chats.models import Conversation
+from apps.chats.repositories import DatabaseMessageRepo, RedisMessageRepo
+from apps.chats.repositories.redis_repo import RedisConsumerRepo, RedisRateLimiterRepo
+from apps.chats.services.chat_services import ChatService
+from apps.chats.utils import create_user_status_message
+
+MyUser = get_user_model()
+
+SEED_CHUNK_SIZE = 1000
+# Cases that read or rewrite the whole room run fewer operations as the room grows,
+# so each size costs about the same: ops = min(ops, FULL_ROOM_BUDGET // size).
+FULL_ROOM_BUDGET = 100_000
+PUSH_BATCH_SIZE = 100
+
+
+class BenchmarkRoom(NamedTuple):
+    conv_id: str
+    size: int
+    senders: List[int]
+    cursor: str
+
+
+# An operation to time, how many times to run it per repeat, and an optional
+# untimed step run before each call, e.g. to reset the state the operation changes.
+class BenchmarkCase(NamedTuple):
+    op: Callable[[int], object]
+    ops: int
+    setup: Callable[[int], object] | None = None
+
+
+# Times the repository and ChatService hot paths against rooms of several sizes.
+# The Redis repository is uncapped so reads scale with the room, unlike a deployment
+# with CHAT_REDIS_HISTORY_LIMIT. Rooms are seeded into both stores before timing.
+class BenchmarkSuite:
+    def __init__(self, redis_client, ops: int = 200, repeat: int = 5, senders: int = 20, text_length: int = 80):
+        self.redis_client = redis_client
+        self.ops = ops
+        self.repeat = repeat
+        self.sender_count = senders
+        self.text_length = text_length
+
+        self.redis_repo = RedisMessageRepo(redis_client, codec=get_codec(settings.CHAT_REDIS_CODEC))
+        self.db_repo = DatabaseMessageRepo()
+        services = {
+            'user_repo': MyUser.objects,
+            'conversation_repo': Conversation.objects,
+            'redis_repo': self.redis_repo,
+            'db_repo': self.db_repo,
+            'redis_consumer_repo': RedisConsumerRepo(redis_client),
+        }
+        self.chat_service = ChatService(rate_limiter_repo=RedisRateLimiterRepo(redis_client), **services)
+        # Without a rate limiter the service scans the sender's cached messages instead
+        self.scan_chat_service = ChatService(**services)
+
+    def cases(self, room: BenchmarkRoom) -> Dict[str, BenchmarkCase]:
+        conv_id, senders = room.conv_id, room.senders
+        page = settings.CHAT_HISTORY_PAGE_SIZE
+        full_ops = max(1, min(self.ops, FULL_ROOM_BUDGET // room.size))
+        writes = self.ops * self.repeat
+
+        single = [self._message(senders[i % len(senders)]) for i in range(writes)]
+        batches = [[self._message(senders[i % len(senders)]) for _ in range(PUSH_BATCH_SIZE)]
+                   for i in range(full_ops * self.repeat)]
+
+        # Reads come first: the write cases grow the room
+        return {
+            'redis.get_messages': BenchmarkCase(lambda i: self.redis_repo.get_messages(conv_id), full_ops),
+            'redis.get_latest_messages': BenchmarkCase(
+                lambda i: self.redis_repo.get_latest_messages(conv_id, page), self.ops),
+            'redis.get_messages_before': BenchmarkCase(
+                lambda i: self.redis_repo.get_messages_before(conv_id, room.cursor, page), self.ops),
+            'redis.get_messages_by_user_id': BenchmarkCase(
+                lambda i: self.redis_repo.get_messages_by_user_id(conv_id, senders[i % len(senders)]), full_ops),
+            'db.get_messages': BenchmarkCase(lambda i: self.db_repo.get_messages(conv_id), full_ops),
+            'db.get_latest_messages': BenchmarkCase(
+                lambda i: self.db_repo.get_latest_messages(conv_id, page), self.ops),
+            'db.get_messages_before': BenchmarkCase(
+                lambda i: self.db_repo.get_messages_before(conv_id, room.cursor, page), self.ops),
+            'db.get_messages_by_user_id': BenchmarkCase(
+                lambda i: self.db_repo.get_messages_by_user_id(conv_id, senders[i % len(senders)]), full_ops),
+            # Limits of 0 are never exceeded, so every call does the full check
+            'service.check_throttling_message': BenchmarkCase(
+                lambda i: self.chat_service.check_throttling_message(0, 0, senders[i % len(senders)], conv_id),
+                self.ops),
+            'service.check_throttling_message_scan': BenchmarkCase(
+                lambda i: self.scan_chat_service.check_throttling_message(0, 0, senders[i % len(senders)], conv_id),
+                full_ops),
+            # A room going from empty to cached: read it from the database and push it to Redis
+            'service.get_messages_from_db': BenchmarkCase(
+                lambda i: self.chat_service.get_messages_from_db(conv_id), full_ops,
+                setup=lambda i: self.redis_repo.clear_messages(conv_id)),
+            'redis.push_message': BenchmarkCase(lambda i: self.redis_repo.push_message(conv_id, single[i]), self.ops),
+            'redis.push_messages': BenchmarkCase(
+                lambda i: self.redis_repo.push_messages(conv_id, batches[i]), full_ops),
+            'db.push_message': BenchmarkCase(lambda i: self.db_repo.push_message(conv_id, single[i]), self.ops),
+            'db.push_messages': BenchmarkCase(lambda i: self.db_repo.push_messages(conv_id, batches[i]), full_ops),
+        }
+
+    def run(self, sizes: List[int], only: List[str] | None = None) -> List[Dict]:
+        def selected(name: str) -> bool:
+            return not only or any(part in name for part in only)
+
+        users = self._create_users()
+        results = []
+        # Serializing the joining user doesn't depend on the room, so it runs once
+        if selected('create_user_status_message'):
+            results.append(self._measure('create_user_status_message', None, BenchmarkCase(
+                lambda i: create_user_status_message(users[i % len(users)], 'joined'), self.ops
+            )))
+
+        for size in sizes:
+            room = self._seed_room(size, [user.id for user in users])
+            try:
+                for name, case in self.cases(room).items():
+                    if selected(name):
+                        results.append(self._measure(name, size, case))
+            finally:
+                self._clear_room(room)
+        return results
+
+    def metadata(self, redis: str) -> Dict:
+        return {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform(),
+            'database': connection.vendor,
+            'redis': redis,
+            'codec': settings.CHAT_REDIS_CODEC,
+            'ops': self.ops,
+            'repeat': self.repeat,
+            'senders': self.sender_count,
+            'text_length': self.text_length,
+        }
+
+    def _measure(self, name: str, size: int | None, case: BenchmarkCase) -> Dict:
+        timings = []
+        call = 0
+        for _ in range(self.repeat):
+            elapsed = 0.0
+            for _ in range(case.ops):
+                if case.setup is not None:
+                    case.setup(call)
+                started = time.perf_counter()
+                case.op(call)
+                elapsed += time.perf_counter() - started
+                call += 1
+            timings.append(elapsed / case.ops)
+        return {
+            'case': name,
+            'size': size,
+            'ops': case.ops,
+            'best_us': round(min(timings) * 1e6, 2),
+            'median_us': round(statistics.median(timings) * 1e6, 2),
+        }
+
+    def _create_users(self) -> List[MyUser]:
+        users = [
+            MyUser(email=f"bench{i}@example.com", first_name="bench", last_name=f"user{i}")
+            for i in range(self.sender_count)
+        ]
+        # Nobody logs in, so skip the password hashing
+        for user in users:
+            user.set_unusable_password()
+        MyUser.objects.bulk_create(users, ignore_conflicts=True)
+        return list(MyUser.objects.filter(email__in=[user.email for user in users]).order_by('id'))
+
+    def _seed_room(self, size: int, senders: List[int]) -> BenchmarkRoom:
+        conv_id = str(Conversation.objects.create(title=f"benchmark {size}").id)
+        # Old enough that none of it counts towards the per-minute throttle window
+        start = datetime.now(timezone.utc) - timedelta(hours=1, seconds=size)
+        messages = []
+        for i in range(size):
+            timestamp = start + timedelta(seconds=i)
+            messages.append(self._message(senders[i % len(senders)], timestamp))
+            if len(messages) == SEED_CHUNK_SIZE or i == size - 1:
+                self.db_repo.push_messages(conv_id, messages)
+                self.redis_repo.push_messages(conv_id, messages)
+                messages = []
+
+        cursor = (start + timedelta(seconds=size // 2)).isoformat()
+        return BenchmarkRoom(conv_id, size, senders, cursor)
+
+    def _clear_room(self, room: BenchmarkRoom):
+        self.redis_repo.clear_messages(room.conv_id)
+        self.redis_client.delete(*[f'throttle:{room.conv_id}:{user_id}' for user_id in room.senders])
+        Conversation.objects.filter(id=room.conv_id).delete()
+
+    def _message(self, sender: int, timestamp: datetime | None = None) -> Dict:
+        timestamp = timestamp or datetime.now(timezone.utc)
+        return {
+            'id': str(uuid7(timestamp)),
+            'sender': sender,
+            'text': ''.join(random.choices(string.ascii_letters + ' ', k=self.text_length)),
+            'timestamp': timestamp.isoformat(),
+        }
+
+
+# Pairs each result with the same case and size in a baseline run. A case is a
+# regression when its best time grew by more than `threshold` (0.25 = 25% slower).
+def compare_results(results: List[Dict], baseline: List[Dict], threshold: float) -> List[Dict]:
+    previous = {(r['case'], r['size']): r for r in baseline}
+    rows = []
+    for result in results:
+        before = previous.get((result['case'], result['size']))
+        change = result['best_us'] / before['best_us'] - 1 if before and before['best_us'] else None
+        rows.append({
+            **result,
+            'baseline_us': before['best_us'] if before else None,
+            'change': change,
+            'regression': change is not None and change > threshold,
+        })
+    return rows
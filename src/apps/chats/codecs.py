@@ -0,0 +1,53 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Dict
+
+import msgpack
+
+from apps.chats.exceptions import MessageDecodeError
+
+# Every non-JSON format starts with a version byte. Legacy entries are plain JSON
+# objects and always start with '{', so lists written by different codecs during
+# a rollout stay readable.
+MSGPACK_V1_PREFIX = b'\x01'
+
+
+class MessageCodec(ABC):
+    name: str
+
+    @abstractmethod
+    def encode(self, message: Dict) -> str | bytes:
+        pass
+
+
+class JsonMessageCodec(MessageCodec):
+    name = 'json'
+
+    def encode(self, message: Dict) -> str:
+        return json.dumps(message)
+
+
+class MsgpackMessageCodec(MessageCodec):
+    name = 'msgpack'
+
+    def encode(self, message: Dict) -> bytes:
+        return MSGPACK_V1_PREFIX + msgpack.packb(message, use_bin_type=True)
+
+
+CODECS = {codec.name: codec for codec in (JsonMessageCodec, MsgpackMessageCodec)}
+
+
+def get_codec(name: str) -> MessageCodec:
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown message codec '{name}', expected one of {sorted(CODECS)}")
+
+
+def decode_message(raw: str | bytes) -> Dict:
+    try:
+        if isinstance(raw, bytes) and raw[:1] == MSGPACK_V1_PREFIX:
+            return msgpack.unpackb(raw[1:], raw=False)
+        return json.loads(raw)
+    except (ValueError, msgpack.UnpackException) as e:
+        raise MessageDecodeError(e)
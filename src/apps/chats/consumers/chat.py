@@ -1,135 +1,304 @@
 import asyncio
 import json
-from datetime import datetime, timezone
+import time
 
-from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 
-from apps.chats.consumers.config import chat_service
+from apps.chats.consumers.config import async_chat_service
+from apps.chats.consumers.outbound import OutboundQueue, record_slow_disconnect
 from apps.chats.exceptions import ConversationNotFoundError, TooManyMessageException
-from apps.chats.utils import create_user_status_message
+from apps.chats.metrics import CHAT_MESSAGES, WEBSOCKET_CONNECTIONS, WEBSOCKET_CONNECTS, group_joined, group_left
+from apps.chats.tracing import span, traced
+from apps.chats.utils import create_user_status_message, create_group_event, create_user_expired_message, \
+    create_typing_message, create_ack_message, create_cursor, get_query_param_from_scope
 from apps.users.serializers import MyUserSerializer
+from loggers import get_django_logger
+
+logger = get_django_logger()
+
+# Close code for connections dropped because they could not keep up
+SLOW_CONSUMER_CLOSE_CODE = 4008
+# Close code for rooms that don't exist; clients must not reconnect
+NOT_FOUND_CLOSE_CODE = 4404
+# Standard close code for an unexpected server error; clients may retry
+INTERNAL_ERROR_CLOSE_CODE = 1011
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    @traced('chat.connect')
     async def connect(self):
         self.conv_id = self.scope['url_route']['kwargs']['conv_id']
         self.conv_group_name = f'chat_{self.conv_id}'
         self.user_id = self.scope['user'].id
+        self.typing_pending = None
+        self.typing_sent_at = 0.0
+        self.typing_task = None
+        self.outbound = OutboundQueue(settings.CHAT_OUTBOUND_QUEUE_SIZE)
+        self.closing = False
+        self.accepted = False
+        self.writer_task = None
+        self.heartbeat_task = None
 
+        # A close before accept reaches the browser as a failed handshake without its
+        # code, so rejected connections are accepted first and then closed
         try:
             await self.check_conversation_exists()
-        except ConversationNotFoundError as e:
-            await self.close(code=404, reason=str(e))
+        except ConversationNotFoundError:
+            WEBSOCKET_CONNECTS.labels('chat', 'not_found').inc()
+            await self.accept()
+            await self.close(code=NOT_FOUND_CLOSE_CODE)
             return
         except Exception as e:
-            await self.close(code=500, reason=f"Unexpected error: {str(e)}")
+            WEBSOCKET_CONNECTS.labels('chat', 'error').inc()
+            logger.error(f"Error opening conversation {self.conv_id}: {e}")
+            await self.accept()
+            await self.close(code=INTERNAL_ERROR_CLOSE_CODE)
             return
 
         await self.channel_layer.group_add(self.conv_group_name, self.channel_name)
+        group_joined(self.conv_group_name)
         await self.accept()
+        # From here on disconnect undoes the connection, however far connect got
+        self.accepted = True
+        WEBSOCKET_CONNECTS.labels('chat', 'accepted').inc()
+        WEBSOCKET_CONNECTIONS.labels('chat').inc()
+        self.writer_task = asyncio.create_task(self.write_outbound())
 
+        try:
+            # A reconnecting client passes the cursor of the last message it has
+            since = get_query_param_from_scope(self.scope, 'since')
 
-        await self.channel_layer.group_send(
-            self.conv_group_name,
-            create_user_status_message(self.scope['user'], 'joined')
-        )
+            # Only the user's first open connection announces them to the room
+            if await self.add_users():
+                await asyncio.gather(self.send_user_status('joined'), self.send_snapshot(since))
+            else:
+                await self.send_snapshot(since)
+            self.heartbeat_task = asyncio.create_task(self.heartbeat())
+        except Exception as e:
+            # An exception escaping connect would end the consumer without a disconnect
+            logger.error(f"Error joining user {self.user_id} to {self.conv_id}: {e}")
+            await self.close(code=INTERNAL_ERROR_CLOSE_CODE)
 
-        await self.add_users()
-        await self.send_users()
-        await self.send_history()
+    @traced('chat.disconnect')
+    async def disconnect(self, close_code):
+        # Rejected connections were never accepted and hold nothing to clean up
+        if not getattr(self, 'accepted', False):
+            return
+        self.accepted = False
+        for task in (self.heartbeat_task, self.typing_task, self.writer_task):
+            if task is not None:
+                task.cancel()
+        WEBSOCKET_CONNECTIONS.labels('chat').dec()
+        await self.channel_layer.group_discard(self.conv_group_name, self.channel_name)
+        group_left(self.conv_group_name)
+        if await self.remove_user():
+            await self.send_user_status('left')
+        await async_chat_service.cleanup_conversation_if_empty(self.conv_id)
 
+    async def send_user_status(self, status):
+        event = create_group_event('user_status', create_user_status_message(self.scope['user'], status))
+        event['user_id'] = self.user_id
+        await self.channel_layer.group_send(self.conv_group_name, event)
 
-    async def disconnect(self, close_code):
-        if self.conv_group_name:
-            await self.channel_layer.group_send(
-                self.conv_group_name,
-                create_user_status_message(self.scope['user'], 'left')
-            )
-            await self.channel_layer.group_discard(self.conv_group_name, self.channel_name)
-            await self.remove_user()
-            await database_sync_to_async(chat_service.cleanup_conversation_if_empty)(self.conv_id)
+    # Refreshes this connection's presence and sweeps users whose workers stopped
+    # heartbeating, e.g. after a crash that skipped disconnect.
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.CHAT_PRESENCE_HEARTBEAT_INTERVAL)
+            try:
+                expired = await async_chat_service.refresh_active_user(self.conv_id, self.user_id, self.channel_name)
+                for user_id in expired:
+                    event = create_group_event('user_status', create_user_expired_message(user_id))
+                    event['user_id'] = int(user_id)
+                    await self.channel_layer.group_send(self.conv_group_name, event)
+            except Exception:
+                # Logged by the service; presence recovers on the next beat
+                continue
 
+    @traced('chat.receive')
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
+
+            if data.get('action') == 'load_more':
+                await self.send_history_page(data.get('before'))
+                return
+
+            if data.get('action') == 'typing':
+                self.queue_typing(bool(data.get('typing', True)))
+                return
+
             text = data.get('text')
 
             if not text:
-                await self.send(text_data=json.dumps({'error': 'Message text is required'}))
+                await self.push(json.dumps({'error': 'Message text is required'}))
                 return
 
-            chat_service.check_throttling_message(1,10, self.user_id, self.conv_id)
+            per_second, per_minute = async_chat_service.get_throttle_limits(self.conv_id)
+            await async_chat_service.check_throttling_message(per_second, per_minute, self.user_id, self.conv_id)
 
-            sender_id = self.user_id
-            message = {
-                'type': 'message',
-                'sender': sender_id,
-                'text': text,
-                'timestamp': datetime.now(timezone.utc).isoformat(),
-            }
+            # The message itself tells the room the user stopped typing
+            self.typing_pending = None
 
-            await database_sync_to_async(chat_service.send_message)(
+            message = await async_chat_service.send_message(
                 conv_id=self.conv_id,
-                sender_id=sender_id,
+                sender_id=self.user_id,
                 text=text
             )
 
+            CHAT_MESSAGES.labels('sent').inc()
+
+            if data.get('client_id'):
+                await self.push(json.dumps(create_ack_message(data['client_id'], message)))
+
             await self.channel_layer.group_send(
                 self.conv_group_name,
-                {
-                    'type': 'chat_message',
-                    'message': message
-                }
+                create_group_event('chat_message', {'type': 'message', **message})
             )
         except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({'error': 'Invalid JSON format'}))
+            await self.push(json.dumps({'error': 'Invalid JSON format'}))
         except TooManyMessageException as e:
-            await self.send(text_data=json.dumps({'type': 'error_message', 'text': str(e)}))
+            CHAT_MESSAGES.labels('throttled').inc()
+            # Throttled messages are not stored; the client_id tells the sender which one to give up on
+            await self.push(json.dumps({'type': 'error_message', 'text': str(e), 'client_id': data.get('client_id')}))
         except Exception as e:
-            await self.send(text_data=json.dumps({'error': f'Error processing message: {str(e)}'}))
+            CHAT_MESSAGES.labels('failed').inc()
+            await self.push(json.dumps({'error': f'Error processing message: {str(e)}'}))
 
+    # Events without 'text' come from nodes running the previous release during a rollout
+    @traced('chat.chat_message')
     async def chat_message(self, event):
-        message = event['message']
-        await self.send(text_data=json.dumps(message))
+        if 'text' in event:
+            await self.push(event['text'])
+            return
+        await self.push(json.dumps(event['message']))
 
+    # Queued status frames for the same user are merged, only the latest one is sent
+    @traced('chat.user_status')
     async def user_status(self, event):
-        await self.send(text_data=json.dumps({
+        if 'text' in event:
+            await self.push(event['text'], 'status', event.get('user_id'))
+            return
+        await self.push(json.dumps({
             'type': 'user_status',
             'status': event['status'],
             'timestamp': event['timestamp'],
             'user': event['user']
-        }))
+        }), 'status', event['user'].get('id'))
 
-    @database_sync_to_async
-    def check_conversation_exists(self):
-        return chat_service.conversation_exists(self.conv_id)
+    # Typing events are ephemeral: they skip storage and throttling, and are dropped
+    # by receivers once older than their interval, e.g. when the group is backed up.
+    async def typing_status(self, event):
+        if event['user_id'] == self.user_id or event['expires_at'] < time.time():
+            return
+        await self.push(event['text'], 'ephemeral', event['user_id'])
+
+    async def check_conversation_exists(self):
+        return await async_chat_service.conversation_exists(self.conv_id)
 
-    async def send_history(self):
+    # Presence and history are loaded concurrently and sent as one frame, so a joining
+    # client can render the room after a single message. With a cursor the frame is
+    # 'resumed' and holds only the messages after it, to be appended to what the client has.
+    @traced('chat.send_snapshot')
+    async def send_snapshot(self, since: str | None = None):
         try:
-            messages = await database_sync_to_async(chat_service.get_messages_from_redis)(self.conv_id)
-            if not messages:
-                messages = await database_sync_to_async(chat_service.get_messages_from_db)(self.conv_id)
-            await self.send(text_data=json.dumps({'type': 'history', 'messages': messages}))
+            users, users_count, messages, resumed = await async_chat_service.get_snapshot(
+                self.conv_id, users_limit=settings.CHAT_SNAPSHOT_USERS_LIMIT, since=since
+            )
+            with span('json.encode', frame='snapshot'):
+                text = json.dumps({
+                    'type': 'snapshot',
+                    'users': MyUserSerializer(users, many=True).data,
+                    'users_count': users_count,
+                    'messages': messages,
+                    'has_more': not resumed and len(messages) == settings.CHAT_HISTORY_PAGE_SIZE,
+                    'resumed': resumed,
+                    'cursor': create_cursor(messages[-1]) if messages else (since if resumed else None)
+                })
+            await self.push(text)
         except Exception as e:
-            await self.send(text_data=json.dumps({'error': f'Error retrieving history: {str(e)}'}))
+            await self.push(json.dumps({'error': f'Error retrieving snapshot: {str(e)}'}))
+
+    @traced('chat.send_history_page')
+    async def send_history_page(self, before):
+        if not before:
+            await self.push(json.dumps({'error': 'Cursor is required to load more messages'}))
+            return
 
-    async def send_users(self):
         try:
-            users = await database_sync_to_async(chat_service.get_active_users)(self.conv_id)
-            serialized_users = MyUserSerializer(users, many=True).data
-            await self.send(text_data=json.dumps({'type':'user_list','users': serialized_users}))
+            messages = await async_chat_service.get_history(self.conv_id, before)
+            await self.push(json.dumps({
+                'type': 'history_page',
+                'messages': messages,
+                'has_more': len(messages) == settings.CHAT_HISTORY_PAGE_SIZE
+            }))
         except Exception as e:
-            await self.send(text_data=json.dumps({'error': f'Error retrieving users: {str(e)}'}))
+            await self.push(json.dumps({'error': f'Error retrieving history: {str(e)}'}))
 
-    async def add_users(self):
+    async def add_users(self) -> bool:
         try:
-            await database_sync_to_async(chat_service.add_active_user)(self.conv_id, self.user_id)
+            return await async_chat_service.add_active_user(self.conv_id, self.user_id, self.channel_name)
         except Exception as e:
-            await self.send(text_data=json.dumps({'error': f'Error adding users: {str(e)}'}))
+            await self.push(json.dumps({'error': f'Error adding users: {str(e)}'}))
+            return False
 
-    async def remove_user(self):
+    async def remove_user(self) -> bool:
         try:
-            await database_sync_to_async(chat_service.remove_active_user)(self.conv_id, self.user_id)
+            return await async_chat_service.remove_active_user(self.conv_id, self.user_id, self.channel_name)
         except Exception as e:
-            await self.send(text_data=json.dumps({'error': f'Error removing users: {str(e)}'}))
\ No newline at end of file
+            await self.push(json.dumps({'error': f'Error removing users: {str(e)}'}))
+            return False
+
+    # Keystrokes are coalesced per connection: at most one typing broadcast per
+    # CHAT_TYPING_INTERVAL, carrying the latest state seen in that window.
+    def queue_typing(self, typing: bool):
+        self.typing_pending = typing
+        if self.typing_task is None:
+            self.typing_task = asyncio.create_task(self.flush_typing())
+
+    async def flush_typing(self):
+        interval = settings.CHAT_TYPING_INTERVAL
+        delay = self.typing_sent_at + interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        typing, self.typing_pending, self.typing_task = self.typing_pending, None, None
+        if typing is None:
+            return
+
+        self.typing_sent_at = time.monotonic()
+        event = create_group_event('typing_status', create_typing_message(self.user_id, typing))
+        event.update(user_id=self.user_id, expires_at=time.time() + interval)
+        try:
+            await self.channel_layer.group_send(self.conv_group_name, event)
+        except Exception:
+            # Nothing to retry, the next keystroke sends a fresh state
+            pass
+
+    # Every frame after accept goes through the outbound queue, so handlers never
+    # wait on a slow socket and frames keep their order.
+    async def push(self, text: str, kind: str = 'message', key: str | int | None = None):
+        if self.outbound.put(text, kind, key):
+            return
+        if settings.CHAT_OUTBOUND_OVERFLOW != 'disconnect':
+            self.outbound.record_dropped()
+            return
+        await self.close_slow('outbound queue is full')
+
+    async def write_outbound(self):
+        while True:
+            text = await self.outbound.get()
+            try:
+                await asyncio.wait_for(self.send(text_data=text), settings.CHAT_OUTBOUND_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                await self.close_slow('send timed out')
+                return
+
+    async def close_slow(self, reason: str):
+        if self.closing:
+            return
+        self.closing = True
+        record_slow_disconnect()
+        logger.warning(f"Closing slow connection of user {self.user_id} in {self.conv_id}: {reason} {self.outbound.stats()}")
+        await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
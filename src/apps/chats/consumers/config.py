@@ -1,25 +1,105 @@
 import redis
+import redis.asyncio as aioredis
 from django.conf import settings
 from django.contrib.auth import get_user_model
 
+from apps.chats.codecs import get_codec
+from apps.chats.conversation_cache import ConversationCache
+from apps.chats.metrics import DB_WRITE_PENDING
 from apps.chats.models import Conversation
-from apps.chats.repositories import RedisMessageRepo, DatabaseMessageRepo
-from apps.chats.repositories.redis_repo import RedisConsumerRepo
+from apps.chats.repositories import RedisMessageRepo, DatabaseMessageRepo, WriteBehindMessageRepo
+from apps.chats.repositories.async_redis_repo import AsyncRedisMessageRepo, AsyncRedisPresenceRepo, \
+    AsyncRedisRateLimiterRepo
+from apps.chats.repositories.redis_repo import RedisConsumerRepo, RedisRateLimiterRepo, RedisPresenceRepo, \
+    RedisConversationListRepo
+from apps.chats.services.async_chat_services import AsyncChatService
 from apps.chats.services.chat_services import ChatService
+from apps.chats.session_cache import SessionUserCache, set_session_user_cache
 
 MyUser = get_user_model()
 
 redis_client = redis.from_url(
             settings.REDIS_URL,
         )
+# Consumers talk to Redis natively on the event loop through one shared pool
+async_redis_pool = aioredis.ConnectionPool.from_url(settings.REDIS_URL)
+async_redis_client = aioredis.Redis(connection_pool=async_redis_pool)
+
+message_codec = get_codec(settings.CHAT_REDIS_CODEC)
+
+
+def build_redis_repos(client: redis.Redis) -> dict:
+    return {
+        'redis_repo': RedisMessageRepo(client, max_length=settings.CHAT_REDIS_HISTORY_LIMIT, codec=message_codec),
+        'redis_consumer_repo': RedisConsumerRepo(client),
+        'rate_limiter_repo': RedisRateLimiterRepo(client),
+        'presence_repo': RedisPresenceRepo(client, ttl=settings.CHAT_PRESENCE_TTL),
+        'conversation_list_repo': RedisConversationListRepo(client, ttl=settings.CHAT_CONVERSATIONS_CACHE_TTL),
+    }
+
+
+def build_async_redis_repos(client: aioredis.Redis) -> dict:
+    return {
+        'redis_repo': AsyncRedisMessageRepo(client, max_length=settings.CHAT_REDIS_HISTORY_LIMIT, codec=message_codec),
+        'presence_repo': AsyncRedisPresenceRepo(client, ttl=settings.CHAT_PRESENCE_TTL),
+        'rate_limiter_repo': AsyncRedisRateLimiterRepo(client),
+    }
+
+
+def build_conversation_cache(client: redis.Redis) -> ConversationCache:
+    return ConversationCache(
+        max_size=settings.CHAT_CONVERSATION_CACHE_SIZE,
+        ttl=settings.CHAT_CONVERSATION_CACHE_TTL,
+        negative_ttl=settings.CHAT_CONVERSATION_CACHE_NEGATIVE_TTL,
+        redis_client=client
+    )
+
+
+def build_session_user_cache(client: redis.Redis) -> SessionUserCache:
+    return SessionUserCache(
+        max_size=settings.CHAT_SESSION_CACHE_SIZE,
+        ttl=settings.CHAT_SESSION_CACHE_TTL,
+        redis_client=client,
+        redis_ttl=settings.CHAT_SESSION_CACHE_REDIS_TTL,
+        shared=settings.CHAT_SESSION_CACHE_REDIS
+    )
+
+
+if settings.CHAT_DB_WRITE_BEHIND:
+    db_repo = WriteBehindMessageRepo(
+        batch_size=settings.CHAT_DB_WRITE_BATCH_SIZE,
+        flush_interval=settings.CHAT_DB_WRITE_FLUSH_INTERVAL,
+        partitioned=settings.CHAT_MESSAGE_PARTITIONING
+    )
+    db_repo.start()
+    DB_WRITE_PENDING.set_function(lambda: db_repo.pending_count)
+else:
+    db_repo = DatabaseMessageRepo(partitioned=settings.CHAT_MESSAGE_PARTITIONING)
 
-redis_repo = RedisMessageRepo(redis_client)
-redis_consumer_repo = RedisConsumerRepo(redis_client)
-db_repo = DatabaseMessageRepo()
 chat_service = ChatService(
     user_repo=MyUser.objects,
     conversation_repo=Conversation.objects,
-    redis_repo=redis_repo,
     db_repo=db_repo,
-    redis_consumer_repo=redis_consumer_repo
+    conversation_cache=build_conversation_cache(redis_client),
+    **build_redis_repos(redis_client)
 )
+
+async_chat_service = AsyncChatService(
+    chat_service=chat_service,
+    **build_async_redis_repos(async_redis_client)
+)
+
+
+# Moves both services and the session cache onto other Redis clients in place, so
+# modules that imported them keep working. Used by chat_loadtest to run against an
+# in-process Redis.
+def use_redis_clients(client: redis.Redis, async_client: aioredis.Redis):
+    global redis_client, async_redis_client
+    redis_client, async_redis_client = client, async_client
+    for name, repo in build_redis_repos(client).items():
+        setattr(chat_service, name, repo)
+    for name, repo in build_async_redis_repos(async_client).items():
+        setattr(async_chat_service, name, repo)
+    chat_service.conversation_cache.close()
+    chat_service.conversation_cache = build_conversation_cache(client)
+    set_session_user_cache(build_session_user_cache(client))
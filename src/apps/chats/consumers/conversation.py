@@ -1,32 +1,69 @@
 import json
-from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
-from apps.chats.consumers.config import chat_service
+from apps.chats.consumers.config import async_chat_service
+from apps.chats.metrics import WEBSOCKET_CONNECTIONS, WEBSOCKET_CONNECTS, group_joined, group_left
+from apps.chats.tracing import traced
 from apps.chats.utils import create_conversation_status_message
 
 
 class ConversationConsumer(AsyncWebsocketConsumer):
     group_name = "conversations"
 
+    @traced('conversations.connect')
     async def connect(self):
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
+        self.accepted = True
+        group_joined(self.group_name)
+        WEBSOCKET_CONNECTS.labels('conversations', 'accepted').inc()
+        WEBSOCKET_CONNECTIONS.labels('conversations').inc()
         await self.send_conversations()
 
     async def disconnect(self, close_code):
         if self.group_name:
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if getattr(self, 'accepted', False):
+            group_left(self.group_name)
+            WEBSOCKET_CONNECTIONS.labels('conversations').dec()
 
-    async def send_conversations(self, event=None):
+    @traced('conversations.receive')
+    async def receive(self, text_data):
         try:
-            conversations = await database_sync_to_async(chat_service.get_all_conversations)()
-            await self.send(text_data=json.dumps({'conversations': conversations}))
+            data = json.loads(text_data)
+            action = data.get('action')
+
+            if action == 'load_more':
+                await self.send_conversations(int(data.get('offset', 0)), 'conversations_page')
+            elif action == 'sync':
+                await self.send_conversation_changes(int(data.get('since', 0)))
+        except (json.JSONDecodeError, TypeError, ValueError):
+            await self.send(text_data=json.dumps({'error': 'Invalid request'}))
+
+    async def send_conversations(self, offset: int = 0, frame_type: str = 'conversations'):
+        try:
+            page = await async_chat_service.get_conversations_page(offset)
+            await self.send(text_data=json.dumps({'type': frame_type, **page}))
+        except Exception as e:
+            await self.send(text_data=json.dumps({'error': f'Error retrieving conversations: {str(e)}'}))
+
+    # Clients that fell behind the change log get the first page again instead
+    async def send_conversation_changes(self, since: int):
+        try:
+            changes = await async_chat_service.get_conversation_changes(since)
+            if changes is None:
+                await self.send_conversations()
+                return
+            await self.send(text_data=json.dumps({'type': 'conversation_changes', **changes}))
         except Exception as e:
             await self.send(text_data=json.dumps({'error': f'Error retrieving conversations: {str(e)}'}))
 
     async def add_conversation(self, event):
-        await self.send(text_data=json.dumps(create_conversation_status_message(event['id'], 'joined')))
+        await self.send(text_data=json.dumps(
+            create_conversation_status_message(event['id'], 'joined', event.get('name'), event.get('version'))
+        ))
 
     async def remove_conversation(self, event):
-        await self.send(text_data=json.dumps(create_conversation_status_message(event['id'], 'left')))
\ No newline at end of file
+        await self.send(text_data=json.dumps(
+            create_conversation_status_message(event['id'], 'left', version=event.get('version'))
+        ))
@@ -0,0 +1,113 @@
+import asyncio
+import weakref
+from collections import deque
+from typing import Dict, Literal
+
+from apps.chats.metrics import Counter, Gauge
+
+FrameKind = Literal['message', 'status', 'ephemeral']
+
+# Process-wide counters, read through outbound_stats()
+_live_queues: 'weakref.WeakSet[OutboundQueue]' = weakref.WeakSet()
+_totals = {'dropped': 0, 'merged': 0, 'overflows': 0, 'slow_disconnects': 0}
+
+
+def outbound_stats() -> Dict:
+    depths = [len(queue) for queue in list(_live_queues)]
+    return {
+        'connections': len(depths),
+        'queued': sum(depths),
+        'max_depth': max(depths, default=0),
+        **_totals,
+    }
+
+
+def record_slow_disconnect():
+    _totals['slow_disconnects'] += 1
+
+
+# Exported on the metrics endpoint, read from the same counters at scrape time
+for _name, _kind, _help in (
+    ('queued', Gauge, "Frames waiting in outbound queues"),
+    ('max_depth', Gauge, "Deepest outbound queue in this process"),
+    ('dropped', Counter, "Outbound frames dropped because a queue was full"),
+    ('merged', Counter, "Outbound status frames merged into a queued frame for the same user"),
+    ('overflows', Counter, "Chat messages that did not fit in an outbound queue"),
+    ('slow_disconnects', Counter, "Connections closed for not keeping up with their outbound queue"),
+):
+    _metric_name = f'chat_outbound_{_name}' + ('_total' if _kind is Counter else '')
+    _kind(_metric_name, _help).set_function(lambda name=_name: outbound_stats()[name])
+
+
+# Bounded per-connection send buffer. Group handlers put frames here and return at
+# once; a writer task drains it to the socket, so a slow client only backs up its
+# own queue. When the queue is full, ephemeral frames are dropped first. Status and
+# ephemeral frames with a key replace an older queued frame with the same key
+# instead of taking another slot. Messages are never dropped silently: put()
+# reports the overflow and the consumer applies its policy.
+class OutboundQueue:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._frames: deque[list] = deque()
+        self._keyed: Dict[tuple, list] = {}
+        self._ready = asyncio.Event()
+
+        self.dropped = 0
+        self.merged = 0
+        _live_queues.add(self)
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def stats(self) -> Dict:
+        return {'depth': len(self._frames), 'dropped': self.dropped, 'merged': self.merged}
+
+    def put(self, text: str, kind: FrameKind = 'message', key: str | int | None = None) -> bool:
+        if key is not None and kind != 'message':
+            entry = self._keyed.get((kind, key))
+            if entry is not None:
+                entry[2] = text
+                self._count('merged')
+                return True
+
+        if len(self._frames) >= self.max_size and not self._drop_ephemeral():
+            # Losing a typing frame is harmless; anything else is an overflow, and only
+            # counts as dropped if the consumer's policy drops it (record_dropped)
+            if kind == 'ephemeral':
+                self._count('dropped')
+                return True
+            _totals['overflows'] += 1
+            return False
+
+        entry = [kind, key, text]
+        self._frames.append(entry)
+        if key is not None and kind != 'message':
+            self._keyed[(kind, key)] = entry
+        self._ready.set()
+        return True
+
+    async def get(self) -> str:
+        while not self._frames:
+            self._ready.clear()
+            await self._ready.wait()
+        kind, key, text = self._frames.popleft()
+        if key is not None:
+            self._keyed.pop((kind, key), None)
+        return text
+
+    def record_dropped(self):
+        self._count('dropped')
+
+    def _drop_ephemeral(self) -> bool:
+        for i, (kind, key, _) in enumerate(self._frames):
+            if kind == 'ephemeral':
+                del self._frames[i]
+                if key is not None:
+                    self._keyed.pop((kind, key), None)
+                self._count('dropped')
+                return True
+        return False
+
+    def _count(self, counter: str):
+        setattr(self, counter, getattr(self, counter) + 1)
+        _totals[counter] += 1
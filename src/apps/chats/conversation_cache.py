@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple
+
+import redis
+
+from apps.chats.invalidation import InvalidationChannel
+from loggers import get_redis_logger
+
+logger = get_redis_logger()
+
+INVALIDATION_CHANNEL = 'conversation:invalidate'
+
+
+class CachedConversation(NamedTuple):
+    exists: bool
+    title: str | None = None
+
+
+# Per-process existence cache for conversations, consulted by the chat page and the
+# chat consumer before touching the database. Creating or deleting a room publishes
+# its id on INVALIDATION_CHANNEL and every process drops its entry, whether or not it
+# has a conversation list socket open. Misses are still cached for a shorter time.
+class ConversationCache:
+    def __init__(self, max_size: int = 10000, ttl: float = 60, negative_ttl: float = 5,
+                 redis_client: redis.Redis | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[str, tuple[float, CachedConversation]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.invalidations = InvalidationChannel(redis_client, INVALIDATION_CHANNEL, self._drop, self.clear)
+        # Bumped by every invalidation; a lookup started before one doesn't store its result
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def get(self, conv_id: str) -> CachedConversation | None:
+        with self._lock:
+            entry = self._entries.get(conv_id)
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(conv_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conv_id)
+            self.hits += 1
+            return entry[1]
+
+    # Subscribes if needed and returns the generation to pass to set_found/set_missing,
+    # so it has to be called before the conversation is read from the database
+    def start_lookup(self) -> int:
+        self.invalidations.subscribe()
+        return self.generation
+
+    def set_found(self, conv_id: str, title: str | None, generation: int | None = None):
+        self._store(conv_id, CachedConversation(True, title), self.ttl, generation)
+
+    def set_missing(self, conv_id: str, generation: int | None = None):
+        self._store(conv_id, CachedConversation(False), self.negative_ttl, generation)
+
+    def invalidate(self, conv_id: str):
+        self._drop(conv_id)
+        try:
+            self.invalidations.publish(conv_id)
+        except redis.RedisError as e:
+            logger.error(f"Error publishing conversation cache invalidation: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def close(self):
+        self.invalidations.close()
+        self.clear()
+
+    def _drop(self, conv_id: str):
+        with self._lock:
+            self._entries.pop(conv_id, None)
+            self.generation += 1
+
+    def _store(self, conv_id: str, entry: CachedConversation, ttl: float, generation: int | None = None):
+        if not self.invalidations.subscribe():
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[conv_id] = (time.monotonic() + ttl, entry)
+            self._entries.move_to_end(conv_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
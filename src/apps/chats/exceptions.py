@@ -14,4 +14,10 @@ class ConversationAccessDeniedError(Exception):
     pass
 
 class TooManyMessageException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class MessageDecodeError(ValueError):
+    pass
+
+class ProfileInProgressError(Exception):
+    pass
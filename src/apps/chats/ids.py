@@ -0,0 +1,44 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# Time-ordered UUIDs (version 7, RFC 9562): 48 bits of Unix milliseconds, then a
+# 12-bit counter and 62 random bits. Ids created in this process are strictly
+# increasing, so new message rows land at the right edge of the primary key index.
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+COUNTER_MAX = 0xFFF
+MAX_DRIFT_MS = 1000
+RANDOM_BITS = (1 << 62) - 1
+
+
+def uuid7(dt: datetime | None = None) -> uuid.UUID:
+    global _last_ms, _counter
+    ms = int((dt.timestamp() if dt is not None else time.time()) * 1000)
+
+    with _lock:
+        if ms > _last_ms:
+            _last_ms = ms
+            # Start low in the counter space so a burst in one millisecond rarely overflows
+            _counter = int.from_bytes(os.urandom(2), 'big') & (COUNTER_MAX >> 1)
+            counter = _counter
+        elif _last_ms - ms <= MAX_DRIFT_MS:
+            # Same millisecond, a counter overflow or a small clock step back: keep counting
+            _counter += 1
+            if _counter > COUNTER_MAX:
+                _last_ms += 1
+                _counter = 0
+            ms, counter = _last_ms, _counter
+        else:
+            # An explicit older time, e.g. a backfill: keep it, ordering within it is random
+            counter = int.from_bytes(os.urandom(2), 'big') & COUNTER_MAX
+
+    return _build(ms, counter, int.from_bytes(os.urandom(8), 'big') & RANDOM_BITS)
+
+
+def _build(ms: int, counter: int, random_bits: int) -> uuid.UUID:
+    return uuid.UUID(int=(ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | random_bits)
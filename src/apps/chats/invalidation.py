@@ -0,0 +1,87 @@
+import threading
+import time
+from typing import Callable
+
+import redis
+
+from loggers import get_redis_logger
+
+logger = get_redis_logger()
+
+
+# Carries cache invalidations between processes over Redis pub/sub. Each process
+# subscribes once, from a listener thread, and hands every message to `on_message`.
+# Messages published while a process isn't subscribed are lost, so a cache must not
+# keep local entries until subscribe() succeeds, and `on_reset` is called to drop all
+# of them whenever the subscription fails or reconnects. Without a Redis client
+# nothing is published and the cache is local to its process. After a failed attempt
+# subscribe() returns False right away until the retry delay has passed, doubling up
+# to `max_retry_delay`, so lookups don't each pay a connection attempt while Redis is down.
+class InvalidationChannel:
+    def __init__(self, redis_client: redis.Redis | None, channel: str,
+                 on_message: Callable[[str], None], on_reset: Callable[[], None],
+                 retry_delay: float = 1, max_retry_delay: float = 30):
+        self.redis = redis_client
+        self.channel = channel
+        self.on_message = on_message
+        self.on_reset = on_reset
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._listener = None
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def publish(self, message: str):
+        if self.redis is not None:
+            self.redis.publish(self.channel, message)
+
+    # True once invalidations from other processes are being received
+    def subscribe(self) -> bool:
+        if self.redis is None or self._listener is not None:
+            return True
+        if time.monotonic() < self._retry_at:
+            return False
+        # Callers don't queue behind an attempt that is already under way
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self._listener is None:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                try:
+                    pubsub.subscribe(**{self.channel: self._on_message})
+                    pubsub.connection.register_connect_callback(self._on_reconnect)
+                    self._listener = pubsub.run_in_thread(
+                        sleep_time=1, daemon=True, exception_handler=self._on_error
+                    )
+                except redis.RedisError as e:
+                    pubsub.close()
+                    delay = min(self.retry_delay * 2 ** self._failures, self.max_retry_delay)
+                    self._failures += 1
+                    self._retry_at = time.monotonic() + delay
+                    logger.error(f"Error subscribing to {self.channel}, retrying in {delay:g}s: {e}")
+                    return False
+                self._failures = 0
+            return True
+        finally:
+            self._lock.release()
+
+    def close(self):
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+
+    def _on_message(self, message: dict):
+        self.on_message(message['data'].decode('utf-8'))
+
+    def _on_reconnect(self, connection):
+        self.on_reset()
+
+    def _on_error(self, error: Exception, pubsub, thread):
+        logger.error(f"{self.channel} subscription interrupted, dropping local entries: {error}")
+        thread.stop()
+        with self._lock:
+            if self._listener is thread:
+                self._listener = None
+        self.on_reset()
@@ -0,0 +1,102 @@
+import json
+
+import redis
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+from apps.chats.benchmarks import BenchmarkSuite, compare_results
+
+
+class Command(BaseCommand):
+    help = ("Time the message repositories and ChatService hot paths at several room sizes. Runs on a throwaway "
+            "database with an in-process Redis unless --redis-url is given. Results can be saved as JSON and "
+            "compared against an earlier run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                            help="Messages per room")
+        parser.add_argument('--ops', type=int, default=200,
+                            help="Operations per run; whole-room cases run fewer in large rooms")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per case, best and median are reported")
+        parser.add_argument('--senders', type=int, default=20, help="Users the room's messages are spread over")
+        parser.add_argument('--text-length', type=int, default=80, help="Message text length")
+        parser.add_argument('--cases', nargs='+', default=None,
+                            help="Only run cases whose name contains one of these, e.g. redis. throttling")
+        parser.add_argument('--output', default=None, help="Write the results to this JSON file")
+        parser.add_argument('--compare', default=None, help="JSON file from an earlier run to compare against")
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help="Fail when a case's best time grew by more than this fraction")
+        parser.add_argument('--redis-url', default=None,
+                            help="Use this Redis server instead of an in-process fake (writes temporary keys)")
+
+    def handle(self, *args, **options):
+        baseline = self._load_baseline(options['compare']) if options['compare'] else None
+        client = self._redis_client(options['redis_url'])
+
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            suite = BenchmarkSuite(
+                client, ops=options['ops'], repeat=options['repeat'],
+                senders=options['senders'], text_length=options['text_length']
+            )
+            results = suite.run(options['sizes'], options['cases'])
+            report = {'meta': suite.metadata(options['redis_url'] or 'fakeredis'), 'results': results}
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        rows = compare_results(results, baseline['results'], options['threshold']) if baseline else results
+        self._report(rows, report['meta'], baseline is not None)
+        if options['output']:
+            self.stdout.write(f"Results written to {options['output']}")
+
+        regressions = [r for r in rows if r.get('regression')]
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} case(s) slower than the baseline by more than {options['threshold']:.0%}: "
+                + ', '.join(f"{r['case']}[{r['size']}]" for r in regressions)
+            )
+
+    @staticmethod
+    def _redis_client(url: str | None) -> redis.Redis:
+        if url:
+            return redis.from_url(url)
+        try:
+            import fakeredis
+        except ImportError:
+            raise CommandError("fakeredis[lua] is needed for the in-process Redis; install it or pass --redis-url")
+        return fakeredis.FakeRedis()
+
+    @staticmethod
+    def _load_baseline(path: str) -> dict:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read baseline {path}: {e}")
+
+    def _report(self, rows: list[dict], meta: dict, compared: bool):
+        self.stdout.write(
+            f"{meta['database']} database, {meta['redis']} Redis, {meta['codec']} codec, "
+            f"best and median of {meta['repeat']} runs"
+        )
+        header = f"{'case':<40}{'size':>8}{'ops':>6}{'best us/op':>13}{'median us/op':>14}"
+        if compared:
+            header += f"{'baseline':>13}{'change':>9}"
+        self.stdout.write(header)
+
+        for row in rows:
+            line = (
+                f"{row['case']:<40}{row['size'] if row['size'] is not None else '-':>8}{row['ops']:>6}"
+                f"{row['best_us']:>13.1f}{row['median_us']:>14.1f}"
+            )
+            if compared:
+                baseline = f"{row['baseline_us']:.1f}" if row['baseline_us'] is not None else '-'
+                change = f"{row['change']:+.0%}" if row['change'] is not None else '-'
+                line += f"{baseline:>13}{change:>9}"
+                if row['regression']:
+                    line = self.style.ERROR(line)
+            self.stdout.write(line)
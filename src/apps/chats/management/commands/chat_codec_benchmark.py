@@ -0,0 +1,87 @@
+import random
+import string
+import time
+from datetime import datetime, timedelta, timezone
+
+import redis
+from django.core.management.base import BaseCommand
+
+from apps.chats.codecs import CODECS, decode_message
+from apps.chats.ids import uuid7
+
+
+class Command(BaseCommand):
+    help = "Compare encode/decode time and Redis memory per message for each message codec"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000, help="Number of messages per run")
+        parser.add_argument('--text-length', type=int, default=80, help="Average message text length")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per codec, the best one is reported")
+        parser.add_argument('--redis-url', default=None,
+                            help="Also measure MEMORY USAGE on this Redis server (writes a temporary key)")
+
+    def handle(self, *args, **options):
+        messages = self._build_messages(options['messages'], options['text_length'])
+        client = redis.from_url(options['redis_url']) if options['redis_url'] else None
+
+        self.stdout.write(
+            f"{len(messages)} messages, ~{options['text_length']} chars of text, best of {options['repeat']} runs"
+        )
+        self.stdout.write(f"{'codec':<10}{'encode us/msg':>15}{'decode us/msg':>15}{'bytes/msg':>12}{'redis bytes/msg':>18}")
+
+        for name, codec_cls in CODECS.items():
+            codec = codec_cls()
+            # Redis hands values back as bytes, so decode from what it would return.
+            payloads = [self._as_bytes(codec.encode(m)) for m in messages]
+
+            encode_time = self._best_of(options['repeat'], lambda: [codec.encode(m) for m in messages])
+            decode_time = self._best_of(options['repeat'], lambda: [decode_message(p) for p in payloads])
+            payload_size = sum(len(p) for p in payloads) / len(payloads)
+            redis_size = f"{self._redis_memory(client, name, payloads):.1f}" if client else '-'
+
+            self.stdout.write(
+                f"{name:<10}"
+                f"{encode_time / len(messages) * 1e6:>15.2f}"
+                f"{decode_time / len(messages) * 1e6:>15.2f}"
+                f"{payload_size:>12.1f}"
+                f"{redis_size:>18}"
+            )
+
+    @staticmethod
+    def _build_messages(count: int, text_length: int) -> list[dict]:
+        start = datetime.now(timezone.utc)
+        alphabet = string.ascii_letters + '      '
+        return [
+            {
+                'id': str(uuid7(start + timedelta(milliseconds=i * 250))),
+                'sender': random.randint(1, 5000),
+                'text': ''.join(random.choices(alphabet, k=max(1, int(random.gauss(text_length, text_length / 4))))),
+                'timestamp': (start + timedelta(milliseconds=i * 250)).isoformat(),
+            } for i in range(count)
+        ]
+
+    @staticmethod
+    def _as_bytes(payload: str | bytes) -> bytes:
+        return payload.encode('utf-8') if isinstance(payload, str) else payload
+
+    @staticmethod
+    def _best_of(repeat: int, func) -> float:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    @staticmethod
+    def _redis_memory(client: redis.Redis, name: str, payloads: list[bytes]) -> float:
+        key = f"chat:codec-benchmark:{name}"
+        client.delete(key)
+        try:
+            pipe = client.pipeline(transaction=False)
+            for start in range(0, len(payloads), 1000):
+                pipe.rpush(key, *payloads[start:start + 1000])
+            pipe.execute()
+            return client.memory_usage(key, samples=0) / len(payloads)
+        finally:
+            client.delete(key)
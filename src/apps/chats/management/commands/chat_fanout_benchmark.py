@@ -0,0 +1,66 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+
+from apps.chats.consumers import ChatConsumer
+from apps.chats.consumers.outbound import OutboundQueue
+from apps.chats.utils import create_group_event
+
+
+class Command(BaseCommand):
+    help = "Compare per-message CPU of broadcasting to a group with per-recipient vs. one-time frame encoding"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group-sizes', type=int, nargs='+', default=[10, 100, 500, 2000],
+                            help="Recipient connections per broadcast")
+        parser.add_argument('--messages', type=int, default=200, help="Broadcasts per group size")
+        parser.add_argument('--text-length', type=int, default=80, help="Message text length")
+
+    def handle(self, *args, **options):
+        message = {
+            'type': 'message',
+            'sender': 1,
+            'text': 'x' * options['text_length'],
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+        # What group_send delivered before: the frame as a dict, encoded by each recipient
+        legacy_event = {'type': 'chat_message', 'message': message}
+
+        self.stdout.write(f"{options['messages']} broadcasts per group size, {options['text_length']} chars of text")
+        self.stdout.write(f"{'recipients':>10}{'before us/msg':>16}{'after us/msg':>16}{'speedup':>10}")
+
+        for size in options['group_sizes']:
+            before = asyncio.run(self._broadcast(size, options['messages'], lambda: legacy_event))
+            after = asyncio.run(self._broadcast(
+                size, options['messages'], lambda: create_group_event('chat_message', message)
+            ))
+            self.stdout.write(
+                f"{size:>10}"
+                f"{before / options['messages'] * 1e6:>16.1f}"
+                f"{after / options['messages'] * 1e6:>16.1f}"
+                f"{before / after:>9.1f}x"
+            )
+
+    @staticmethod
+    def _consumer(queue_size: int) -> ChatConsumer:
+        async def discard(message):
+            pass
+
+        consumer = ChatConsumer()
+        consumer.base_send = discard
+        # Handlers only enqueue; the queue holds the whole run so nothing is dropped
+        consumer.outbound = OutboundQueue(queue_size)
+        return consumer
+
+    @classmethod
+    async def _broadcast(cls, size: int, messages: int, build_event) -> float:
+        # Times the sender building the event plus every recipient's handler
+        consumers = [cls._consumer(messages) for _ in range(size)]
+        started = time.perf_counter()
+        for _ in range(messages):
+            event = build_event()
+            for consumer in consumers:
+                await consumer.chat_message(event)
+        return time.perf_counter() - started
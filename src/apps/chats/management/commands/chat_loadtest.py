@@ -0,0 +1,193 @@
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+import redis
+import redis.asyncio as aioredis
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from apps.chats.models import Conversation
+
+MyUser = get_user_model()
+
+# Every sent text starts with this marker, followed by the sender's perf_counter
+# reading, so a receiver in the same process can time the delivery.
+MARKER = 'loadtest'
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = ("Drive core.asgi.application with simulated WebSocket clients and report connect latency, "
+            "delivery latency and throughput. Runs in one process on a throwaway database and the in-memory "
+            "channel layer, with an in-process Redis unless --redis-url is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10, help="Conversations to create")
+        parser.add_argument('--users-per-room', type=int, default=10, help="Connected clients per conversation")
+        parser.add_argument('--rate', type=float, default=0.5, help="Messages per second sent by each client")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds of sending after everyone connected")
+        parser.add_argument('--text-length', type=int, default=80, help="Message text length")
+        parser.add_argument('--redis-url', default=None,
+                            help="Use this Redis server instead of an in-process fake (its chat keys are written to)")
+        parser.add_argument('--throttle', action='store_true',
+                            help="Keep the configured rate limits instead of lifting them for the run")
+
+    def handle(self, *args, **options):
+        sync_client, async_client = self._redis_clients(options['redis_url'])
+        overrides = {
+            'CHANNEL_LAYERS': {'default': {
+                'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                'CONFIG': {'capacity': 10000},
+            }},
+        }
+        if not options['throttle']:
+            overrides['CHAT_THROTTLE_LIMITS'] = (10 ** 6, 10 ** 6)
+
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            with override_settings(**overrides):
+                from apps.chats.consumers import config
+                config.use_redis_clients(sync_client, async_client)
+
+                rooms = self._create_rooms(options['rooms'], options['users_per_room'])
+                results = asyncio.run(self._run(rooms, options))
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        self._report(results, options)
+
+    @staticmethod
+    def _redis_clients(url: str | None) -> tuple[redis.Redis, aioredis.Redis]:
+        if url:
+            return redis.from_url(url), aioredis.from_url(url)
+        try:
+            import fakeredis
+        except ImportError:
+            raise CommandError("fakeredis[lua] is needed for the in-process Redis; install it or pass --redis-url")
+
+        server = fakeredis.FakeServer()
+        return fakeredis.FakeRedis(server=server), fakeredis.FakeAsyncRedis(server=server)
+
+    @staticmethod
+    def _create_rooms(rooms: int, users_per_room: int) -> list[tuple[str, list[str]]]:
+        created = []
+        for room in range(rooms):
+            conversation = Conversation.objects.create(title=f"load{room}")
+            # Clients log in through sessions only, so skip the password hashing
+            users = [
+                MyUser(email=f"load{room}.{i}@example.com", first_name=f"load{room}", last_name=f"user{i}")
+                for i in range(users_per_room)
+            ]
+            for user in users:
+                user.set_unusable_password()
+            sessions = []
+            for user in MyUser.objects.bulk_create(users):
+                session = SessionStore()
+                session['_auth_user_id'] = str(user.pk)
+                session.create()
+                sessions.append(session.session_key)
+            created.append((str(conversation.id), sessions))
+        return created
+
+    async def _run(self, rooms: list[tuple[str, list[str]]], options) -> dict:
+        from channels.testing import WebsocketCommunicator
+        from core.asgi import application
+        from apps.chats.consumers.outbound import outbound_stats
+
+        stats = {'connect': [], 'delivery': [], 'frames': Counter(), 'sent': 0, 'failed_connects': 0}
+        padding = 'x' * max(0, options['text_length'] - 32)
+
+        async def connect(conv_id: str, session_key: str):
+            communicator = WebsocketCommunicator(
+                application, f"/ws/chat/{conv_id}/", headers=[(b'cookie', f'sessionid={session_key}'.encode())]
+            )
+            started = time.perf_counter()
+            connected, _ = await communicator.connect(timeout=30)
+            if not connected:
+                stats['failed_connects'] += 1
+                return None
+            # Connected means accepted and the snapshot is on its way; wait for it
+            frame = json.loads(await communicator.receive_from(timeout=30))
+            stats['frames'][frame.get('type', 'error')] += 1
+            stats['connect'].append(time.perf_counter() - started)
+            return communicator
+
+        async def receive(communicator):
+            while True:
+                frame = json.loads(await communicator.receive_from(timeout=3600))
+                stats['frames'][frame.get('type', 'error')] += 1
+                text = frame.get('text') or ''
+                if frame.get('type') == 'message' and text.startswith(MARKER):
+                    stats['delivery'].append(time.perf_counter() - float(text.split(':')[1]))
+
+        async def send(communicator, deadline: float):
+            # Random start and exponential gaps so clients don't send in lockstep
+            while True:
+                await asyncio.sleep(random.expovariate(options['rate']))
+                if time.perf_counter() >= deadline:
+                    return
+                await communicator.send_to(text_data=json.dumps({'text': f"{MARKER}:{time.perf_counter()}:{padding}"}))
+                stats['sent'] += 1
+
+        communicators = [
+            c for c in await asyncio.gather(*(connect(conv_id, key) for conv_id, keys in rooms for key in keys))
+            if c is not None
+        ]
+        receivers = [asyncio.create_task(receive(c)) for c in communicators]
+
+        started = time.perf_counter()
+        if options['rate'] > 0:
+            deadline = started + options['duration']
+            await asyncio.gather(*(send(c, deadline) for c in communicators))
+        # Let in-flight deliveries land before stopping the clock
+        await asyncio.sleep(1)
+        elapsed = time.perf_counter() - started
+
+        queues = outbound_stats()
+        for task in receivers:
+            task.cancel()
+        await asyncio.gather(*receivers, return_exceptions=True)
+        await asyncio.gather(*(c.disconnect(timeout=30) for c in communicators), return_exceptions=True)
+
+        stats.update(elapsed=elapsed, connected=len(communicators), outbound=queues)
+        return stats
+
+    def _report(self, stats: dict, options):
+        expected = stats['sent'] * (options['users_per_room'])
+        delivered = len(stats['delivery'])
+        self.stdout.write(
+            f"{options['rooms']} rooms x {options['users_per_room']} users, "
+            f"{options['rate']} msg/s per user for {options['duration']}s"
+        )
+        self.stdout.write(f"connected      {stats['connected']} ({stats['failed_connects']} failed)")
+        self.stdout.write(f"{'':<15}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name in ('connect', 'delivery'):
+            values = stats[name]
+            self.stdout.write(
+                f"{name:<15}"
+                + ''.join(f"{percentile(values, p) * 1000:>10.1f}" for p in (50, 95, 99))
+                + f"{max(values, default=0) * 1000:>10.1f}"
+            )
+        self.stdout.write(f"sent           {stats['sent']} ({stats['sent'] / stats['elapsed']:.1f}/s)")
+        self.stdout.write(
+            f"delivered      {delivered} of {expected} ({delivered / stats['elapsed']:.1f}/s)"
+        )
+        other = {k: v for k, v in stats['frames'].items() if k not in ('message', 'snapshot')}
+        if other:
+            self.stdout.write(f"other frames   {dict(other)}")
+        outbound = stats['outbound']
+        self.stdout.write(
+            f"outbound       max depth {outbound['max_depth']}, dropped {outbound['dropped']}, "
+            f"slow disconnects {outbound['slow_disconnects']}"
+        )
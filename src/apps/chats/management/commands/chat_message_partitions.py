@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.chats import partitions
+
+
+class Command(BaseCommand):
+    help = "Manage monthly Postgres partitions of the message table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['enable', 'maintain'],
+                            help="'enable' converts the table once, 'maintain' is meant to run from cron")
+        parser.add_argument('--months-ahead', type=int, default=settings.CHAT_MESSAGE_PARTITION_MONTHS_AHEAD,
+                            help="Future monthly partitions to keep created")
+        parser.add_argument('--retention-months', type=int, default=settings.CHAT_MESSAGE_RETENTION_MONTHS,
+                            help="Detach partitions older than this many months (0 keeps everything)")
+        parser.add_argument('--drop', action='store_true', help="Drop expired partitions instead of only detaching them")
+        parser.add_argument('--dry-run', action='store_true', help="Only print what would change")
+
+    def handle(self, *args, **options):
+        if not partitions.is_postgres():
+            raise CommandError("Message partitioning requires PostgreSQL")
+
+        now = datetime.now(timezone.utc)
+        if options['action'] == 'enable':
+            self.enable(now, options)
+        else:
+            self.maintain(now, options)
+
+    def enable(self, now, options):
+        if partitions.is_partitioned():
+            self.stdout.write("Message table is already partitioned")
+            return
+        if options['dry_run']:
+            self.stdout.write("Would convert the message table to monthly partitions")
+            return
+
+        copied = partitions.enable_partitioning(now, options['months_ahead'])
+        self.stdout.write(self.style.SUCCESS(f"Message table partitioned, {copied} rows copied"))
+
+    def maintain(self, now, options):
+        if not partitions.is_partitioned():
+            raise CommandError("Message table is not partitioned, run 'enable' first")
+
+        existing = partitions.list_partitions()
+        if partitions.default_partition_name() not in existing:
+            # Tables partitioned before the default partition existed
+            if not options['dry_run']:
+                partitions.create_default_partition()
+            self.stdout.write(f"Created partition {partitions.default_partition_name()}")
+            stranded = []
+        else:
+            stranded = partitions.default_partition_months()
+
+        for month in stranded:
+            self.stderr.write(self.style.WARNING(
+                f"Rows for {month:%Y-%m} are in the default partition, moving them to {partitions.partition_name(month)}"
+            ))
+
+        upcoming = partitions.months_between(now, partitions.month_start(now, options['months_ahead']))
+        for month in sorted(set(upcoming) | set(stranded)):
+            name = partitions.partition_name(month)
+            if name in existing:
+                continue
+            if not options['dry_run']:
+                partitions.create_partition(month)
+            self.stdout.write(f"Created partition {name}")
+
+        if options['retention_months'] <= 0:
+            return
+
+        existing = partitions.list_partitions()
+
+        action = "Dropped" if options['drop'] else "Detached"
+        for name in partitions.expired_partitions(existing, now, options['retention_months']):
+            if not options['dry_run']:
+                partitions.detach_partition(name, drop=options['drop'])
+            self.stdout.write(f"{action} partition {name}")
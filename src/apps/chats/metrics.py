@@ -0,0 +1,290 @@
+import asyncio
+import functools
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from apps.chats.tracing import span
+
+# Prometheus text exposition format, version 0.0.4
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, 'Metric'] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: 'Metric'):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+# The process-wide registry served by the metrics view. Values are per process:
+# scrape every worker, Prometheus sums them with its own aggregations.
+registry = Registry()
+
+
+class _Bound:
+    def __init__(self, metric: 'Metric', key: Tuple[str, ...]):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1):
+        self._metric._add(self._key, amount)
+
+    def dec(self, amount: float = 1):
+        self._metric._add(self._key, -amount)
+
+    def set(self, value: float):
+        self._metric._set(self._key, value)
+
+    def observe(self, value: float):
+        self._metric._observe(self._key, value)
+
+
+# Metrics are updated from the event loop and from sync_to_async worker threads,
+# so every update takes the metric's lock.
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 registry: Registry | None = registry):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._function: Callable[[], float] | None = None
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values) -> _Bound:
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        return _Bound(self, tuple(str(value) for value in values))
+
+    # The value is read from `function` at scrape time instead of being updated in place
+    def set_function(self, function: Callable[[], float]):
+        if self.labelnames:
+            raise ValueError(f"{self.name} has labels and can't be read from a function")
+        self._function = function
+
+    def value(self, *labels) -> float:
+        if self._function is not None:
+            return self._function()
+        with self._lock:
+            return self._values.get(tuple(str(label) for label in labels), 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            return [f'{self.name} {_format_value(self._function())}']
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values]
+
+    def _add(self, key: Tuple[str, ...], amount: float):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _set(self, key: Tuple[str, ...], value: float):
+        raise TypeError(f"{self.kind} {self.name} can't be set")
+
+    def _observe(self, key: Tuple[str, ...], value: float):
+        raise TypeError(f"{self.kind} {self.name} doesn't take observations")
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1):
+        self._add((), amount)
+
+    def _add(self, key: Tuple[str, ...], amount: float):
+        if amount < 0:
+            raise ValueError(f"Counter {self.name} can only increase")
+        super()._add(key, amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount: float = 1):
+        self._add((), amount)
+
+    def dec(self, amount: float = 1):
+        self._add((), -amount)
+
+    def set(self, value: float):
+        self._set((), value)
+
+    def _set(self, key: Tuple[str, ...], value: float):
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS, registry: Registry | None = registry):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float):
+        self._observe((), value)
+
+    def value(self, *labels) -> Dict:
+        with self._lock:
+            counts, total, count = self._values.get(tuple(str(label) for label in labels), ([], 0.0, 0))
+            return {'buckets': list(counts), 'sum': total, 'count': count}
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {_format_value(cumulative)}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {_format_value(count)}')
+        return lines
+
+    def _observe(self, key: Tuple[str, ...], value: float):
+        # Buckets are stored non-cumulative and summed when rendered
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def _add(self, key: Tuple[str, ...], amount: float):
+        raise TypeError(f"Histogram {self.name} only takes observations")
+
+
+OPERATION_LATENCY = Histogram(
+    'chat_operation_duration_seconds', "Time spent in chat service, Redis and database calls",
+    ['component', 'operation']
+)
+OPERATION_ERRORS = Counter(
+    'chat_operation_errors_total', "Chat service, Redis and database calls that raised, by exception type",
+    ['component', 'operation', 'error']
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    'chat_websocket_connections', "WebSocket connections open in this process", ['consumer']
+)
+WEBSOCKET_CONNECTS = Counter(
+    'chat_websocket_connects_total', "WebSocket connection attempts by outcome", ['consumer', 'result']
+)
+WEBSOCKET_AUTH = Counter(
+    'chat_websocket_auth_total', "WebSocket handshakes by authentication outcome", ['result']
+)
+CHANNEL_GROUPS = Gauge(
+    'chat_channel_groups', "Channel layer groups this process has at least one connection in"
+)
+CHAT_MESSAGES = Counter(
+    'chat_messages_total', "Chat messages received from clients by outcome", ['result']
+)
+DB_WRITE_PENDING = Gauge(
+    'chat_db_write_pending', "Messages queued by the write-behind repository and not yet in the database"
+)
+
+
+# Wraps a sync or async function to record its duration, and the type of any
+# exception it raises, under the given component and operation labels. The call
+# is also a 'component.operation' span when tracing samples it.
+def timed(component: str, operation: str):
+    latency = OPERATION_LATENCY.labels(component, operation)
+    span_name = f'{component}.{operation}'
+
+    def record_error(e: Exception):
+        OPERATION_ERRORS.labels(component, operation, type(e).__name__).inc()
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    with span(span_name):
+                        return await func(*args, **kwargs)
+                except Exception as e:
+                    record_error(e)
+                    raise
+                finally:
+                    latency.observe(time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with span(span_name):
+                    return func(*args, **kwargs)
+            except Exception as e:
+                record_error(e)
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started)
+        return wrapper
+
+    return decorator
+
+
+# Several connections of one process share a group, so the gauge counts names, not joins
+_group_members: Dict[str, int] = {}
+_group_lock = threading.Lock()
+
+
+def group_joined(name: str):
+    with _group_lock:
+        _group_members[name] = _group_members.get(name, 0) + 1
+        CHANNEL_GROUPS.set(len(_group_members))
+
+
+def group_left(name: str):
+    with _group_lock:
+        remaining = _group_members.get(name, 0) - 1
+        if remaining > 0:
+            _group_members[name] = remaining
+        else:
+            _group_members.pop(name, None)
+        CHANNEL_GROUPS.set(len(_group_members))
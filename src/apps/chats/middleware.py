@@ -3,19 +3,42 @@ from channels.middleware import BaseMiddleware
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.sessions.models import Session
 
+from apps.chats.metrics import WEBSOCKET_AUTH, timed
+from apps.chats.session_cache import get_session_user_cache
 from apps.chats.utils import get_cookie_from_scope
 
+# Close code for connections without a valid session; clients must not reconnect
+AUTH_REJECTED_CLOSE_CODE = 4001
+
 
 class AuthRequiredMiddleware(BaseMiddleware):
+    # 'authenticate' counts every lookup, 'session_lookup' only those that missed the local cache
+    @timed('auth', 'authenticate')
+    async def get_user(self, session_key):
+        # A local cache hit skips the thread hop entirely
+        user = get_session_user_cache().get(session_key)
+        if user is not None:
+            return user
+        return await self.get_user_from_session(session_key)
+
     @database_sync_to_async
+    @timed('auth', 'session_lookup')
     def get_user_from_session(self, session_key):
+        cache = get_session_user_cache()
+        user = cache.get_shared(session_key)
+        if user is not None:
+            return user
+
+        generation = cache.generation
         try:
             session = Session.objects.get(session_key=session_key)
             user_id = session.get_decoded().get('_auth_user_id')
             if user_id:
                 from django.contrib.auth import get_user_model
                 MyUser = get_user_model()
-                return MyUser.objects.get(id=user_id)
+                user = MyUser.objects.get(id=user_id)
+                cache.set(session_key, user, session.expire_date, generation)
+                return user
         except Session.DoesNotExist:
             return AnonymousUser()
         return AnonymousUser()
@@ -23,16 +46,22 @@ class AuthRequiredMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
         session_key = get_cookie_from_scope(scope, 'sessionid')
         if session_key:
-            user = await self.get_user_from_session(session_key)
+            user = await self.get_user(session_key)
             scope["user"] = user
         else:
             scope["user"] = AnonymousUser()
 
         if not scope["user"].is_authenticated:
+            WEBSOCKET_AUTH.labels('rejected').inc()
+            # Accepted before closing, otherwise the browser sees a failed handshake
+            # instead of the code and keeps reconnecting
+            await receive()
+            await send({"type": "websocket.accept"})
             await send({
                 "type": "websocket.close",
-                "code": 4001,
+                "code": AUTH_REJECTED_CLOSE_CODE,
             })
             return
 
-        return await super().__call__(scope, receive, send)
\ No newline at end of file
+        WEBSOCKET_AUTH.labels('accepted').inc()
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0002_conversation_title'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'timestamp', 'id'], name='chats_msg_conv_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'sender', 'timestamp', 'id'], name='chats_msg_conv_sender_ts_idx'),
+        ),
+    ]
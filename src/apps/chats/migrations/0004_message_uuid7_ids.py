@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:59
+
+import apps.chats.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0003_message_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='id',
+            field=models.UUIDField(default=apps.chats.ids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -2,6 +2,8 @@ import uuid
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from apps.chats.ids import uuid7
+
 MyUser = get_user_model()
 
 class Conversation(models.Model):
@@ -14,8 +16,15 @@ class Conversation(models.Model):
         return self.title or str(self.id)[:10]
 
 class Message(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Time-ordered so inserts append to the primary key index instead of scattering
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(MyUser, on_delete=models.CASCADE)
     text = models.TextField()
     timestamp = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'timestamp', 'id'], name='chats_msg_conv_ts_idx'),
+            models.Index(fields=['conversation', 'sender', 'timestamp', 'id'], name='chats_msg_conv_sender_ts_idx'),
+        ]
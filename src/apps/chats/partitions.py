@@ -0,0 +1,192 @@
+import re
+from datetime import datetime, timezone
+from typing import List
+
+from django.db import connection, transaction
+
+from apps.chats.models import Message
+
+# Monthly range partitions of the message table, named <table>_pYYYYMM.
+# Postgres only: other backends keep the plain table.
+PARTITION_SUFFIX = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def month_start(dt: datetime, offset: int = 0) -> datetime:
+    month_index = dt.year * 12 + dt.month - 1 + offset
+    return datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{Message._meta.db_table}_p{month:%Y%m}"
+
+
+# Catches rows whose month has no partition yet, so inserts never fail when a
+# maintenance run is missed. 'maintain' moves them into their own partition.
+def default_partition_name() -> str:
+    return f"{Message._meta.db_table}_default"
+
+
+def partition_month(name: str) -> datetime | None:
+    match = PARTITION_SUFFIX.search(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+def months_between(first: datetime, last: datetime) -> List[datetime]:
+    months = []
+    month = month_start(first)
+    while month <= last:
+        months.append(month)
+        month = month_start(month, 1)
+    return months
+
+
+def expired_partitions(names: List[str], now: datetime, retention_months: int) -> List[str]:
+    # A partition expires once its whole month is older than the retention window
+    cutoff = month_start(now, -retention_months)
+    return sorted(
+        name for name in names
+        if (month := partition_month(name)) is not None and month_start(month, 1) <= cutoff
+    )
+
+
+def is_postgres() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned() -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [Message._meta.db_table]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions() -> List[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s AND pg_table_is_visible(p.oid) ORDER BY c.relname",
+            [Message._meta.db_table]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_partition(month: datetime) -> bool:
+    name = partition_name(month)
+    existing = list_partitions()
+    if name in existing:
+        return False
+
+    qn = connection.ops.quote_name
+    table, default = Message._meta.db_table, default_partition_name()
+    bounds = [month, month_start(month, 1)]
+    in_range = f"{qn('timestamp')} >= %s AND {qn('timestamp')} < %s"
+    with transaction.atomic(), connection.cursor() as cursor:
+        stranded = False
+        if default in existing:
+            cursor.execute(f"SELECT 1 FROM {qn(default)} WHERE {in_range} LIMIT 1", bounds)
+            stranded = cursor.fetchone() is not None
+        if stranded:
+            # Postgres won't add a partition while the default one holds rows in its
+            # range, so the default partition is detached while they are moved
+            cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(default)}")
+
+        cursor.execute(
+            f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)", bounds
+        )
+
+        if stranded:
+            columns = ', '.join(qn(f.column) for f in Message._meta.concrete_fields)
+            cursor.execute(
+                f"INSERT INTO {qn(name)} ({columns}) SELECT {columns} FROM {qn(default)} WHERE {in_range}", bounds
+            )
+            cursor.execute(f"DELETE FROM {qn(default)} WHERE {in_range}", bounds)
+            cursor.execute(f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(default)} DEFAULT")
+    return True
+
+
+def create_default_partition() -> bool:
+    name = default_partition_name()
+    if name in list_partitions():
+        return False
+
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {qn(name)} PARTITION OF {qn(Message._meta.db_table)} DEFAULT")
+    return True
+
+
+# Months that have rows in the default partition, i.e. that 'maintain' didn't create in time
+def default_partition_months() -> List[datetime]:
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', {qn('timestamp')} AT TIME ZONE 'UTC') "
+            f"FROM {qn(default_partition_name())} ORDER BY 1"
+        )
+        return [row[0].replace(tzinfo=timezone.utc) for row in cursor.fetchall()]
+
+
+def detach_partition(name: str, drop: bool = False):
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(Message._meta.db_table)} DETACH PARTITION {qn(name)}")
+        if drop:
+            cursor.execute(f"DROP TABLE {qn(name)}")
+
+
+# One-off conversion: rebuild the message table as a partitioned table and copy the
+# existing rows into it. Runs in a single transaction under an exclusive lock.
+def enable_partitioning(now: datetime, months_ahead: int) -> int:
+    qn = connection.ops.quote_name
+    table = Message._meta.db_table
+    legacy = f"{table}_unpartitioned"
+    conversation = Message._meta.get_field('conversation')
+    sender = Message._meta.get_field('sender')
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"SELECT MIN({qn('timestamp')}) FROM {qn(table)}")
+        oldest = cursor.fetchone()[0] or now
+
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE ({qn('timestamp')})"
+        )
+        # The partition key has to be part of every unique constraint
+        cursor.execute(f"ALTER TABLE {qn(table)} ADD PRIMARY KEY ({qn('id')}, {qn('timestamp')})")
+        for field in (conversation, sender):
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(f'{table}_{field.column}_fk')} "
+                f"FOREIGN KEY ({qn(field.column)}) "
+                f"REFERENCES {qn(field.related_model._meta.db_table)} ({qn(field.target_field.column)}) "
+                f"DEFERRABLE INITIALLY DEFERRED"
+            )
+
+        for month in months_between(oldest, month_start(now, months_ahead)):
+            create_partition(month)
+        create_default_partition()
+
+        columns = ', '.join(qn(f.column) for f in Message._meta.concrete_fields)
+        cursor.execute(f"INSERT INTO {qn(table)} ({columns}) SELECT {columns} FROM {qn(legacy)}")
+        copied = cursor.rowcount
+        # Deferred foreign key checks still pending on the old table block the drop, so
+        # they run now (and fail the conversion before anything is lost), then go back to
+        # Django's deferred default
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+        cursor.execute(f"DROP TABLE {qn(legacy)}")
+
+        with connection.schema_editor(atomic=False) as schema_editor:
+            for index in Message._meta.indexes:
+                schema_editor.add_index(Message, index)
+        cursor.execute(f"CREATE INDEX {qn(f'{table}_sender_id_idx')} ON {qn(table)} ({qn(sender.column)})")
+
+    return copied
@@ -0,0 +1,46 @@
+import asyncio
+import cProfile
+import io
+import marshal
+import pstats
+
+from apps.chats.exceptions import ProfileInProgressError
+
+SORT_KEYS = set(pstats.Stats.sort_arg_dict_default)
+
+# Only one capture runs at a time, a second profiler would displace the first
+_running = False
+
+
+# Profiles the calling thread for `seconds` while yielding to the event loop. Run from
+# an async view, that is the worker's loop thread: every consumer, group handler and
+# async service call it runs in the window is captured. Work handed to the thread pool
+# only shows as time awaiting its future; span tracing attributes that.
+async def capture_profile(seconds: float) -> cProfile.Profile:
+    global _running
+    if _running:
+        raise ProfileInProgressError("A profile is already being captured in this process")
+
+    _running = True
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+    finally:
+        _running = False
+    return profiler
+
+
+def format_stats(profiler: cProfile.Profile, sort: str = 'cumulative', limit: int = 50) -> str:
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+# The same format as cProfile's .prof files, for snakeviz or pstats.Stats(path)
+def dump_stats(profiler: cProfile.Profile) -> bytes:
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
@@ -1,2 +1,2 @@
-from .db_repo import DatabaseMessageRepo
+from .db_repo import DatabaseMessageRepo, WriteBehindMessageRepo
 from .redis_repo import RedisMessageRepo
\ No newline at end of file
@@ -0,0 +1,245 @@
+import uuid
+from typing import Dict, List
+
+import redis
+import redis.asyncio as aioredis
+
+from apps.chats.codecs import MessageCodec, JsonMessageCodec, decode_message
+from apps.chats.exceptions import MessageStorageError, MessageRetrievalError, MessageDecodeError
+from apps.chats.metrics import timed
+from apps.chats.repositories.inter import IAsyncMessageRepo, IAsyncRateLimiterRepo, IAsyncPresenceRepo
+from apps.chats.repositories.redis_repo import RedisMessageRepo, RedisRateLimiterRepo, RedisPresenceRepo, \
+    queue_messages_push, page_before, page_after, resolve_indexed, messages_key, sender_index_key, \
+    message_ids_key, message_payloads_key, legacy_sender_messages_key, senders_key, presence_key, \
+    presence_connections_key
+from apps.chats.validators import validate_message_required_field
+from loggers import get_redis_logger
+
+logger = get_redis_logger()
+
+
+# The asyncio counterpart of redis_repo.walk_messages.
+async def walk_messages_async(redis_client: aioredis.Redis, key: str, walker):
+    try:
+        start, end = next(walker)
+        while True:
+            start, end = walker.send(await redis_client.lrange(key, start, end))
+    except StopIteration as done:
+        return done.value
+
+
+class AsyncRedisMessageRepo(IAsyncMessageRepo):
+    SCAN_CHUNK_SIZE = RedisMessageRepo.SCAN_CHUNK_SIZE
+    PUSH_CHUNK_SIZE = RedisMessageRepo.PUSH_CHUNK_SIZE
+
+    def __init__(self, redis_client: aioredis.Redis, max_length: int | None = None,
+                 codec: MessageCodec | None = None):
+        self.redis_client = redis_client
+        self.max_length = max_length
+        self.codec = codec or JsonMessageCodec()
+
+    @timed('redis', 'push_message')
+    async def push_message(self, conv_id: str, message: Dict) -> None:
+        try:
+            if not validate_message_required_field(message):
+                raise ValueError("The message must contain sender, text, timestamp")
+
+            pipe = self.redis_client.pipeline(transaction=True)
+            queue_messages_push(pipe, conv_id, [message], self.codec, self.max_length, self.PUSH_CHUNK_SIZE)
+            await pipe.execute()
+            logger.info(f"Message saved in conversation {conv_id}")
+        except redis.RedisError as e:
+            logger.error(f"Error saving message to Redis: {e}")
+            raise MessageStorageError(e)
+
+    @timed('redis', 'push_messages')
+    async def push_messages(self, conv_id: str, messages: List[Dict]) -> None:
+        if not messages:
+            return
+
+        try:
+            if not all(validate_message_required_field(m) for m in messages):
+                raise ValueError("The message must contain sender, text, timestamp")
+
+            if self.max_length:
+                messages = messages[-self.max_length:]
+
+            pipe = self.redis_client.pipeline(transaction=True)
+            queue_messages_push(pipe, conv_id, messages, self.codec, self.max_length, self.PUSH_CHUNK_SIZE)
+            await pipe.execute()
+            logger.info(f"{len(messages)} messages saved in conversation {conv_id}")
+        except redis.RedisError as e:
+            logger.error(f"Error saving messages to Redis: {e}")
+            raise MessageStorageError(e)
+
+    @timed('redis', 'get_messages')
+    async def get_messages(self, conv_id: str) -> List[Dict]:
+        try:
+            messages = await self.redis_client.lrange(messages_key(conv_id), 0, -1)
+            return [decode_message(m) for m in messages]
+        except redis.RedisError as e:
+            logger.error(f"Error receiving messages from Redis: {e}")
+            raise MessageRetrievalError(e)
+        except MessageDecodeError as e:
+            logger.error(f"Message deserialization error: {e}")
+            raise MessageRetrievalError(e)
+
+    @timed('redis', 'get_messages_by_user_id')
+    async def get_messages_by_user_id(self, conv_id: str, user_id: int) -> List[Dict]:
+        try:
+            index = sender_index_key(conv_id, user_id)
+            ids = await self.redis_client.zrange(index, 0, -1)
+            if not ids:
+                return []
+            messages, stale = resolve_indexed(ids, await self.redis_client.hmget(message_payloads_key(conv_id), ids))
+            if stale:
+                await self.redis_client.zrem(index, *stale)
+            return messages
+        except redis.RedisError as e:
+            logger.error(f"Error receiving messages from Redis: {e}")
+            raise MessageRetrievalError(e)
+        except (MessageDecodeError, KeyError, ValueError) as e:
+            logger.error(f"Message deserialization error: {e}")
+            raise MessageRetrievalError(e)
+
+    @timed('redis', 'get_latest_messages')
+    async def get_latest_messages(self, conv_id: str, limit: int) -> List[Dict]:
+        try:
+            messages = await self.redis_client.lrange(messages_key(conv_id), -limit, -1)
+            return [decode_message(m) for m in messages]
+        except redis.RedisError as e:
+            logger.error(f"Error receiving messages from Redis: {e}")
+            raise MessageRetrievalError(e)
+        except MessageDecodeError as e:
+            logger.error(f"Message deserialization error: {e}")
+            raise MessageRetrievalError(e)
+
+    @timed('redis', 'get_messages_before')
+    async def get_messages_before(self, conv_id: str, before: str, limit: int) -> List[Dict]:
+        try:
+            chunk_size = max(limit, self.SCAN_CHUNK_SIZE)
+            return await walk_messages_async(
+                self.redis_client, messages_key(conv_id), page_before(before, limit, chunk_size)
+            )
+        except redis.RedisError as e:
+            logger.error(f"Error receiving messages from Redis: {e}")
+            raise MessageRetrievalError(e)
+        except (MessageDecodeError, KeyError, ValueError) as e:
+            logger.error(f"Message deserialization error: {e}")
+            raise MessageRetrievalError(e)
+
+    # None when the cursor is no longer in the cache or more than `limit` messages have
+    # arrived since, so the caller can start over.
+    @timed('redis', 'get_messages_after')
+    async def get_messages_after(self, conv_id: str, after: str, limit: int) -> List[Dict] | None:
+        try:
+            chunk_size = min(limit + 1, self.SCAN_CHUNK_SIZE)
+            return await walk_messages_async(
+                self.redis_client, messages_key(conv_id), page_after(after, limit, chunk_size)
+            )
+        except redis.RedisError as e:
+            logger.error(f"Error receiving messages from Redis: {e}")
+            raise MessageRetrievalError(e)
+        except (MessageDecodeError, KeyError, ValueError) as e:
+            logger.error(f"Message deserialization error: {e}")
+            raise MessageRetrievalError(e)
+
+    @timed('redis', 'clear_messages')
+    async def clear_messages(self, conv_id: str):
+        try:
+            senders = await self.redis_client.smembers(senders_key(conv_id))
+            keys = [messages_key(conv_id), senders_key(conv_id), message_ids_key(conv_id), message_payloads_key(conv_id)]
+            for sender in (s.decode('utf-8') for s in senders):
+                keys += [sender_index_key(conv_id, sender), legacy_sender_messages_key(conv_id, sender)]
+            deleted_count = await self.redis_client.delete(*keys)
+
+            if deleted_count:
+                logger.info(f"Cleared messages from Redis for conversation {conv_id}")
+            else:
+                logger.info(f"No messages found in Redis for conversation {conv_id}")
+        except redis.RedisError as e:
+            logger.error(f"Error clearing messages from Redis for conversation {conv_id}: {e}")
+            raise MessageStorageError(f"Failed to clear Redis messages: {e}")
+
+
+class AsyncRedisRateLimiterRepo(IAsyncRateLimiterRepo):
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis = redis_client
+        self._hit = self.redis.register_script(RedisRateLimiterRepo.HIT_SCRIPT)
+
+    @timed('redis', 'hit')
+    async def hit(self, key: str, per_second: int, per_minute: int) -> str | None:
+        try:
+            result = await self._hit(keys=[key], args=[per_second, per_minute, uuid.uuid4().hex])
+            return RedisRateLimiterRepo.EXCEEDED.get(int(result))
+        except redis.RedisError as e:
+            message = f"Redis error checking rate limit '{key}': {e}"
+            logger.error(message)
+            raise MessageStorageError(message)
+
+
+class AsyncRedisPresenceRepo(IAsyncPresenceRepo):
+    def __init__(self, redis_client: aioredis.Redis, ttl: float):
+        self.redis = redis_client
+        self.ttl_ms = int(ttl * 1000)
+        self._touch = self.redis.register_script(RedisPresenceRepo.TOUCH_SCRIPT)
+        self._leave = self.redis.register_script(RedisPresenceRepo.LEAVE_SCRIPT)
+        self._expire = self.redis.register_script(RedisPresenceRepo.EXPIRE_SCRIPT)
+
+    @timed('redis', 'touch')
+    async def touch(self, conv_id: str, user_id: int | str, connection_id: str) -> int:
+        try:
+            keys = [presence_key(conv_id), presence_connections_key(conv_id, user_id)]
+            return int(await self._touch(keys=keys, args=[user_id, connection_id, self.ttl_ms]))
+        except redis.RedisError as e:
+            message = f"Redis error updating presence in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageStorageError(message)
+
+    @timed('redis', 'leave')
+    async def leave(self, conv_id: str, user_id: int | str, connection_id: str) -> int:
+        try:
+            keys = [presence_key(conv_id), presence_connections_key(conv_id, user_id)]
+            return int(await self._leave(keys=keys, args=[user_id, connection_id, self.ttl_ms]))
+        except redis.RedisError as e:
+            message = f"Redis error removing presence in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageStorageError(message)
+
+    @timed('redis', 'expire')
+    async def expire(self, conv_id: str) -> List[str]:
+        try:
+            stale = await self._expire(keys=[presence_key(conv_id)],
+                                       args=[presence_connections_key(conv_id, ''), self.ttl_ms])
+            return [m.decode('utf-8') for m in stale]
+        except redis.RedisError as e:
+            message = f"Redis error expiring presence in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageStorageError(message)
+
+    @timed('redis', 'count')
+    async def count(self, conv_id: str) -> int:
+        try:
+            return await self.redis.zcard(presence_key(conv_id))
+        except redis.RedisError as e:
+            message = f"Redis error counting presence in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageRetrievalError(message)
+
+    @timed('redis', 'members')
+    async def members(self, conv_id: str, offset: int = 0, limit: int | None = None) -> List[str]:
+        try:
+            end = -1 if limit is None else offset + limit - 1
+            return [m.decode('utf-8') for m in await self.redis.zrevrange(presence_key(conv_id), offset, end)]
+        except redis.RedisError as e:
+            message = f"Redis error getting presence in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageRetrievalError(message)
+
+    async def connection_count(self, conv_id: str, user_id: int | str) -> int:
+        try:
+            return await self.redis.zcard(presence_connections_key(conv_id, user_id))
+        except redis.RedisError as e:
+            message = f"Redis error counting connections in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageRetrievalError(message)
@@ -1,11 +1,21 @@
-from datetime import datetime
+import atexit
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
 from typing import Dict, List
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, OperationalError, InterfaceError
+from django.db.models import Q
 
 from apps.chats.exceptions import MessageStorageError, MessageRetrievalError
+from apps.chats.ids import uuid7
+from apps.chats.metrics import timed
 from apps.chats.models import Conversation, Message
+from apps.chats.partitions import month_start
 from apps.chats.repositories.inter import IMessageRepo, IConsumerRepo
+from apps.chats.utils import parse_cursor
 from apps.chats.validators import validate_message_required_field
 from apps.users.serializers import MyUserSerializer
 from loggers import get_django_logger
@@ -14,6 +24,10 @@ logger = get_django_logger()
 MyUser = get_user_model()
 
 class DatabaseMessageRepo(IMessageRepo):
+    def __init__(self, partitioned: bool = False):
+        self.partitioned = partitioned
+
+    @timed('db', 'push_message')
     def push_message(self, conv_id: str, message: Dict) -> None:
         try:
             if not validate_message_required_field(message):
@@ -22,6 +36,7 @@ class DatabaseMessageRepo(IMessageRepo):
             conversation = Conversation.objects.get(id=conv_id)
             sender = MyUser.objects.get(id=message['sender'])
             Message.objects.create(
+                id=message.get('id') or uuid7(),
                 conversation=conversation,
                 sender=sender,
                 text=message['text'],
@@ -35,31 +50,247 @@ class DatabaseMessageRepo(IMessageRepo):
             logger.error(f"Error saving to the database: {e}")
             raise MessageStorageError(e)
 
+    @timed('db', 'push_messages')
+    def push_messages(self, conv_id: str, messages: List[Dict]) -> None:
+        try:
+            if not all(validate_message_required_field(m) for m in messages):
+                raise ValueError("The message must contain sender, text, timestamp")
+
+            # Ids come from the message, so a batch that is written twice is stored once
+            Message.objects.bulk_create([
+                Message(
+                    id=m.get('id') or uuid7(),
+                    conversation_id=conv_id,
+                    sender_id=m['sender'],
+                    text=m['text'],
+                    timestamp=m['timestamp']
+                ) for m in messages
+            ], ignore_conflicts=True)
+            logger.info(f"{len(messages)} messages saved in the database: {conv_id}")
+        except Exception as e:
+            logger.error(f"Error saving to the database: {e}")
+            raise MessageStorageError(e)
+
+    # Rows are projected straight to the fields a message dict needs; sender_id
+    # comes from the FK column, so no user rows are loaded.
+    MESSAGE_FIELDS = ('id', 'sender_id', 'text', 'timestamp')
+
+    @timed('db', 'get_messages')
     def get_messages(self, conv_id: str) -> List[Dict]:
         try:
-            messages = Message.objects.filter(conversation__id=conv_id).select_related('sender').order_by('timestamp')
-            return [
-                {
-                    'sender': m.sender.id,
-                    'text': m.text,
-                    'timestamp': m.timestamp.isoformat()
-                } for m in messages
-            ]
+            rows = Message.objects.filter(conversation_id=conv_id).order_by('timestamp', 'id').values(*self.MESSAGE_FIELDS)
+            return [self._serialize(row) for row in rows]
         except Exception as e:
             logger.error(f"Error retrieving from database: {e}")
             raise MessageRetrievalError(e)
 
+    @timed('db', 'get_messages_by_user_id')
     def get_messages_by_user_id(self, conv_id: str,  user_id: int) -> list[Dict]:
         try:
-            messages = Message.objects.filter(conversation__id=conv_id,sender_id=user_id)
-            return [
-                {
-                    'sender': m.sender.id,
-                    'text': m.text,
-                    'timestamp': m.timestamp.isoformat()
-                } for m in messages
-            ]
+            rows = Message.objects.filter(
+                conversation_id=conv_id,
+                sender_id=user_id
+            ).order_by('timestamp', 'id').values(*self.MESSAGE_FIELDS)
+            return [self._serialize(row) for row in rows]
+
+        except Exception as e:
+            logger.error(f"Error retrieving from database: {e}")
+            raise MessageRetrievalError(e)
+
+    @timed('db', 'get_latest_messages')
+    def get_latest_messages(self, conv_id: str, limit: int) -> List[Dict]:
+        try:
+            rows = self._newest_rows(Message.objects.filter(conversation_id=conv_id), limit, datetime.now(timezone.utc))
+            return [self._serialize(row) for row in reversed(rows)]
+        except Exception as e:
+            logger.error(f"Error retrieving from database: {e}")
+            raise MessageRetrievalError(e)
 
+    @timed('db', 'get_messages_before')
+    def get_messages_before(self, conv_id: str, before: str, limit: int) -> List[Dict]:
+        try:
+            # Keyset page: seek on the (conversation, timestamp, id) index instead of
+            # offsetting, so older pages cost the same as the first one.
+            before_dt, before_id = parse_cursor(before)
+            older = Q(timestamp__lt=before_dt)
+            if before_id:
+                older |= Q(timestamp=before_dt, id__lt=before_id)
+            rows = self._newest_rows(
+                Message.objects.filter(older, conversation_id=conv_id), limit, before_dt
+            )
+            return [self._serialize(row) for row in reversed(rows)]
         except Exception as e:
             logger.error(f"Error retrieving from database: {e}")
-            raise MessageRetrievalError(e)
\ No newline at end of file
+            raise MessageRetrievalError(e)
+
+    def _newest_rows(self, queryset, limit: int, upper: datetime) -> List[Dict]:
+        queryset = queryset.order_by('-timestamp', '-id').values(*self.MESSAGE_FIELDS)
+        if not self.partitioned:
+            return list(queryset[:limit])
+
+        # Bound the first read to the two newest monthly partitions so Postgres can
+        # prune the rest; older partitions are only touched if the page isn't full.
+        lower = month_start(upper, -1)
+        rows = list(queryset.filter(timestamp__gte=lower)[:limit])
+        if len(rows) < limit:
+            rows += queryset.filter(timestamp__lt=lower)[:limit - len(rows)]
+        return rows
+
+    @staticmethod
+    def _serialize(row: Dict) -> Dict:
+        return {
+            'id': str(row['id']),
+            'sender': row['sender_id'],
+            'text': row['text'],
+            'timestamp': row['timestamp'].isoformat()
+        }
+
+
+
+class WriteBehindMessageRepo(DatabaseMessageRepo):
+    def __init__(self, batch_size: int = 100, flush_interval: float = 0.5, partitioned: bool = False):
+        super().__init__(partitioned=partitioned)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: deque[Message] = deque()
+        self._queue_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.enqueued_count = 0
+        self.flushed_count = 0
+        self.failed_count = 0
+        self.last_flush_duration = 0.0
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> Dict:
+        return {
+            'pending': self.pending_count,
+            'enqueued': self.enqueued_count,
+            'flushed': self.flushed_count,
+            'failed': self.failed_count,
+            'last_flush_duration': self.last_flush_duration,
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='message-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"Write-behind flusher started (batch_size={self.batch_size}, interval={self.flush_interval}s)")
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 10)
+            self._thread = None
+        self.flush()
+        logger.info(f"Write-behind flusher stopped: {self.stats()}")
+
+    # Timed like the base class, so the production write path still reports enqueues
+    @timed('db', 'push_message')
+    def push_message(self, conv_id: str, message: Dict) -> None:
+        self._enqueue(conv_id, message)
+
+    @timed('db', 'push_messages')
+    def push_messages(self, conv_id: str, messages: List[Dict]) -> None:
+        for message in messages:
+            self._enqueue(conv_id, message)
+
+    def _enqueue(self, conv_id: str, message: Dict) -> None:
+        if not validate_message_required_field(message):
+            logger.error("Error queueing message: missing required fields")
+            raise MessageStorageError("The message must contain sender, text, timestamp")
+
+        # Foreign keys are set by id so queueing never touches the database.
+        with self._queue_lock:
+            self._queue.append(Message(
+                id=message.get('id') or uuid7(),
+                conversation_id=conv_id,
+                sender_id=message['sender'],
+                text=message['text'],
+                timestamp=message['timestamp']
+            ))
+            self.enqueued_count += 1
+            queued = len(self._queue)
+
+        if queued >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        flushed = 0
+        with self._flush_lock:
+            while True:
+                with self._queue_lock:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not batch:
+                    break
+
+                started = time.monotonic()
+                written = self._write_batch(batch)
+                self.last_flush_duration = time.monotonic() - started
+                if written is None:
+                    break
+                flushed += written
+        return flushed
+
+    def get_messages(self, conv_id: str) -> List[Dict]:
+        self.flush()
+        return super().get_messages(conv_id)
+
+    def get_messages_by_user_id(self, conv_id: str, user_id: int) -> list[Dict]:
+        self.flush()
+        return super().get_messages_by_user_id(conv_id, user_id)
+
+    def get_latest_messages(self, conv_id: str, limit: int) -> List[Dict]:
+        self.flush()
+        return super().get_latest_messages(conv_id, limit)
+
+    def get_messages_before(self, conv_id: str, before: str, limit: int) -> List[Dict]:
+        self.flush()
+        return super().get_messages_before(conv_id, before, limit)
+
+    @timed('db', 'write_batch')
+    def _write_batch(self, batch: List[Message]) -> int | None:
+        try:
+            Message.objects.bulk_create(batch, ignore_conflicts=True)
+            self.flushed_count += len(batch)
+            logger.info(f"Flushed {len(batch)} messages to the database")
+            return len(batch)
+        except (OperationalError, InterfaceError) as e:
+            # The database is unreachable: keep the batch and retry on the next tick.
+            logger.error(f"Database unavailable, requeueing {len(batch)} messages: {e}")
+            with self._queue_lock:
+                self._queue.extendleft(reversed(batch))
+            connection.close()
+            return None
+        except Exception as e:
+            logger.error(f"Batch insert failed, retrying messages one by one: {e}")
+
+        written = 0
+        for message in batch:
+            try:
+                message.save(force_insert=True)
+                written += 1
+            except Exception as e:
+                self.failed_count += 1
+                logger.error(f"Error saving to the database: {e}")
+        self.flushed_count += written
+        return written
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+        connection.close()
@@ -7,6 +7,10 @@ class IMessageRepo(ABC):
     def push_message(self, conv_id: str, message: Dict):
         pass
 
+    @abstractmethod
+    def push_messages(self, conv_id: str, messages: list[Dict]):
+        pass
+
     @abstractmethod
     def get_messages(self, conv_id: str) -> list[Dict]:
         pass
@@ -15,6 +19,14 @@ class IMessageRepo(ABC):
     def get_messages_by_user_id(self, conv_id:str,  user_id:int|str) -> list[Dict]:
         pass
 
+    @abstractmethod
+    def get_latest_messages(self, conv_id: str, limit: int) -> list[Dict]:
+        pass
+
+    @abstractmethod
+    def get_messages_before(self, conv_id: str, before: str, limit: int) -> list[Dict]:
+        pass
+
 class IMessageClearRepo(IMessageRepo, ABC):
     @abstractmethod
     def clear_messages(self, conv_id: str):
@@ -35,4 +47,114 @@ class IConsumerRepo(ABC):
 
     @abstractmethod
     def delete_set(self, key:str):
-        pass
\ No newline at end of file
+        pass
+
+class IRateLimiterRepo(ABC):
+    @abstractmethod
+    def hit(self, key: str, per_second: int, per_minute: int) -> str | None:
+        pass
+
+class IPresenceRepo(ABC):
+    @abstractmethod
+    def touch(self, conv_id: str, user_id: int | str, connection_id: str) -> int:
+        pass
+
+    @abstractmethod
+    def leave(self, conv_id: str, user_id: int | str, connection_id: str) -> int:
+        pass
+
+    @abstractmethod
+    def expire(self, conv_id: str) -> list[str]:
+        pass
+
+    @abstractmethod
+    def count(self, conv_id: str) -> int:
+        pass
+
+    @abstractmethod
+    def members(self, conv_id: str, offset: int = 0, limit: int | None = None) -> list[str]:
+        pass
+
+    @abstractmethod
+    def connection_count(self, conv_id: str, user_id: int | str) -> int:
+        pass
+
+class IConversationListRepo(ABC):
+    @abstractmethod
+    def get_page(self, offset: int, limit: int) -> Dict | None:
+        pass
+
+    @abstractmethod
+    def rebuild(self, conversations: list[Dict]) -> int:
+        pass
+
+    @abstractmethod
+    def apply_change(self, status: str, conversation: Dict) -> int | None:
+        pass
+
+    @abstractmethod
+    def get_changes(self, since: int) -> Dict | None:
+        pass
+
+class IAsyncMessageRepo(ABC):
+    @abstractmethod
+    async def push_message(self, conv_id: str, message: Dict):
+        pass
+
+    @abstractmethod
+    async def push_messages(self, conv_id: str, messages: list[Dict]):
+        pass
+
+    @abstractmethod
+    async def get_messages(self, conv_id: str) -> list[Dict]:
+        pass
+
+    @abstractmethod
+    async def get_messages_by_user_id(self, conv_id: str, user_id: int | str) -> list[Dict]:
+        pass
+
+    @abstractmethod
+    async def get_latest_messages(self, conv_id: str, limit: int) -> list[Dict]:
+        pass
+
+    @abstractmethod
+    async def get_messages_before(self, conv_id: str, before: str, limit: int) -> list[Dict]:
+        pass
+
+    @abstractmethod
+    async def get_messages_after(self, conv_id: str, after: str, limit: int) -> list[Dict] | None:
+        pass
+
+    @abstractmethod
+    async def clear_messages(self, conv_id: str):
+        pass
+
+class IAsyncRateLimiterRepo(ABC):
+    @abstractmethod
+    async def hit(self, key: str, per_second: int, per_minute: int) -> str | None:
+        pass
+
+class IAsyncPresenceRepo(ABC):
+    @abstractmethod
+    async def touch(self, conv_id: str, user_id: int | str, connection_id: str) -> int:
+        pass
+
+    @abstractmethod
+    async def leave(self, conv_id: str, user_id: int | str, connection_id: str) -> int:
+        pass
+
+    @abstractmethod
+    async def expire(self, conv_id: str) -> list[str]:
+        pass
+
+    @abstractmethod
+    async def count(self, conv_id: str) -> int:
+        pass
+
+    @abstractmethod
+    async def members(self, conv_id: str, offset: int = 0, limit: int | None = None) -> list[str]:
+        pass
+
+    @abstractmethod
+    async def connection_count(self, conv_id: str, user_id: int | str) -> int:
+        pass
@@ -1,11 +1,16 @@
+import json
+import uuid
 from typing import Dict, List
 import redis
-import json
 from django.conf import settings
 from django.contrib.auth import get_user_model
 
-from apps.chats.exceptions import MessageStorageError, MessageRetrievalError
-from apps.chats.repositories.inter import IMessageRepo, IConsumerRepo, IMessageClearRepo
+from apps.chats.codecs import MessageCodec, JsonMessageCodec, decode_message
+from apps.chats.exceptions import MessageStorageError, MessageRetrievalError, MessageDecodeError
+from apps.chats.metrics import timed
+from apps.chats.repositories.inter import IMessageRepo, IConsumerRepo, IMessageClearRepo, IRateLimiterRepo, \
+    IPresenceRepo, IConversationListRepo
+from apps.chats.utils import parse_iso_aware, parse_cursor, message_position
 from apps.chats.validators import validate_message_required_field
 from loggers import get_redis_logger
 
@@ -13,53 +18,276 @@ logger = get_redis_logger()
 MyUser = get_user_model()
 
 
+def messages_key(conv_id: str) -> str:
+    return f"chat:{conv_id}"
+
+def sender_index_key(conv_id: str, user_id: int | str) -> str:
+    return f"chat:{conv_id}:sender_ids:{user_id}"
+
+def message_payloads_key(conv_id: str) -> str:
+    return f"chat:{conv_id}:payloads"
+
+def message_ids_key(conv_id: str) -> str:
+    return f"chat:{conv_id}:ids"
+
+# Per-sender payload lists written by older releases; only deleted now
+def legacy_sender_messages_key(conv_id: str, user_id: int | str) -> str:
+    return f"chat:{conv_id}:sender:{user_id}"
+
+def senders_key(conv_id: str) -> str:
+    return f"chat:{conv_id}:senders"
+
+def presence_key(conv_id: str) -> str:
+    return f"presence:{conv_id}"
+
+def presence_connections_key(conv_id: str, user_id: int | str) -> str:
+    return f"presence:{conv_id}:user:{user_id}"
+
+# Drops the oldest ids past max_length from the conversation's id set along with their
+# payloads, in batches so a large trim stays under Lua's unpack() limit.
+TRIM_PAYLOADS_SCRIPT = """
+local excess = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[1])
+if excess <= 0 then
+    return 0
+end
+local trimmed = redis.call('ZRANGE', KEYS[1], 0, excess - 1)
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, excess - 1)
+for start = 1, #trimmed, 1000 do
+    redis.call('HDEL', KEYS[2], unpack(trimmed, start, math.min(start + 999, #trimmed)))
+end
+return excess
+"""
+
+# Queues the append to the conversation list and to the per-sender indexes. An index
+# is a sorted set of message ids scored by timestamp that points into an id -> payload
+# hash, so a sender's messages are read with one HMGET instead of scanning the room.
+# The hash is trimmed to the same max_length as the list. The caller executes the
+# pipeline, so the list, the hash and the indexes change in the same MULTI/EXEC.
+def queue_messages_push(pipe, conv_id: str, messages: List[Dict], codec: MessageCodec,
+                        max_length: int | None, chunk_size: int):
+    by_sender: Dict[str, Dict[str, float]] = {}
+    payloads = []
+    by_id: Dict[str, str | bytes] = {}
+    scores: Dict[str, float] = {}
+    for message in messages:
+        payload = codec.encode(message)
+        payloads.append(payload)
+        ids = by_sender.setdefault(str(message['sender']), {})
+        if message.get('id'):
+            _id = str(message['id'])
+            ids[_id] = scores[_id] = parse_iso_aware(message['timestamp']).timestamp()
+            by_id[_id] = payload
+
+    key = messages_key(conv_id)
+    for start in range(0, len(payloads), chunk_size):
+        pipe.rpush(key, *payloads[start:start + chunk_size])
+    if max_length:
+        # Keep only the hot tail; older history is served from the database.
+        pipe.ltrim(key, -max_length, -1)
+
+    for sender, ids in by_sender.items():
+        if not ids:
+            continue
+        pipe.zadd(sender_index_key(conv_id, sender), ids)
+        if max_length:
+            # A sender can't have more than max_length messages left in the list
+            pipe.zremrangebyrank(sender_index_key(conv_id, sender), 0, -max_length - 1)
+
+    if by_id:
+        pipe.zadd(message_ids_key(conv_id), scores)
+        pipe.hset(message_payloads_key(conv_id), mapping=by_id)
+        if max_length:
+            pipe.eval(TRIM_PAYLOADS_SCRIPT, 2, message_ids_key(conv_id), message_payloads_key(conv_id), max_length)
+
+    pipe.sadd(senders_key(conv_id), *by_sender)
+
+
+# Collects the `limit` newest messages older than the cursor, oldest first. Walks the
+# list backwards from the tail so the cost is bounded by how far the cursor is from the
+# newest message, not by list size. The generator yields the LRANGE bounds it needs and
+# is sent each chunk back, so the sync and asyncio repos share the same walk.
+def page_before(before: str, limit: int, chunk_size: int):
+    before_dt, before_id = parse_cursor(before)
+    page = []
+    end = -1
+
+    while len(page) < limit:
+        chunk = yield end - chunk_size + 1, end
+        if not chunk:
+            break
+
+        for raw in reversed(chunk):
+            message = decode_message(raw)
+            timestamp, message_id = message_position(message)
+            if timestamp < before_dt or (timestamp == before_dt and before_id and message_id < before_id):
+                page.append(message)
+                if len(page) == limit:
+                    break
+
+        if len(chunk) < chunk_size:
+            break
+        end -= chunk_size
+
+    page.reverse()
+    return page
+
+# Messages newer than the cursor, oldest first, walking back from the tail the same way.
+# Messages that share the cursor's timestamp are compared on id, and the walk only stops
+# once it is past that timestamp, so none of them is lost on resume. Returns None when the
+# cursor is no longer in the list or more than `limit` messages have arrived since.
+def page_after(after: str, limit: int, chunk_size: int):
+    after_dt, after_id = parse_cursor(after)
+    newer = []
+    reached = False
+    end = -1
+
+    while True:
+        chunk = yield end - chunk_size + 1, end
+        for raw in reversed(chunk):
+            message = decode_message(raw)
+            timestamp, message_id = message_position(message)
+            if timestamp < after_dt:
+                newer.reverse()
+                return newer
+            if timestamp == after_dt and (not after_id or message_id <= after_id):
+                reached = True
+                continue
+            newer.append(message)
+            if len(newer) > limit:
+                return None
+
+        if len(chunk) < chunk_size:
+            if not reached:
+                return None
+            newer.reverse()
+            return newer
+        end -= chunk_size
+
+# Decodes the payloads read for a sender index, in index order. Ids whose payload was
+# trimmed come back as None and are returned separately so the caller can drop them.
+def resolve_indexed(ids: List[bytes], payloads: List[bytes | None]) -> tuple[List[Dict], List[bytes]]:
+    messages, stale = [], []
+    for _id, raw in zip(ids, payloads):
+        if raw is None:
+            stale.append(_id)
+        else:
+            messages.append(decode_message(raw))
+    return messages, stale
+
+def walk_messages(redis_client, key: str, walker):
+    try:
+        start, end = next(walker)
+        while True:
+            start, end = walker.send(redis_client.lrange(key, start, end))
+    except StopIteration as done:
+        return done.value
+
 class RedisMessageRepo(IMessageClearRepo):
-    def __init__(self, redis_client):
+    SCAN_CHUNK_SIZE = 100
+    PUSH_CHUNK_SIZE = 1000
+
+    def __init__(self, redis_client, max_length: int | None = None,
+                 codec: MessageCodec | None = None):
         self.redis_client = redis_client
+        self.max_length = max_length
+        self.codec = codec or JsonMessageCodec()
 
+    @timed('redis', 'push_message')
     def push_message(self, conv_id: str, message: Dict) -> None:
         try:
             if not validate_message_required_field(message):
                 raise ValueError("The message must contain sender, text, timestamp")
 
-            self.redis_client.rpush(f"chat:{conv_id}", json.dumps(message))
+            pipe = self.redis_client.pipeline(transaction=True)
+            queue_messages_push(pipe, conv_id, [message], self.codec, self.max_length, self.PUSH_CHUNK_SIZE)
+            pipe.execute()
             logger.info(f"Message saved in conversation {conv_id}")
         except redis.RedisError as e:
             logger.error(f"Error saving message to Redis: {e}")
             raise MessageStorageError(e)
 
+    @timed('redis', 'push_messages')
+    def push_messages(self, conv_id: str, messages: List[Dict]) -> None:
+        if not messages:
+            return
+
+        try:
+            if not all(validate_message_required_field(m) for m in messages):
+                raise ValueError("The message must contain sender, text, timestamp")
+
+            if self.max_length:
+                messages = messages[-self.max_length:]
 
+            pipe = self.redis_client.pipeline(transaction=True)
+            queue_messages_push(pipe, conv_id, messages, self.codec, self.max_length, self.PUSH_CHUNK_SIZE)
+            pipe.execute()
+            logger.info(f"{len(messages)} messages saved in conversation {conv_id}")
+        except redis.RedisError as e:
+            logger.error(f"Error saving messages to Redis: {e}")
+            raise MessageStorageError(e)
+
+    @timed('redis', 'get_messages')
     def get_messages(self, conv_id: str) -> List[Dict]:
         try:
-            messages = self.redis_client.lrange(f"chat:{conv_id}", 0, -1)
-            return [json.loads(m) for m in messages]
+            messages = self.redis_client.lrange(messages_key(conv_id), 0, -1)
+            return [decode_message(m) for m in messages]
         except redis.RedisError as e:
             logger.error(f"Error receiving messages from Redis: {e}")
             raise MessageRetrievalError(e)
-        except json.JSONDecodeError as e:
+        except MessageDecodeError as e:
             logger.error(f"Message deserialization error: {e}")
             raise MessageRetrievalError(e)
 
+    @timed('redis', 'get_messages_by_user_id')
     def get_messages_by_user_id(self,conv_id: str, user_id: int) -> list[Dict]:
         try:
-            raw_messages = self.redis_client.lrange(f"chat:{conv_id}", 0, -1)
-            messages = [json.loads(m) for m in raw_messages]
+            index = sender_index_key(conv_id, user_id)
+            ids = self.redis_client.zrange(index, 0, -1)
+            if not ids:
+                return []
+            messages, stale = resolve_indexed(ids, self.redis_client.hmget(message_payloads_key(conv_id), ids))
+            if stale:
+                self.redis_client.zrem(index, *stale)
+            return messages
+        except redis.RedisError as e:
+            logger.error(f"Error receiving messages from Redis: {e}")
+            raise MessageRetrievalError(e)
+        except (MessageDecodeError, KeyError, ValueError) as e:
+            logger.error(f"Message deserialization error: {e}")
+            raise MessageRetrievalError(e)
 
-            if messages:
-                return [m for m in messages if int(m.get("sender")) == user_id]
+    @timed('redis', 'get_latest_messages')
+    def get_latest_messages(self, conv_id: str, limit: int) -> List[Dict]:
+        try:
+            messages = self.redis_client.lrange(messages_key(conv_id), -limit, -1)
+            return [decode_message(m) for m in messages]
+        except redis.RedisError as e:
+            logger.error(f"Error receiving messages from Redis: {e}")
+            raise MessageRetrievalError(e)
+        except MessageDecodeError as e:
+            logger.error(f"Message deserialization error: {e}")
+            raise MessageRetrievalError(e)
 
-            return []
+    @timed('redis', 'get_messages_before')
+    def get_messages_before(self, conv_id: str, before: str, limit: int) -> List[Dict]:
+        try:
+            chunk_size = max(limit, self.SCAN_CHUNK_SIZE)
+            return walk_messages(self.redis_client, messages_key(conv_id), page_before(before, limit, chunk_size))
         except redis.RedisError as e:
             logger.error(f"Error receiving messages from Redis: {e}")
             raise MessageRetrievalError(e)
-        except json.JSONDecodeError as e:
+        except (MessageDecodeError, KeyError, ValueError) as e:
             logger.error(f"Message deserialization error: {e}")
             raise MessageRetrievalError(e)
 
+    @timed('redis', 'clear_messages')
     def clear_messages(self, conv_id: str):
         try:
-            key = f"chat:{conv_id}"
-            deleted_count = self.redis_client.delete(key)
+            senders = self.redis_client.smembers(senders_key(conv_id))
+            keys = [messages_key(conv_id), senders_key(conv_id), message_ids_key(conv_id), message_payloads_key(conv_id)]
+            for sender in (s.decode('utf-8') for s in senders):
+                keys += [sender_index_key(conv_id, sender), legacy_sender_messages_key(conv_id, sender)]
+            deleted_count = self.redis_client.delete(*keys)
 
             if deleted_count:
                 logger.info(f"Cleared messages from Redis for conversation {conv_id}")
@@ -113,4 +341,266 @@ class RedisConsumerRepo(IConsumerRepo):
         except redis.RedisError as e:
             message = f"Redis error deleting set '{key}': {e}"
             logger.error(message)
-            raise MessageStorageError(message)
\ No newline at end of file
+            raise MessageStorageError(message)
+
+
+class RedisRateLimiterRepo(IRateLimiterRepo):
+    # Sliding window over a sorted set of send times, evaluated atomically on the
+    # server so concurrent workers can't race past the limit. Rejected attempts
+    # are not recorded, and the key expires once the user has been idle a minute.
+    HIT_SCRIPT = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    local per_second = tonumber(ARGV[1])
+    local per_minute = tonumber(ARGV[2])
+
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - 60000)
+    if per_second > 0 and redis.call('ZCOUNT', KEYS[1], now - 1000, '+inf') >= per_second then
+        return 1
+    end
+    if per_minute > 0 and redis.call('ZCARD', KEYS[1]) >= per_minute then
+        return 2
+    end
+
+    redis.call('ZADD', KEYS[1], now, ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], 60000)
+    return 0
+    """
+    EXCEEDED = {1: 'second', 2: 'minute'}
+
+    def __init__(self, redis_client: redis.Redis):
+        self.redis = redis_client
+        self._hit = self.redis.register_script(self.HIT_SCRIPT)
+
+    @timed('redis', 'hit')
+    def hit(self, key: str, per_second: int, per_minute: int) -> str | None:
+        try:
+            result = self._hit(keys=[key], args=[per_second, per_minute, uuid.uuid4().hex])
+            return self.EXCEEDED.get(int(result))
+        except redis.RedisError as e:
+            message = f"Redis error checking rate limit '{key}': {e}"
+            logger.error(message)
+            raise MessageStorageError(message)
+
+
+class RedisPresenceRepo(IPresenceRepo):
+    # presence:{conv} scores each user by their latest heartbeat on any connection,
+    # presence:{conv}:user:{id} scores that user's connections. A user is present
+    # while at least one connection has heartbeated within the TTL, so closing one
+    # tab doesn't remove a user who still has another open.
+    TOUCH_SCRIPT = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    local ttl = tonumber(ARGV[3])
+
+    redis.call('ZADD', KEYS[2], now, ARGV[2])
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - ttl)
+    redis.call('ZADD', KEYS[1], now, ARGV[1])
+    redis.call('PEXPIRE', KEYS[2], ttl)
+    redis.call('PEXPIRE', KEYS[1], ttl)
+    return redis.call('ZCARD', KEYS[2])
+    """
+    LEAVE_SCRIPT = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+    redis.call('ZREM', KEYS[2], ARGV[2])
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - tonumber(ARGV[3]))
+    local remaining = redis.call('ZCARD', KEYS[2])
+    if remaining == 0 then
+        redis.call('ZREM', KEYS[1], ARGV[1])
+    end
+    return remaining
+    """
+    # A user's score is their newest heartbeat, so a stale user has no live connection left
+    EXPIRE_SCRIPT = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    local cutoff = now - tonumber(ARGV[2])
+
+    local stale = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', cutoff)
+    for _, user in ipairs(stale) do
+        redis.call('DEL', ARGV[1] .. user)
+    end
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', cutoff)
+    return stale
+    """
+
+    def __init__(self, redis_client: redis.Redis, ttl: float):
+        self.redis = redis_client
+        self.ttl_ms = int(ttl * 1000)
+        self._touch = self.redis.register_script(self.TOUCH_SCRIPT)
+        self._leave = self.redis.register_script(self.LEAVE_SCRIPT)
+        self._expire = self.redis.register_script(self.EXPIRE_SCRIPT)
+
+    @timed('redis', 'touch')
+    def touch(self, conv_id: str, user_id: int | str, connection_id: str) -> int:
+        try:
+            keys = [presence_key(conv_id), presence_connections_key(conv_id, user_id)]
+            return int(self._touch(keys=keys, args=[user_id, connection_id, self.ttl_ms]))
+        except redis.RedisError as e:
+            message = f"Redis error updating presence in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageStorageError(message)
+
+    @timed('redis', 'leave')
+    def leave(self, conv_id: str, user_id: int | str, connection_id: str) -> int:
+        try:
+            keys = [presence_key(conv_id), presence_connections_key(conv_id, user_id)]
+            return int(self._leave(keys=keys, args=[user_id, connection_id, self.ttl_ms]))
+        except redis.RedisError as e:
+            message = f"Redis error removing presence in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageStorageError(message)
+
+    @timed('redis', 'expire')
+    def expire(self, conv_id: str) -> List[str]:
+        try:
+            stale = self._expire(keys=[presence_key(conv_id)],
+                                 args=[presence_connections_key(conv_id, ''), self.ttl_ms])
+            return [m.decode('utf-8') for m in stale]
+        except redis.RedisError as e:
+            message = f"Redis error expiring presence in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageStorageError(message)
+
+    @timed('redis', 'count')
+    def count(self, conv_id: str) -> int:
+        try:
+            return self.redis.zcard(presence_key(conv_id))
+        except redis.RedisError as e:
+            message = f"Redis error counting presence in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageRetrievalError(message)
+
+    @timed('redis', 'members')
+    def members(self, conv_id: str, offset: int = 0, limit: int | None = None) -> List[str]:
+        try:
+            end = -1 if limit is None else offset + limit - 1
+            return [m.decode('utf-8') for m in self.redis.zrevrange(presence_key(conv_id), offset, end)]
+        except redis.RedisError as e:
+            message = f"Redis error getting presence in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageRetrievalError(message)
+
+    def connection_count(self, conv_id: str, user_id: int | str) -> int:
+        try:
+            return self.redis.zcard(presence_connections_key(conv_id, user_id))
+        except redis.RedisError as e:
+            message = f"Redis error counting connections in {conv_id}: {e}"
+            logger.error(message)
+            raise MessageRetrievalError(message)
+
+
+class RedisConversationListRepo(IConversationListRepo):
+    INDEX_KEY = "conversations:index"
+    NAMES_KEY = "conversations:names"
+    VERSION_KEY = "conversations:version"
+    CHANGES_KEY = "conversations:changes"
+    # Marks the cache warm and carries its TTL. The version key never expires, so
+    # versions keep increasing across rebuilds and clients never see one go backwards.
+    WARM_KEY = "conversations:warm"
+
+    # Applies a create/delete to a warm cache and appends it to the change log under
+    # the new version. A cold cache is left alone; the next read rebuilds it from the DB.
+    APPLY_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return false
+    end
+    local version = redis.call('INCR', KEYS[2])
+    if ARGV[1] == 'joined' then
+        redis.call('ZADD', KEYS[3], ARGV[4], ARGV[2])
+        redis.call('HSET', KEYS[4], ARGV[2], ARGV[3])
+    else
+        redis.call('ZREM', KEYS[3], ARGV[2])
+        redis.call('HDEL', KEYS[4], ARGV[2])
+    end
+    redis.call('RPUSH', KEYS[5], version .. ':' .. ARGV[5])
+    redis.call('LTRIM', KEYS[5], -tonumber(ARGV[6]), -1)
+    return version
+    """
+
+    def __init__(self, redis_client: redis.Redis, changes_limit: int = 1000, ttl: int | None = None):
+        self.redis = redis_client
+        self.changes_limit = changes_limit
+        # Bounds drift from changes made outside the notifier (admin, shell): the next read rebuilds
+        self.ttl = ttl
+        self._apply = self.redis.register_script(self.APPLY_SCRIPT)
+
+    def get_page(self, offset: int, limit: int) -> Dict | None:
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.exists(self.WARM_KEY)
+            pipe.get(self.VERSION_KEY)
+            pipe.zcard(self.INDEX_KEY)
+            pipe.zrevrange(self.INDEX_KEY, offset, offset + limit - 1)
+            warm, version, total, ids = pipe.execute()
+            if not warm or version is None:
+                return None
+
+            names = self.redis.hmget(self.NAMES_KEY, ids) if ids else []
+            conversations = [
+                {'id': conv_id.decode('utf-8'), 'name': name.decode('utf-8')}
+                for conv_id, name in zip(ids, names) if name is not None
+            ]
+            return {'version': int(version), 'total': total, 'conversations': conversations}
+        except redis.RedisError as e:
+            message = f"Redis error reading conversation list: {e}"
+            logger.error(message)
+            raise MessageRetrievalError(message)
+
+    def rebuild(self, conversations: List[Dict]) -> int:
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(self.INDEX_KEY, self.NAMES_KEY, self.CHANGES_KEY)
+            pipe.incr(self.VERSION_KEY)
+            if conversations:
+                pipe.zadd(self.INDEX_KEY, {c['id']: c['created_at'] for c in conversations})
+                pipe.hset(self.NAMES_KEY, mapping={c['id']: c['name'] for c in conversations})
+            pipe.set(self.WARM_KEY, 1, ex=self.ttl or None)
+            version = pipe.execute()[1]
+            logger.info(f"Conversation list cache rebuilt with {len(conversations)} conversations")
+            return version
+        except redis.RedisError as e:
+            message = f"Redis error rebuilding conversation list: {e}"
+            logger.error(message)
+            raise MessageStorageError(message)
+
+    def apply_change(self, status: str, conversation: Dict) -> int | None:
+        try:
+            change = json.dumps({'status': status, 'id': conversation['id'], 'name': conversation.get('name')})
+            version = self._apply(
+                keys=[self.WARM_KEY, self.VERSION_KEY, self.INDEX_KEY, self.NAMES_KEY, self.CHANGES_KEY],
+                args=[status, conversation['id'], conversation.get('name') or '',
+                      conversation.get('created_at') or 0, change, self.changes_limit]
+            )
+            return int(version) if version is not None else None
+        except redis.RedisError as e:
+            message = f"Redis error updating conversation list: {e}"
+            logger.error(message)
+            raise MessageStorageError(message)
+
+    def get_changes(self, since: int) -> Dict | None:
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.exists(self.WARM_KEY)
+            pipe.get(self.VERSION_KEY)
+            pipe.lrange(self.CHANGES_KEY, 0, -1)
+            warm, version, raw_changes = pipe.execute()
+            if not warm or version is None or since > int(version):
+                return None
+
+            changes = []
+            for raw in raw_changes:
+                change_version, payload = raw.decode('utf-8').split(':', 1)
+                changes.append({'version': int(change_version), **json.loads(payload)})
+
+            # The log is capped and reset on rebuild; a client further behind needs a full page
+            oldest = changes[0]['version'] if changes else int(version) + 1
+            if since < oldest - 1:
+                return None
+            return {'version': int(version), 'changes': [c for c in changes if c['version'] > since]}
+        except redis.RedisError as e:
+            message = f"Redis error reading conversation changes: {e}"
+            logger.error(message)
+            raise MessageRetrievalError(message)
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from apps.chats.exceptions import MessageValidationError, MessageStorageError, MessageRetrievalError, \
+    TooManyMessageException, ConversationNotFoundError
+from apps.chats.ids import uuid7
+from apps.chats.metrics import timed
+from apps.chats.repositories.inter import IAsyncMessageRepo, IAsyncPresenceRepo, IAsyncRateLimiterRepo
+from apps.chats.services.chat_services import ChatService
+from apps.chats.utils import create_cursor
+
+logger = logging.getLogger(__name__)
+MyUser = get_user_model()
+
+
+class AsyncChatService:
+    def __init__(self,
+                 chat_service: ChatService,
+                 redis_repo: IAsyncMessageRepo,
+                 presence_repo: IAsyncPresenceRepo,
+                 rate_limiter_repo: IAsyncRateLimiterRepo | None = None
+                 ):
+        self.chat_service = chat_service
+        self.user_repo = chat_service.user_repo
+        self.db_repo = chat_service.db_repo
+        self.redis_repo = redis_repo
+        self.presence_repo = presence_repo
+        self.rate_limiter_repo = rate_limiter_repo
+
+    @timed('async_service', 'conversation_exists')
+    async def conversation_exists(self, conv_id: str) -> bool:
+        exists = self.chat_service.cached_conversation_exists(conv_id)
+        if exists is False:
+            raise ConversationNotFoundError(conv_id)
+        if exists is None:
+            await database_sync_to_async(self.chat_service.load_conversation_title)(conv_id)
+        return True
+
+    async def get_conversations_page(self, offset: int = 0, limit: int | None = None) -> dict:
+        return await database_sync_to_async(self.chat_service.get_conversations_page)(offset, limit)
+
+    async def get_conversation_changes(self, since: int) -> dict | None:
+        return await database_sync_to_async(self.chat_service.get_conversation_changes)(since)
+
+    @timed('async_service', 'send_message')
+    async def send_message(self, conv_id: str, sender_id: int, text: str) -> Dict:
+        try:
+            # The id is generated once here and shared by Redis, the database and the broadcast
+            now = datetime.now(timezone.utc)
+            message = {
+                'id': str(uuid7(now)),
+                'sender': sender_id,
+                'text': text,
+                'timestamp': now.isoformat()
+            }
+            await self.redis_repo.push_message(conv_id, message)
+            await database_sync_to_async(self.db_repo.push_message)(conv_id, message)
+            logger.info(f"Message sent to conversation {conv_id}")
+            return message
+        except (MessageValidationError, MessageStorageError) as e:
+            logger.error(f"Storage error: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error sending message: {e}")
+            raise
+
+    @timed('async_service', 'get_history')
+    async def get_history(self, conv_id: str, before: str | None = None, limit: int | None = None) -> list:
+        limit = limit or settings.CHAT_HISTORY_PAGE_SIZE
+        try:
+            if before is None:
+                messages = await self.redis_repo.get_latest_messages(conv_id, limit)
+                if not messages:
+                    messages = await database_sync_to_async(self.db_repo.get_latest_messages)(conv_id, limit)
+                    if messages:
+                        await self.redis_repo.push_messages(conv_id, messages)
+                    logger.info(f"Latest messages retrieved from database and cached in Redis: {conv_id}")
+                return messages
+
+            messages = await self.redis_repo.get_messages_before(conv_id, before, limit)
+            if len(messages) < limit:
+                oldest = create_cursor(messages[0]) if messages else before
+                older = await database_sync_to_async(self.db_repo.get_messages_before)(
+                    conv_id, oldest, limit - len(messages)
+                )
+                messages = older + messages
+            logger.info(f"History page retrieved for {conv_id} before {before}")
+            return messages
+        except MessageRetrievalError as e:
+            logger.error(f"Retrieval error while loading history: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error loading history: {e}")
+            raise
+
+    # Messages after a reconnecting client's cursor, or None when they can't be served
+    # from the cache and the client needs the latest page instead
+    async def get_messages_since(self, conv_id: str, since: str, limit: int | None = None) -> list | None:
+        try:
+            return await self.redis_repo.get_messages_after(conv_id, since, limit or settings.CHAT_RESUME_LIMIT)
+        except MessageRetrievalError as e:
+            logger.error(f"Error resuming {conv_id} from {since}: {e}")
+            return None
+
+    @timed('async_service', 'get_history_since')
+    async def get_history_since(self, conv_id: str, since: str | None = None,
+                                limit: int | None = None) -> tuple[list, bool]:
+        if since:
+            messages = await self.get_messages_since(conv_id, since)
+            if messages is not None:
+                logger.info(f"Resumed {conv_id} from {since} with {len(messages)} messages")
+                return messages, True
+        return await self.get_history(conv_id, limit=limit), False
+
+    @timed('async_service', 'get_snapshot')
+    async def get_snapshot(self, conv_id: str, limit: int | None = None, users_limit: int | None = None,
+                           since: str | None = None) -> tuple[list, int, list, bool]:
+        users, users_count, (messages, resumed) = await asyncio.gather(
+            self.get_active_users(conv_id, users_limit),
+            self.count_active_users(conv_id),
+            self.get_history_since(conv_id, since, limit)
+        )
+        return users, users_count, messages, resumed
+
+    def get_throttle_limits(self, conv_id: str) -> tuple[int, int]:
+        return self.chat_service.get_throttle_limits(conv_id)
+
+    @timed('async_service', 'check_throttling_message')
+    async def check_throttling_message(self, per_second: int, per_minute: int, user_id: int,
+                                       conv_id: str) -> None:
+        if self.rate_limiter_repo is None:
+            return await database_sync_to_async(self.chat_service.check_throttling_message)(
+                per_second, per_minute, user_id, conv_id
+            )
+
+        try:
+            exceeded = await self.rate_limiter_repo.hit(f'throttle:{conv_id}:{user_id}', per_second, per_minute)
+        except Exception as e:
+            logger.error(f"Error checking rate limit: {e}")
+            return None
+
+        if exceeded:
+            raise TooManyMessageException(f"Too many messages per {exceeded}")
+        return None
+
+    @timed('async_service', 'add_active_user')
+    async def add_active_user(self, conv_id: str, user_id: int, connection_id: str) -> bool:
+        try:
+            connections = await self.presence_repo.touch(conv_id, user_id, connection_id)
+            logger.info(f"Added user {user_id} to active in {conv_id}")
+            return connections == 1
+        except Exception as e:
+            logger.error(f"Error adding active user: {e}")
+            raise e
+
+    @timed('async_service', 'refresh_active_user')
+    async def refresh_active_user(self, conv_id: str, user_id: int, connection_id: str) -> list[str]:
+        try:
+            await self.presence_repo.touch(conv_id, user_id, connection_id)
+            expired = await self.presence_repo.expire(conv_id)
+            if expired:
+                logger.info(f"Expired stale users {expired} in {conv_id}")
+            return expired
+        except Exception as e:
+            logger.error(f"Error refreshing active user: {e}")
+            raise e
+
+    @timed('async_service', 'remove_active_user')
+    async def remove_active_user(self, conv_id: str, user_id: int, connection_id: str) -> bool:
+        try:
+            connections = await self.presence_repo.leave(conv_id, user_id, connection_id)
+            logger.info(f"Removed user {user_id} from active in {conv_id}")
+            return connections == 0
+        except Exception as e:
+            logger.error(f"Error removing active user: {e}")
+            raise e
+
+    async def get_active_user_ids(self, conv_id: str, offset: int = 0, limit: int | None = None) -> list[str]:
+        try:
+            return await self.presence_repo.members(conv_id, offset, limit)
+        except Exception as e:
+            logger.error(f"Error getting active user IDs: {e}")
+            raise e
+
+    async def count_active_users(self, conv_id: str) -> int:
+        try:
+            return await self.presence_repo.count(conv_id)
+        except Exception as e:
+            logger.error(f"Error counting active users: {e}")
+            raise e
+
+    @timed('async_service', 'get_active_users')
+    async def get_active_users(self, conv_id: str, limit: int | None = None) -> list[MyUser]:
+        try:
+            user_ids = await self.get_active_user_ids(conv_id, limit=limit)
+            if not user_ids:
+                return []
+            users = await database_sync_to_async(
+                lambda: list(self.user_repo.filter(id__in=[int(uid) for uid in user_ids]))
+            )()
+            logger.info(f"Retrieved active users for {conv_id}")
+            return users
+        except Exception as e:
+            logger.error(f"Error getting active users: {e}")
+            raise e
+
+    @timed('async_service', 'cleanup_conversation_if_empty')
+    async def cleanup_conversation_if_empty(self, conv_id: str):
+        try:
+            if not await self.count_active_users(conv_id):
+                await self.redis_repo.clear_messages(conv_id)
+                logger.info(f"Cleaned up Redis cache for empty conversation {conv_id}")
+        except Exception as e:
+            logger.error(f"Error during cleanup: {e}")
@@ -1,16 +1,21 @@
 import logging
 from datetime import datetime, timedelta, timezone
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.db.models.manager import Manager
 from django.utils.dateparse import parse_datetime
 
+from apps.chats.conversation_cache import ConversationCache
 from apps.chats.models import Conversation
-from apps.chats.repositories.inter import IMessageRepo, IConsumerRepo
+from apps.chats.repositories.inter import IMessageRepo, IConsumerRepo, IRateLimiterRepo, IPresenceRepo, \
+    IConversationListRepo
 from apps.chats.exceptions import MessageValidationError, MessageStorageError, MessageRetrievalError, \
     ConversationNotFoundError, TooManyMessageException
-from apps.chats.utils import parse_iso_aware
+from apps.chats.ids import uuid7
+from apps.chats.metrics import timed
+from apps.chats.utils import parse_iso_aware, create_cursor
 
 logger = logging.getLogger(__name__)
 MyUser = get_user_model()
@@ -21,13 +26,21 @@ class ChatService:
                  conversation_repo: Manager, 
                  redis_repo: IMessageRepo, 
                  db_repo: IMessageRepo,
-                 redis_consumer_repo: IConsumerRepo
+                 redis_consumer_repo: IConsumerRepo,
+                 rate_limiter_repo: IRateLimiterRepo | None = None,
+                 presence_repo: IPresenceRepo | None = None,
+                 conversation_list_repo: IConversationListRepo | None = None,
+                 conversation_cache: ConversationCache | None = None
                  ):
         self.user_repo = user_repo
         self.conversation_repo = conversation_repo
         self.redis_repo = redis_repo
         self.db_repo = db_repo
         self.redis_consumer_repo = redis_consumer_repo
+        self.rate_limiter_repo = rate_limiter_repo
+        self.presence_repo = presence_repo
+        self.conversation_list_repo = conversation_list_repo
+        self.conversation_cache = conversation_cache
 
     def create_conversation(self, title: str | None = None) -> str:
         try:
@@ -73,16 +86,21 @@ class ChatService:
             logger.error(f"Error leaving conversation {conv_id} for user {user_id}: {e}")
             raise
 
-    def send_message(self, conv_id: str, sender_id: int, text: str):
+    @timed('service', 'send_message')
+    def send_message(self, conv_id: str, sender_id: int, text: str) -> dict:
         try:
+            # The id is generated once here and shared by Redis, the database and the broadcast
+            now = datetime.now(timezone.utc)
             message = {
+                'id': str(uuid7(now)),
                 'sender': sender_id,
                 'text': text,
-                'timestamp': datetime.now(timezone.utc).isoformat()
+                'timestamp': now.isoformat()
             }
             self.redis_repo.push_message(conv_id, message)
             self.db_repo.push_message(conv_id, message)
             logger.info(f"Message sent to conversation {conv_id}")
+            return message
         except (MessageValidationError, MessageStorageError) as e:
             logger.error(f"Storage error: {e}")
             raise
@@ -102,11 +120,11 @@ class ChatService:
             logger.error(f"Unexpected error retrieving messages from Redis: {e}")
             raise
 
+    @timed('service', 'get_messages_from_db')
     def get_messages_from_db(self, conv_id: str) -> list:
         try:
             messages = self.db_repo.get_messages(conv_id)
-            for msg in messages:
-                self.redis_repo.push_message(conv_id, msg)
+            self.redis_repo.push_messages(conv_id, messages)
             logger.info(f"Messages retrieved from database and cached in Redis: {conv_id}")
             return messages
         except MessageRetrievalError as e:
@@ -116,18 +134,77 @@ class ChatService:
             logger.error(f"Unexpected error retrieving messages from database: {e}")
             raise
 
+    @timed('service', 'get_history')
+    def get_history(self, conv_id: str, before: str | None = None, limit: int | None = None) -> list:
+        limit = limit or settings.CHAT_HISTORY_PAGE_SIZE
+        try:
+            if before is None:
+                messages = self.redis_repo.get_latest_messages(conv_id, limit)
+                if not messages:
+                    messages = self.db_repo.get_latest_messages(conv_id, limit)
+                    if messages:
+                        self.redis_repo.push_messages(conv_id, messages)
+                    logger.info(f"Latest messages retrieved from database and cached in Redis: {conv_id}")
+                return messages
+
+            messages = self.redis_repo.get_messages_before(conv_id, before, limit)
+            if len(messages) < limit:
+                # Redis only holds a contiguous tail of the history, so anything
+                # older than what it returned has to come from the database.
+                oldest = create_cursor(messages[0]) if messages else before
+                messages = self.db_repo.get_messages_before(conv_id, oldest, limit - len(messages)) + messages
+            logger.info(f"History page retrieved for {conv_id} before {before}")
+            return messages
+        except MessageRetrievalError as e:
+            logger.error(f"Retrieval error while loading history: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error loading history: {e}")
+            raise
+
     def conversation_exists(self, conv_id: str) -> bool:
+        self.get_conversation_title(conv_id)
+        return True
+
+    def get_conversation_title(self, conv_id: str) -> str:
+        # One read: the entry can be invalidated or expire between two
+        cached = self.conversation_cache.get(conv_id) if self.conversation_cache is not None else None
+        if cached is None:
+            return self.load_conversation_title(conv_id)
+        if not cached.exists:
+            raise ConversationNotFoundError(conv_id)
+        return cached.title
+
+    # True/False from the cache, None when it has to be looked up
+    def cached_conversation_exists(self, conv_id: str) -> bool | None:
+        if self.conversation_cache is None:
+            return None
+        cached = self.conversation_cache.get(conv_id)
+        return None if cached is None else cached.exists
+
+    @timed('service', 'load_conversation_title')
+    def load_conversation_title(self, conv_id: str) -> str:
+        generation = self.conversation_cache.start_lookup() if self.conversation_cache is not None else None
         try:
-            self.conversation_repo.get(id=conv_id)
-            logger.info(f"Conversation {conv_id} exists")
-            return True
-        except Conversation.DoesNotExist:
-            logger.error(f"Conversation {conv_id} does not exist")
+            conversation = self.conversation_repo.get(id=conv_id)
+        except (Conversation.DoesNotExist, ValidationError):
+            if self.conversation_cache is not None:
+                self.conversation_cache.set_missing(conv_id, generation)
+            logger.info(f"Conversation {conv_id} does not exist")
             raise ConversationNotFoundError(conv_id)
         except Exception as e:
             logger.error(f"Error checking conversation {conv_id} existence: {e}")
             raise e
 
+        title = conversation.get_title()
+        if self.conversation_cache is not None:
+            self.conversation_cache.set_found(conv_id, title, generation)
+        return title
+
+    def forget_conversation(self, conv_id: str):
+        if self.conversation_cache is not None:
+            self.conversation_cache.invalidate(conv_id)
+
     def get_all_conversations(self) -> list:
         try:
             conversations = self.conversation_repo.all()
@@ -136,32 +213,117 @@ class ChatService:
             logger.error(f"Error retrieving all conversations: {e}")
             raise e
 
-    def add_active_user(self, conv_id: str, user_id: int):
-        key = f'active_users:{conv_id}'
+    @timed('service', 'get_conversations_page')
+    def get_conversations_page(self, offset: int = 0, limit: int | None = None) -> dict:
+        limit = limit or settings.CHAT_CONVERSATIONS_PAGE_SIZE
+        if self.conversation_list_repo is not None:
+            try:
+                page = self.conversation_list_repo.get_page(offset, limit)
+                if page is None:
+                    conversations = self._load_conversation_list()
+                    version = self.conversation_list_repo.rebuild(conversations)
+                    page = self._conversation_page(conversations, offset, limit, version)
+                page['has_more'] = offset + len(page['conversations']) < page['total']
+                return page
+            except (MessageRetrievalError, MessageStorageError) as e:
+                logger.error(f"Conversation list cache unavailable: {e}")
+
+        page = self._conversation_page(self._load_conversation_list(), offset, limit, None)
+        page['has_more'] = offset + len(page['conversations']) < page['total']
+        return page
+
+    def get_conversation_changes(self, since: int) -> dict | None:
+        if self.conversation_list_repo is None:
+            return None
+        try:
+            return self.conversation_list_repo.get_changes(since)
+        except MessageRetrievalError as e:
+            logger.error(f"Conversation list cache unavailable: {e}")
+            return None
+
+    def record_conversation_added(self, conversation: Conversation) -> int | None:
+        return self._record_conversation_change('joined', self._conversation_entry(conversation))
+
+    def record_conversation_removed(self, conv_id: str) -> int | None:
+        return self._record_conversation_change('left', {'id': str(conv_id)})
+
+    def _record_conversation_change(self, status: str, entry: dict) -> int | None:
+        if self.conversation_list_repo is None:
+            return None
+        try:
+            return self.conversation_list_repo.apply_change(status, entry)
+        except MessageStorageError as e:
+            logger.error(f"Error updating conversation list cache: {e}")
+            return None
+
+    def _load_conversation_list(self) -> list[dict]:
+        conversations = self.conversation_repo.order_by('-created_at').only('id', 'title', 'created_at')
+        return [self._conversation_entry(conv) for conv in conversations]
+
+    @staticmethod
+    def _conversation_entry(conversation: Conversation) -> dict:
+        return {
+            'id': str(conversation.id),
+            'name': f"Chat {conversation.get_title()}",
+            'created_at': conversation.created_at.timestamp() if conversation.created_at else 0
+        }
+
+    @staticmethod
+    def _conversation_page(conversations: list[dict], offset: int, limit: int, version: int | None) -> dict:
+        return {
+            'version': version,
+            'total': len(conversations),
+            'conversations': [{'id': c['id'], 'name': c['name']} for c in conversations[offset:offset + limit]]
+        }
+
+    # Without a connection id (e.g. joins made through the API) the user counts as one connection
+    @timed('service', 'add_active_user')
+    def add_active_user(self, conv_id: str, user_id: int, connection_id: str | None = None) -> int:
         try:
-            self.redis_consumer_repo.add_to_set(key, str(user_id))
+            if self.presence_repo is not None:
+                connections = self.presence_repo.touch(conv_id, user_id, connection_id or f'user:{user_id}')
+            else:
+                self.redis_consumer_repo.add_to_set(f'active_users:{conv_id}', str(user_id))
+                connections = 1
             logger.info(f"Added user {user_id} to active in {conv_id}")
+            return connections
         except Exception as e:
             logger.error(f"Error adding active user: {e}")
             raise e
 
-    def remove_active_user(self, conv_id: str, user_id: int):
-        key = f'active_users:{conv_id}'
+    @timed('service', 'remove_active_user')
+    def remove_active_user(self, conv_id: str, user_id: int, connection_id: str | None = None) -> int:
         try:
-            self.redis_consumer_repo.remove_from_set(key, str(user_id))
+            if self.presence_repo is not None:
+                connections = self.presence_repo.leave(conv_id, user_id, connection_id or f'user:{user_id}')
+            else:
+                self.redis_consumer_repo.remove_from_set(f'active_users:{conv_id}', str(user_id))
+                connections = 0
             logger.info(f"Removed user {user_id} from active in {conv_id}")
+            return connections
         except Exception as e:
             logger.error(f"Error removing active user: {e}")
             raise e
 
-    def get_active_user_ids(self, conv_id: str) -> list[str]:
-        key = f'active_users:{conv_id}'
+    def get_active_user_ids(self, conv_id: str, offset: int = 0, limit: int | None = None) -> list[str]:
         try:
-            return self.redis_consumer_repo.get_set_members(key)
+            if self.presence_repo is not None:
+                return self.presence_repo.members(conv_id, offset, limit)
+            user_ids = self.redis_consumer_repo.get_set_members(f'active_users:{conv_id}')
+            return user_ids[offset:] if limit is None else user_ids[offset:offset + limit]
         except Exception as e:
             logger.error(f"Error getting active user IDs: {e}")
             raise e
 
+    def count_active_users(self, conv_id: str) -> int:
+        try:
+            if self.presence_repo is not None:
+                return self.presence_repo.count(conv_id)
+            return len(self.redis_consumer_repo.get_set_members(f'active_users:{conv_id}'))
+        except Exception as e:
+            logger.error(f"Error counting active users: {e}")
+            raise e
+
     def get_active_users(self, conv_id: str) -> list[MyUser]:
         try:
             user_ids = self.get_active_user_ids(conv_id)
@@ -174,8 +336,16 @@ class ChatService:
             logger.error(f"Error getting active users: {e}")
             raise e
 
+    def get_throttle_limits(self, conv_id: str) -> tuple[int, int]:
+        per_second, per_minute = settings.CHAT_THROTTLE_OVERRIDES.get(str(conv_id), settings.CHAT_THROTTLE_LIMITS)
+        return per_second, per_minute
+
+    @timed('service', 'check_throttling_message')
     def check_throttling_message(self, per_second: int, per_minute: int, user_id: int,
                                  conv_id: str) -> Exception | None:
+        if self.rate_limiter_repo is not None:
+            return self._check_rate_limit(per_second, per_minute, user_id, conv_id)
+
         try:
             now = datetime.now(timezone.utc)
             messages = self.redis_repo.get_messages_by_user_id(conv_id, user_id)
@@ -203,13 +373,24 @@ class ChatService:
         except Exception as e:
             logger.error(e)
 
+    def _check_rate_limit(self, per_second: int, per_minute: int, user_id: int, conv_id: str) -> None:
+        try:
+            exceeded = self.rate_limiter_repo.hit(f'throttle:{conv_id}:{user_id}', per_second, per_minute)
+        except Exception as e:
+            logger.error(f"Error checking rate limit: {e}")
+            return None
+
+        if exceeded:
+            raise TooManyMessageException(f"Too many messages per {exceeded}")
+        return None
+
+    @timed('service', 'cleanup_conversation_if_empty')
     def cleanup_conversation_if_empty(self, conv_id: str):
         try:
-            active_users = self.get_active_user_ids(conv_id)
-            if not active_users:
+            if not self.count_active_users(conv_id):
                 self.redis_repo.clear_messages(conv_id)
-                key = f'active_users:{conv_id}'
-                self.redis_consumer_repo.delete_set(key)
+                if self.presence_repo is None:
+                    self.redis_consumer_repo.delete_set(f'active_users:{conv_id}')
                 logger.info(f"Cleaned up Redis cache for empty conversation {conv_id}")
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
\ No newline at end of file
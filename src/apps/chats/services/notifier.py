@@ -1,19 +1,34 @@
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 
+from apps.chats.models import Conversation
+
+
+# The services are imported on first use so that importing views doesn't wire up Redis clients
 class ConversationNotifier:
     @classmethod
-    def broadcast_conversations_add(cls, _id: str):
+    def broadcast_conversations_add(cls, conversation: Conversation):
+        from apps.chats.consumers.config import chat_service
+        chat_service.forget_conversation(str(conversation.id))
+        version = chat_service.record_conversation_added(conversation)
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
             "conversations",
-            {"type": "add_conversation", "id": _id}
+            {
+                "type": "add_conversation",
+                "id": str(conversation.id),
+                "name": f"Chat {conversation.get_title()}",
+                "version": version
+            }
         )
 
     @classmethod
     def broadcast_conversations_remove(cls, _id: str):
+        from apps.chats.consumers.config import chat_service
+        chat_service.forget_conversation(_id)
+        version = chat_service.record_conversation_removed(_id)
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
             "conversations",
-            {"type": "remove_conversation", "id": _id}
-        )
\ No newline at end of file
+            {"type": "remove_conversation", "id": _id, "version": version}
+        )
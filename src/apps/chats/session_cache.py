@@ -0,0 +1,248 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict
+
+import redis
+from django.contrib.auth import get_user_model
+
+from apps.chats.invalidation import InvalidationChannel
+from apps.chats.metrics import Counter, Gauge
+from loggers import get_redis_logger
+
+logger = get_redis_logger()
+MyUser = get_user_model()
+
+
+def session_user_key(session_key: str) -> str:
+    return f"session_user:{session_key}"
+
+def user_sessions_key(user_id: int | str) -> str:
+    return f"session_user:user:{user_id}"
+
+INVALIDATION_CHANNEL = 'session_user:invalidate'
+
+
+# Maps session keys to a snapshot of the logged-in user so WebSocket handshakes
+# don't need a Session and a user query each. The in-process LRU is checked first;
+# the optional shared layer keeps snapshots in Redis for all workers. Logout and user
+# saves are published on INVALIDATION_CHANNEL and every process drops its own copy,
+# so a logged-out or deactivated user isn't authenticated from another worker's LRU.
+# Without a Redis client the cache is local only, which is only safe for a single process.
+class SessionUserCache:
+    SNAPSHOT_FIELDS = ('id', 'email', 'first_name', 'last_name', 'is_active', 'is_admin', 'color', 'avatar')
+
+    def __init__(self, max_size: int = 10000, ttl: float = 30, redis_client: redis.Redis | None = None,
+                 redis_ttl: int = 300, shared: bool = True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis = redis_client
+        self.redis_ttl = redis_ttl
+        self.shared = shared and redis_client is not None
+        self._entries: OrderedDict[str, tuple[float, Dict]] = OrderedDict()
+        self._sessions_by_user: Dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+        self.invalidations = InvalidationChannel(redis_client, INVALIDATION_CHANNEL, self._on_invalidation, self.clear)
+        # Bumped by every invalidation; a lookup started before one doesn't store its result
+        self.generation = 0
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> Dict:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    # In-process lookup only, safe to call from the event loop
+    def get(self, session_key: str) -> MyUser | None:
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is None:
+                return None
+            expires_at, snapshot = entry
+            if expires_at <= time.monotonic():
+                self._remove(session_key)
+                return None
+            self._entries.move_to_end(session_key)
+            self.hits += 1
+        return self._build_user(snapshot)
+
+    # Called before the database lookup, so the subscription is in place before the
+    # snapshot that will be stored is read
+    def get_shared(self, session_key: str) -> MyUser | None:
+        self.invalidations.subscribe()
+        if self.shared:
+            try:
+                generation = self.generation
+                raw = self.redis.get(session_user_key(session_key))
+                if raw is not None:
+                    snapshot = json.loads(raw)
+                    self._store(session_key, snapshot, self.ttl, generation)
+                    self.shared_hits += 1
+                    return self._build_user(snapshot)
+            except (redis.RedisError, ValueError) as e:
+                logger.error(f"Error reading session cache from Redis: {e}")
+
+        self.misses += 1
+        return None
+
+    # Pass the generation read before loading `user`: if an invalidation came in since,
+    # the snapshot may already be stale and isn't cached.
+    def set(self, session_key: str, user: MyUser, session_expires_at: datetime | None = None,
+            generation: int | None = None):
+        if generation is not None and generation != self.generation:
+            return
+        snapshot = {field: self._field_value(user, field) for field in self.SNAPSHOT_FIELDS}
+        ttl, redis_ttl = self.ttl, self.redis_ttl
+        if session_expires_at is not None:
+            remaining = (session_expires_at - datetime.now(session_expires_at.tzinfo)).total_seconds()
+            if remaining <= 0:
+                return
+            ttl, redis_ttl = min(ttl, remaining), min(redis_ttl, int(remaining) or 1)
+
+        self._store(session_key, snapshot, ttl, generation)
+        if self.shared:
+            try:
+                pipe = self.redis.pipeline(transaction=True)
+                pipe.set(session_user_key(session_key), json.dumps(snapshot), ex=redis_ttl)
+                pipe.sadd(user_sessions_key(user.id), session_key)
+                pipe.expire(user_sessions_key(user.id), self.redis_ttl)
+                pipe.execute()
+            except redis.RedisError as e:
+                logger.error(f"Error writing session cache to Redis: {e}")
+
+    def invalidate(self, session_key: str):
+        self._drop_session(session_key)
+        if self.redis is not None:
+            try:
+                if self.shared:
+                    self.redis.delete(session_user_key(session_key))
+                self.invalidations.publish(f'session:{session_key}')
+            except redis.RedisError as e:
+                logger.error(f"Error invalidating session cache in Redis: {e}")
+
+    def invalidate_user(self, user_id: int):
+        self._drop_user(user_id)
+        if self.redis is not None:
+            try:
+                if self.shared:
+                    session_keys = [k.decode('utf-8') for k in self.redis.smembers(user_sessions_key(user_id))]
+                    self.redis.delete(user_sessions_key(user_id), *[session_user_key(k) for k in session_keys])
+                self.invalidations.publish(f'user:{user_id}')
+            except redis.RedisError as e:
+                logger.error(f"Error invalidating session cache in Redis: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sessions_by_user.clear()
+            self.generation += 1
+
+    def close(self):
+        self.invalidations.close()
+        self.clear()
+
+    def _drop_session(self, session_key: str):
+        with self._lock:
+            self._remove(session_key)
+            self.generation += 1
+
+    def _drop_user(self, user_id: int):
+        with self._lock:
+            for session_key in list(self._sessions_by_user.get(user_id, ())):
+                self._remove(session_key)
+            self.generation += 1
+
+    def _on_invalidation(self, message: str):
+        kind, _, value = message.partition(':')
+        if kind == 'session':
+            self._drop_session(value)
+        elif kind == 'user':
+            self._drop_user(int(value))
+
+    def _store(self, session_key: str, snapshot: Dict, ttl: float, generation: int | None = None):
+        if not self.invalidations.subscribe():
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._remove(session_key)
+            self._entries[session_key] = (time.monotonic() + ttl, snapshot)
+            self._sessions_by_user.setdefault(snapshot['id'], set()).add(session_key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, session_key: str):
+        entry = self._entries.pop(session_key, None)
+        if entry is None:
+            return
+        user_id = entry[1]['id']
+        sessions = self._sessions_by_user.get(user_id)
+        if sessions is not None:
+            sessions.discard(session_key)
+            if not sessions:
+                del self._sessions_by_user[user_id]
+
+    @staticmethod
+    def _field_value(user: MyUser, field: str):
+        value = getattr(user, field)
+        # File fields are stored by name
+        return value.name if hasattr(value, 'name') else value
+
+    @staticmethod
+    def _build_user(snapshot: Dict) -> MyUser:
+        user = MyUser(**snapshot)
+        user._state.adding = False
+        return user
+
+
+_session_user_cache: SessionUserCache | None = None
+_session_user_cache_lock = threading.Lock()
+
+
+# Built on first use from consumers.config, so it uses the same Redis client as the
+# services and nothing connects at import time
+def get_session_user_cache() -> SessionUserCache:
+    global _session_user_cache
+    if _session_user_cache is None:
+        from apps.chats.consumers.config import build_session_user_cache, redis_client
+        with _session_user_cache_lock:
+            if _session_user_cache is None:
+                _session_user_cache = build_session_user_cache(redis_client)
+    return _session_user_cache
+
+
+# Replaces the process's cache, e.g. when consumers.config moves onto another Redis client
+def set_session_user_cache(cache: SessionUserCache):
+    global _session_user_cache
+    with _session_user_cache_lock:
+        previous, _session_user_cache = _session_user_cache, cache
+    if previous is not None:
+        previous.close()
+
+
+# Exported on the metrics endpoint, read from the process cache at scrape time
+def _session_cache_stat(name: str) -> int:
+    cache = _session_user_cache
+    return cache.stats()[name] if cache is not None else 0
+
+
+for _name, _kind, _help in (
+    ('size', Gauge, "Sessions held in this process's session cache"),
+    ('hits', Counter, "Handshakes authenticated from this process's session cache"),
+    ('shared_hits', Counter, "Handshakes authenticated from the session snapshots shared in Redis"),
+    ('misses', Counter, "Handshakes that had to load the session and user from the database"),
+    ('evictions', Counter, "Sessions evicted from this process's session cache to stay within its size"),
+):
+    _metric_name = f'chat_session_cache_{_name}' + ('_total' if _kind is Counter else '')
+    _kind(_metric_name, _help).set_function(lambda name=_name: _session_cache_stat(name))
@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model, user_logged_out
+from django.contrib.sessions.models import Session
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.chats.session_cache import get_session_user_cache
+
+MyUser = get_user_model()
+
+
+@receiver(user_logged_out)
+def invalidate_session_on_logout(sender, request, user, **kwargs):
+    if request is not None and request.session.session_key:
+        get_session_user_cache().invalidate(request.session.session_key)
+
+
+@receiver(post_delete, sender=Session)
+def invalidate_deleted_session(sender, instance, **kwargs):
+    get_session_user_cache().invalidate(instance.session_key)
+
+
+@receiver(post_save, sender=MyUser)
+@receiver(post_delete, sender=MyUser)
+def invalidate_user_sessions(sender, instance, **kwargs):
+    get_session_user_cache().invalidate_user(instance.id)
@@ -3,31 +3,75 @@ const hiddenInput = document.getElementById('user-id')
 const chatWsUrl = dashboard.dataset?.chatUrl || 'default';
 
 
-let socket = new WebSocket(chatWsUrl);
+let socket = null;
 let users = [];
 let currentUserId = hiddenInput.dataset.userId;
 let currentUser = undefined
 
 let messages = [];
+let hasMoreHistory = false;
+let loadingHistory = false;
+
+// The server sends at most one typing event per user every couple of seconds
+const TYPING_SEND_INTERVAL = 1000;
+const TYPING_DISPLAY_TIMEOUT = 5000;
+let typingUsers = new Map();
+let lastTypingSent = 0;
+
+// Cursor of the newest message received; sent on reconnect so only newer ones come back
+let lastCursor = null;
+// Sent messages the server has not acknowledged yet, resent after a reconnect
+let pendingMessages = new Map();
+let reconnectDelay = 1000;
+const MAX_RECONNECT_DELAY = 30000;
+// Close codes after which reconnecting can't succeed: login rejected, room deleted
+const AUTH_REJECTED_CLOSE_CODE = 4001;
+const NOT_FOUND_CLOSE_CODE = 4404;
+
+function connect() {
+    const url = lastCursor ? `${chatWsUrl}?since=${encodeURIComponent(lastCursor)}` : chatWsUrl;
+    socket = new WebSocket(url);
+    socket.onopen = onOpen;
+    socket.onmessage = onMessage;
+    socket.onclose = onClose;
+    socket.onerror = onError;
+}
 
-socket.onopen = function (event) {
+function onOpen(event) {
     console.log('WebSocket connected');
-};
+}
 
-socket.onmessage = function (event) {
+function onMessage(event) {
     const data = JSON.parse(event.data);
     console.log(data);
 
     switch (data.type) {
-        case 'history':
-            messages = data.messages || [];
-            displayMessages();
-            break;
-
-        case 'user_list':
+        case 'snapshot':
+            // Only a connection that got as far as its snapshot resets the backoff
+            reconnectDelay = 1000;
             users = data.users || [];
             initCurrentUser(users)
             displayUsers();
+            if (data.resumed) {
+                const known = new Set(messages.map(m => m.id));
+                messages = messages.concat((data.messages || []).filter(m => !m.id || !known.has(m.id)));
+            } else {
+                messages = data.messages || [];
+                hasMoreHistory = !!data.has_more;
+            }
+            lastCursor = data.cursor || lastCursor;
+            displayMessages();
+            resendPendingMessages(data.resumed ? data.messages || [] : messages);
+            break;
+
+        case 'ack':
+            pendingMessages.delete(data.client_id);
+            break;
+
+        case 'history_page':
+            prependMessages(data.messages || []);
+            hasMoreHistory = !!data.has_more;
+            loadingHistory = false;
             break;
 
         case 'user_status':
@@ -35,21 +79,53 @@ socket.onmessage = function (event) {
             break;
 
         case 'message':
+            lastCursor = messageCursor(data);
+            clearTyping(data.sender);
             addMessage(data);
             break;
+
+        case 'typing':
+            handleTyping(data);
+            break;
         case 'error_message':
+            pendingMessages.delete(data.client_id);
             showNotification(data.text)
             break;
     }
-};
+}
+
+function onClose(event) {
+    console.log('WebSocket disconnected', event.code);
+    if (event.code === NOT_FOUND_CLOSE_CODE) {
+        showNotification('This room no longer exists');
+        return;
+    }
+    if (event.code === AUTH_REJECTED_CLOSE_CODE) {
+        showNotification('Your session has expired, please log in again');
+        return;
+    }
 
-socket.onclose = function (event) {
-    console.log('WebSocket disconnected');
-};
+    // Jittered so clients dropped together don't reconnect together
+    setTimeout(connect, reconnectDelay / 2 + Math.random() * reconnectDelay / 2);
+    reconnectDelay = Math.min(reconnectDelay * 2, MAX_RECONNECT_DELAY);
+}
 
-socket.onerror = function (error) {
+function onError(error) {
     console.error('WebSocket error:', error);
-};
+}
+
+// Messages whose ack was lost may have been stored anyway: skip those that came back
+// in the snapshot and send the rest again
+function resendPendingMessages(received) {
+    pendingMessages.forEach((text, clientId) => {
+        const stored = received.some(m => m.sender === +currentUserId && m.text === text);
+        if (stored) {
+            pendingMessages.delete(clientId);
+        } else {
+            socket.send(JSON.stringify({text: text, client_id: clientId}));
+        }
+    });
+}
 
 function showNotification(message, type = 'error') {
     const notifier = document.getElementById('notifier');
@@ -120,6 +196,32 @@ function displayMessages() {
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
 }
 
+function prependMessages(olderMessages) {
+    const messagesContainer = document.getElementById('messages');
+    const previousHeight = messagesContainer.scrollHeight;
+
+    messages = olderMessages.concat(messages);
+    displayMessages();
+
+    messagesContainer.scrollTop = messagesContainer.scrollHeight - previousHeight;
+}
+
+// Same "<timestamp>|<id>" format as the cursors the server sends
+function messageCursor(msg) {
+    return `${msg.timestamp}|${msg.id || ''}`;
+}
+
+function loadMoreMessages() {
+    if (!hasMoreHistory || loadingHistory || !messages.length) return;
+    if (!socket || socket.readyState !== WebSocket.OPEN) return;
+
+    loadingHistory = true;
+    socket.send(JSON.stringify({
+        action: 'load_more',
+        before: messageCursor(messages[0])
+    }));
+}
+
 function initCurrentUser(users){
     currentUser = users.find(user => user.id === +currentUserId)
 }
@@ -146,6 +248,8 @@ function createMessageElement(msg) {
 }
 
 function addMessage(data) {
+    // A message can arrive both live and in a resumed snapshot
+    if (data.id && messages.some(m => m.id === data.id)) return;
     messages.push(data);
 
     const user = users.find(u => u.id === data.sender);
@@ -166,27 +270,84 @@ function handleUserStatus(data) {
         }
     } else if (data.status === 'left') {
         users = users.filter(u => u.id !== data.user.id);
+        clearTyping(data.user.id);
         displayUsers();
     }
 }
 
+function handleTyping(data) {
+    if (!data.typing) {
+        clearTyping(data.user_id);
+        return;
+    }
+    clearTimeout(typingUsers.get(data.user_id));
+    typingUsers.set(data.user_id, setTimeout(() => clearTyping(data.user_id), TYPING_DISPLAY_TIMEOUT));
+    displayTyping();
+}
+
+function clearTyping(userId) {
+    if (!typingUsers.has(userId)) return;
+    clearTimeout(typingUsers.get(userId));
+    typingUsers.delete(userId);
+    displayTyping();
+}
+
+function displayTyping() {
+    const names = [...typingUsers.keys()]
+        .map(id => users.find(u => u.id === id))
+        .filter(Boolean)
+        .map(u => u.first_name);
+
+    document.getElementById('typing-indicator').textContent =
+        names.length ? `${names.join(', ')} ${names.length === 1 ? 'is' : 'are'} typing...` : '';
+}
+
+function sendTyping(typing) {
+    if (!socket || socket.readyState !== WebSocket.OPEN) return;
+
+    const now = Date.now();
+    if (typing && now - lastTypingSent < TYPING_SEND_INTERVAL) return;
+    lastTypingSent = typing ? now : 0;
+
+    socket.send(JSON.stringify({
+        action: 'typing',
+        typing: typing
+    }));
+}
+
 function sendMessage() {
     const input = document.getElementById('messageInput');
     const text = input.value.trim();
 
     if (!text || !socket || socket.readyState !== WebSocket.OPEN) return;
 
+    const clientId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    pendingMessages.set(clientId, text);
     socket.send(JSON.stringify({
-        text: text
+        text: text,
+        client_id: clientId
     }));
 
     input.value = '';
+    lastTypingSent = 0;
     input.focus();
 }
 
+document.getElementById('messages').addEventListener('scroll', function () {
+    if (this.scrollTop === 0) {
+        loadMoreMessages();
+    }
+});
+
+document.getElementById('messageInput').addEventListener('input', function () {
+    sendTyping(this.value.length > 0);
+});
+
 document.getElementById('messageInput').addEventListener('keypress', function (e) {
     if (e.key === 'Enter' && !e.shiftKey) {
         e.preventDefault();
         sendMessage();
     }
-});
\ No newline at end of file
+});
+
+connect();
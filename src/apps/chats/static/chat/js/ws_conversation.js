@@ -10,37 +10,119 @@ socket.onmessage = function (event) {
     console.log("message from server:", event.data);
 };
 
+let conversationsVersion = null;
+let loadedConversations = 0;
+let hasMoreConversations = false;
+let loadingConversations = false;
+
+const loadMoreButton = document.getElementById("load-more");
+const conversationSelect = document.getElementById("chat-select");
+
 socket.onmessage = function (event) {
     console.log("message_resive:", event.data);
 
     let data = JSON.parse(event.data);
+    if (data.error) {
+        loadingConversations = false;
+    }
 
-    if (data.conversations) {
-        const select = document.getElementById("chat-select");
-        const joinButton = document.getElementById("join");
-        select.innerHTML = "";
-        
-        let conversation = data.conversations
-        let revseredConversation = conversation.reverse()
-
-        revseredConversation.forEach(conv => {
-            const option = document.createElement("option");
-            option.value = conv.id;
-            option.textContent = conv.name;
-            select.appendChild(option);
-        });
-
-        if (select && joinButton) {
-            if (select.options.length > 0) {
-                joinButton.href = `/chat/room/${select.options[0].value}/`;
-            } else {
-                joinButton.href = "#";
-            }
-        }
+    switch (data.type) {
+        case 'conversations':
+            document.getElementById("chat-select").innerHTML = "";
+            loadedConversations = 0;
+            conversationsVersion = data.version;
+            appendConversations(data);
+            break;
+
+        case 'conversations_page':
+            appendConversations(data);
+            break;
+
+        case 'conversation_status':
+            applyConversationChange(data);
+            break;
 
+        case 'conversation_changes':
+            (data.changes || []).forEach(applyConversationChange);
+            conversationsVersion = data.version;
+            break;
     }
+    updateJoinButton();
 };
 
+function appendConversations(data) {
+    const select = document.getElementById("chat-select");
+    (data.conversations || []).forEach(conv => select.appendChild(createConversationOption(conv)));
+    loadedConversations += (data.conversations || []).length;
+
+    // The next page is only requested when the user asks for it
+    hasMoreConversations = Boolean(data.has_more);
+    loadingConversations = false;
+    loadMoreButton.hidden = !hasMoreConversations;
+}
+
+function loadMoreConversations() {
+    if (!hasMoreConversations || loadingConversations || socket.readyState !== WebSocket.OPEN) {
+        return;
+    }
+    loadingConversations = true;
+    socket.send(JSON.stringify({action: 'load_more', offset: loadedConversations}));
+}
+
+loadMoreButton.addEventListener("click", function (event) {
+    event.preventDefault();
+    loadMoreConversations();
+});
+
+// An expanded list (size > 1) loads the next page once scrolled to the bottom
+conversationSelect.addEventListener("scroll", function () {
+    if (conversationSelect.scrollTop + conversationSelect.clientHeight >= conversationSelect.scrollHeight - 1) {
+        loadMoreConversations();
+    }
+});
+
+function applyConversationChange(change) {
+    if (change.version != null && conversationsVersion != null) {
+        if (change.version <= conversationsVersion) {
+            return;
+        }
+        if (change.version > conversationsVersion + 1) {
+            // Missed an update, ask for everything after the version we have
+            socket.send(JSON.stringify({action: 'sync', since: conversationsVersion}));
+            return;
+        }
+        conversationsVersion = change.version;
+    }
+
+    const select = document.getElementById("chat-select");
+    const existing = Array.from(select.options).find(option => option.value === change.id);
+    if (change.status === 'joined' && !existing) {
+        select.insertBefore(createConversationOption(change), select.firstChild);
+    } else if (change.status === 'left' && existing) {
+        existing.remove();
+    }
+}
+
+function createConversationOption(conv) {
+    const option = document.createElement("option");
+    option.value = conv.id;
+    option.textContent = conv.name;
+    return option;
+}
+
+function updateJoinButton() {
+    const select = document.getElementById("chat-select");
+    const joinButton = document.getElementById("join");
+
+    if (select && joinButton) {
+        if (select.options.length > 0) {
+            joinButton.href = `/chat/room/${select.value || select.options[0].value}/`;
+        } else {
+            joinButton.href = "#";
+        }
+    }
+}
+
 socket.onerror = function (error) {
     console.error("Error WebSocket:", error);
 };
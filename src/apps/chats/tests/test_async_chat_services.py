@@ -0,0 +1,138 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, MagicMock
+
+from apps.chats.exceptions import TooManyMessageException, MessageStorageError, ConversationNotFoundError
+from apps.chats.services.async_chat_services import AsyncChatService
+
+
+class AsyncChatServiceTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.chat_service = MagicMock()
+        self.redis_repo = AsyncMock()
+        self.presence_repo = AsyncMock()
+        self.rate_limiter_repo = AsyncMock()
+        self.service = AsyncChatService(
+            chat_service=self.chat_service,
+            redis_repo=self.redis_repo,
+            presence_repo=self.presence_repo,
+            rate_limiter_repo=self.rate_limiter_repo,
+        )
+
+    async def test_send_message_writes_both_stores_and_returns_message(self):
+        message = await self.service.send_message("conv1", 1, "Hello")
+
+        self.assertEqual(message["text"], "Hello")
+        self.assertEqual(message["sender"], 1)
+        self.redis_repo.push_message.assert_awaited_once_with("conv1", message)
+        self.chat_service.db_repo.push_message.assert_called_once_with("conv1", message)
+
+    async def test_get_history_warms_cache_from_db(self):
+        stored = [{"sender": 1, "text": "hi", "timestamp": "2025-01-01T12:00:00+00:00"}]
+        self.redis_repo.get_latest_messages.return_value = []
+        self.chat_service.db_repo.get_latest_messages.return_value = stored
+
+        messages = await self.service.get_history("conv1", limit=10)
+
+        self.assertEqual(messages, stored)
+        self.redis_repo.push_messages.assert_awaited_once_with("conv1", stored)
+
+    async def test_get_history_served_from_redis(self):
+        cached = [{"sender": 1, "text": "hi", "timestamp": "2025-01-01T12:00:00+00:00"}]
+        self.redis_repo.get_latest_messages.return_value = cached
+
+        self.assertEqual(await self.service.get_history("conv1", limit=10), cached)
+        self.chat_service.db_repo.get_latest_messages.assert_not_called()
+
+    async def test_get_snapshot_loads_users_and_history_concurrently(self):
+        cached = [{"sender": 1, "text": "hi", "timestamp": "2025-01-01T12:00:00+00:00"}]
+        self.redis_repo.get_latest_messages.return_value = cached
+        self.presence_repo.members.return_value = ["1"]
+        self.presence_repo.count.return_value = 1
+        self.chat_service.user_repo.filter.return_value = ["user1"]
+
+        users, users_count, messages, resumed = await self.service.get_snapshot("conv1", limit=10, users_limit=5)
+
+        self.assertEqual(users, ["user1"])
+        self.assertEqual(users_count, 1)
+        self.presence_repo.members.assert_awaited_once_with("conv1", 0, 5)
+        self.assertEqual(messages, cached)
+        self.assertFalse(resumed)
+        self.chat_service.user_repo.filter.assert_called_once_with(id__in=[1])
+
+    async def test_get_snapshot_resumes_from_cursor(self):
+        newer = [{"sender": 1, "text": "new", "timestamp": "2025-01-01T12:05:00+00:00"}]
+        self.redis_repo.get_messages_after.return_value = newer
+        self.presence_repo.members.return_value = []
+        self.presence_repo.count.return_value = 0
+
+        _, _, messages, resumed = await self.service.get_snapshot("conv1", since="2025-01-01T12:00:00+00:00")
+
+        self.assertTrue(resumed)
+        self.assertEqual(messages, newer)
+        self.redis_repo.get_latest_messages.assert_not_awaited()
+
+    async def test_get_snapshot_falls_back_when_cursor_aged_out(self):
+        cached = [{"sender": 1, "text": "hi", "timestamp": "2025-01-01T12:00:00+00:00"}]
+        self.redis_repo.get_messages_after.return_value = None
+        self.redis_repo.get_latest_messages.return_value = cached
+        self.presence_repo.members.return_value = []
+        self.presence_repo.count.return_value = 0
+
+        _, _, messages, resumed = await self.service.get_snapshot("conv1", since="2024-01-01T00:00:00+00:00")
+
+        self.assertFalse(resumed)
+        self.assertEqual(messages, cached)
+
+    async def test_throttling_uses_rate_limiter(self):
+        self.rate_limiter_repo.hit.return_value = "second"
+        with self.assertRaises(TooManyMessageException):
+            await self.service.check_throttling_message(1, 10, 1, "conv1")
+        self.rate_limiter_repo.hit.assert_awaited_once_with("throttle:conv1:1", 1, 10)
+
+    async def test_throttling_fails_open(self):
+        self.rate_limiter_repo.hit.side_effect = MessageStorageError("Redis down")
+        self.assertIsNone(await self.service.check_throttling_message(1, 10, 1, "conv1"))
+
+    async def test_cleanup_conversation_if_empty(self):
+        self.presence_repo.count.return_value = 0
+
+        await self.service.cleanup_conversation_if_empty("conv1")
+
+        self.redis_repo.clear_messages.assert_awaited_once_with("conv1")
+
+    async def test_cleanup_skipped_with_active_users(self):
+        self.presence_repo.count.return_value = 1
+
+        await self.service.cleanup_conversation_if_empty("conv1")
+
+        self.redis_repo.clear_messages.assert_not_awaited()
+
+    async def test_add_active_user_reports_first_connection(self):
+        self.presence_repo.touch.return_value = 1
+        self.assertTrue(await self.service.add_active_user("conv1", 1, "chan-a"))
+
+        self.presence_repo.touch.return_value = 2
+        self.assertFalse(await self.service.add_active_user("conv1", 1, "chan-b"))
+        self.presence_repo.touch.assert_awaited_with("conv1", 1, "chan-b")
+
+    async def test_remove_active_user_reports_last_connection(self):
+        self.presence_repo.leave.return_value = 1
+        self.assertFalse(await self.service.remove_active_user("conv1", 1, "chan-a"))
+
+        self.presence_repo.leave.return_value = 0
+        self.assertTrue(await self.service.remove_active_user("conv1", 1, "chan-b"))
+
+    async def test_refresh_active_user_returns_expired_users(self):
+        self.presence_repo.expire.return_value = ["2"]
+
+        self.assertEqual(await self.service.refresh_active_user("conv1", 1, "chan-a"), ["2"])
+        self.presence_repo.touch.assert_awaited_once_with("conv1", 1, "chan-a")
+
+    async def test_conversation_exists_uses_cached_answer(self):
+        self.chat_service.cached_conversation_exists.return_value = False
+        with self.assertRaises(ConversationNotFoundError):
+            await self.service.conversation_exists("conv1")
+
+        self.chat_service.cached_conversation_exists.return_value = True
+        self.assertTrue(await self.service.conversation_exists("conv1"))
+        self.chat_service.load_conversation_title.assert_not_called()
@@ -0,0 +1,154 @@
+import json
+from datetime import datetime, timedelta, timezone
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, MagicMock
+
+import redis
+
+from apps.chats.exceptions import MessageStorageError, MessageRetrievalError
+from apps.chats.repositories.async_redis_repo import AsyncRedisMessageRepo, AsyncRedisRateLimiterRepo
+from apps.chats.repositories.redis_repo import RedisRateLimiterRepo
+
+
+class AsyncRedisMessageRepoTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.mock_client = AsyncMock()
+        self.pipe = MagicMock()
+        self.pipe.execute = AsyncMock()
+        self.mock_client.pipeline = MagicMock(return_value=self.pipe)
+        self.repo = AsyncRedisMessageRepo(redis_client=self.mock_client)
+        self.message = {"id": "m1", "sender": 1, "text": "Hello", "timestamp": "2025-01-01T12:00:00+00:00"}
+
+    async def test_push_message_success(self):
+        await self.repo.push_message("conv1", self.message)
+
+        self.pipe.rpush.assert_called_once_with("chat:conv1", json.dumps(self.message))
+        self.pipe.zadd.assert_any_call("chat:conv1:sender_ids:1", {"m1": 1735732800.0})
+        self.pipe.hset.assert_called_once_with("chat:conv1:payloads", mapping={"m1": json.dumps(self.message)})
+        self.pipe.sadd.assert_called_once_with("chat:conv1:senders", "1")
+        self.pipe.execute.assert_awaited_once()
+
+    async def test_push_message_capped(self):
+        repo = AsyncRedisMessageRepo(redis_client=self.mock_client, max_length=100)
+        await repo.push_message("conv1", self.message)
+
+        self.pipe.ltrim.assert_called_once_with("chat:conv1", -100, -1)
+        self.pipe.zremrangebyrank.assert_called_once_with("chat:conv1:sender_ids:1", 0, -101)
+        self.assertEqual(self.pipe.eval.call_args.args[1:], (2, "chat:conv1:ids", "chat:conv1:payloads", 100))
+        self.pipe.execute.assert_awaited_once()
+
+    async def test_push_message_redis_error(self):
+        self.pipe.execute.side_effect = redis.RedisError("Redis error")
+        with self.assertRaises(MessageStorageError):
+            await self.repo.push_message("conv1", self.message)
+
+    async def test_push_messages_single_pipeline(self):
+        await self.repo.push_messages("conv1", [self.message] * 3)
+
+        self.pipe.rpush.assert_called_once_with("chat:conv1", *[json.dumps(self.message)] * 3)
+        self.pipe.zadd.assert_any_call("chat:conv1:sender_ids:1", {"m1": 1735732800.0})
+        self.pipe.execute.assert_awaited_once()
+
+    async def test_get_latest_messages(self):
+        self.mock_client.lrange.return_value = [json.dumps(self.message)]
+        messages = await self.repo.get_latest_messages("conv1", 5)
+
+        self.mock_client.lrange.assert_awaited_once_with("chat:conv1", -5, -1)
+        self.assertEqual(messages, [self.message])
+
+    async def test_get_messages_before(self):
+        base = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        self.mock_client.lrange.return_value = [
+            json.dumps({"sender": 1, "text": f"msg{i}", "timestamp": (base + timedelta(minutes=i)).isoformat()})
+            for i in range(5)
+        ]
+        messages = await self.repo.get_messages_before("conv1", (base + timedelta(minutes=3)).isoformat(), 2)
+        self.assertEqual([m["text"] for m in messages], ["msg1", "msg2"])
+
+    def stored_range(self, count: int):
+        base = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        stored = [
+            json.dumps({"sender": 1, "text": f"msg{i}", "timestamp": (base + timedelta(minutes=i)).isoformat()})
+            for i in range(count)
+        ]
+
+        async def lrange(key, start, end):
+            end = len(stored) + end + 1 if end < 0 else end + 1
+            start = max(len(stored) + start, 0) if start < 0 else start
+            return stored[start:end]
+
+        self.mock_client.lrange.side_effect = lrange
+        return base
+
+    async def test_get_messages_after_returns_newer_messages(self):
+        base = self.stored_range(250)
+        cursor = (base + timedelta(minutes=246)).isoformat()
+
+        messages = await self.repo.get_messages_after("conv1", cursor, 10)
+
+        self.assertEqual([m["text"] for m in messages], ["msg247", "msg248", "msg249"])
+
+    async def test_get_messages_after_up_to_date(self):
+        base = self.stored_range(5)
+        self.assertEqual(await self.repo.get_messages_after("conv1", (base + timedelta(minutes=4)).isoformat(), 10), [])
+
+    async def test_get_messages_after_cursor_aged_out(self):
+        base = self.stored_range(5)
+        self.assertIsNone(await self.repo.get_messages_after("conv1", (base - timedelta(minutes=1)).isoformat(), 10))
+
+    async def test_get_messages_after_too_far_behind(self):
+        base = self.stored_range(250)
+        self.assertIsNone(await self.repo.get_messages_after("conv1", (base + timedelta(minutes=10)).isoformat(), 50))
+
+    async def test_get_messages_after_delivers_timestamp_ties(self):
+        timestamp = "2025-01-01T12:00:00+00:00"
+        ids = [f"018d0000-0000-7000-8000-00000000000{i}" for i in range(4)]
+        self.mock_client.lrange.return_value = [
+            json.dumps({"id": _id, "sender": 1, "text": _id, "timestamp": timestamp}) for _id in ids
+        ]
+
+        messages = await self.repo.get_messages_after("conv1", f"{timestamp}|{ids[1]}", 10)
+
+        self.assertEqual([m["id"] for m in messages], ids[2:])
+
+    async def test_get_messages_json_error(self):
+        self.mock_client.lrange.return_value = ["not json"]
+        with self.assertRaises(MessageRetrievalError):
+            await self.repo.get_messages("conv1")
+
+    async def test_get_messages_by_user_id_reads_indexed_payloads(self):
+        self.mock_client.zrange.return_value = [b"m0", b"m1"]
+        self.mock_client.hmget.return_value = [None, json.dumps(self.message)]
+        messages = await self.repo.get_messages_by_user_id("conv1", 1)
+
+        self.mock_client.zrange.assert_awaited_once_with("chat:conv1:sender_ids:1", 0, -1)
+        self.mock_client.hmget.assert_awaited_once_with("chat:conv1:payloads", [b"m0", b"m1"])
+        self.mock_client.lrange.assert_not_awaited()
+        self.mock_client.zrem.assert_awaited_once_with("chat:conv1:sender_ids:1", b"m0")
+        self.assertEqual(messages, [self.message])
+
+    async def test_clear_messages(self):
+        self.mock_client.smembers.return_value = {b"1"}
+        self.mock_client.delete.return_value = 1
+        await self.repo.clear_messages("conv1")
+        self.mock_client.delete.assert_awaited_once_with(
+            "chat:conv1", "chat:conv1:senders", "chat:conv1:ids", "chat:conv1:payloads",
+            "chat:conv1:sender_ids:1", "chat:conv1:sender:1"
+        )
+
+
+class AsyncRedisRateLimiterRepoTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.mock_client = MagicMock()
+        self.script = AsyncMock()
+        self.mock_client.register_script.return_value = self.script
+        self.limiter = AsyncRedisRateLimiterRepo(self.mock_client)
+
+    async def test_shares_sync_script(self):
+        self.mock_client.register_script.assert_called_once_with(RedisRateLimiterRepo.HIT_SCRIPT)
+
+    async def test_hit(self):
+        self.script.return_value = 0
+        self.assertIsNone(await self.limiter.hit("throttle:conv1:1", 1, 10))
+        self.script.return_value = 2
+        self.assertEqual(await self.limiter.hit("throttle:conv1:1", 1, 10), "minute")
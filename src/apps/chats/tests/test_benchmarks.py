@@ -0,0 +1,55 @@
+import json
+
+from django.test import TestCase
+
+from apps.chats.benchmarks import BenchmarkSuite, compare_results
+from apps.chats.models import Conversation
+
+
+class BenchmarkSuiteTests(TestCase):
+    def setUp(self):
+        try:
+            import fakeredis
+        except ImportError:
+            self.skipTest("fakeredis not installed")
+        self.suite = BenchmarkSuite(fakeredis.FakeRedis(), ops=2, repeat=1, senders=3, text_length=10)
+
+    def test_run_times_every_case_and_cleans_up(self):
+        results = self.suite.run([5, 20])
+
+        cases = {(r['case'], r['size']) for r in results}
+        self.assertIn(('create_user_status_message', None), cases)
+        for size in (5, 20):
+            self.assertIn(('db.get_messages', size), cases)
+            self.assertIn(('service.get_messages_from_db', size), cases)
+        self.assertTrue(all(r['best_us'] > 0 for r in results))
+        self.assertFalse(Conversation.objects.exists())
+        self.assertEqual(self.suite.redis_client.dbsize(), 0)
+        json.dumps({'meta': self.suite.metadata('fakeredis'), 'results': results})
+
+    def test_run_filters_cases(self):
+        results = self.suite.run([5], only=['throttling'])
+
+        self.assertEqual(
+            [r['case'] for r in results],
+            ['service.check_throttling_message', 'service.check_throttling_message_scan']
+        )
+
+
+class CompareResultsTests(TestCase):
+    def test_flags_cases_slower_than_threshold(self):
+        baseline = [
+            {'case': 'a', 'size': 100, 'best_us': 10.0},
+            {'case': 'b', 'size': 100, 'best_us': 10.0},
+        ]
+        results = [
+            {'case': 'a', 'size': 100, 'best_us': 12.0},
+            {'case': 'b', 'size': 100, 'best_us': 13.0},
+            {'case': 'a', 'size': 1000, 'best_us': 50.0},
+        ]
+
+        rows = compare_results(results, baseline, threshold=0.25)
+
+        self.assertEqual([r['regression'] for r in rows], [False, True, False])
+        self.assertAlmostEqual(rows[1]['change'], 0.3)
+        self.assertIsNone(rows[2]['baseline_us'])
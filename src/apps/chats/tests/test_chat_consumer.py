@@ -0,0 +1,330 @@
+import asyncio
+import json
+import time
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import fakeredis
+from django.test import override_settings
+
+from apps.chats.consumers import ChatConsumer
+from apps.chats.consumers.chat import NOT_FOUND_CLOSE_CODE, INTERNAL_ERROR_CLOSE_CODE
+from apps.chats.consumers.outbound import OutboundQueue, outbound_stats
+from apps.chats.exceptions import ConversationNotFoundError, TooManyMessageException
+from apps.chats.metrics import CHAT_MESSAGES, WEBSOCKET_CONNECTIONS
+from apps.chats.repositories.async_redis_repo import AsyncRedisMessageRepo
+from apps.chats.services.async_chat_services import AsyncChatService
+from apps.chats.utils import create_group_event, create_typing_message, create_cursor
+
+
+async def drain(queue: OutboundQueue) -> list:
+    return [await queue.get() for _ in range(len(queue))]
+
+
+class ChatConsumerBroadcastTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.consumer = ChatConsumer()
+        self.consumer.base_send = AsyncMock()
+        self.consumer.outbound = OutboundQueue(10)
+        self.frame = {'type': 'message', 'id': '018d0000-0000-7000-8000-000000000001', 'sender': 1, 'text': 'hi',
+                      'timestamp': '2025-01-01T12:00:00+00:00'}
+        self.cursor = f"{self.frame['timestamp']}|{self.frame['id']}"
+
+    def test_group_event_is_encoded_once(self):
+        event = create_group_event('chat_message', self.frame)
+        self.assertEqual(event['type'], 'chat_message')
+        self.assertEqual(json.loads(event['text']), self.frame)
+
+    async def test_chat_message_forwards_encoded_text(self):
+        event = create_group_event('chat_message', self.frame)
+        await self.consumer.chat_message(event)
+        self.assertEqual(await drain(self.consumer.outbound), [event['text']])
+
+    async def test_user_status_forwards_encoded_text(self):
+        frame = {'type': 'user_status', 'status': 'joined', 'timestamp': 'now', 'user': {'id': 1}}
+        event = create_group_event('user_status', frame)
+        await self.consumer.user_status(event)
+        self.assertEqual(await drain(self.consumer.outbound), [event['text']])
+
+    async def test_chat_message_accepts_legacy_event(self):
+        await self.consumer.chat_message({'type': 'chat_message', 'message': self.frame})
+        sent = await drain(self.consumer.outbound)
+        self.assertEqual(json.loads(sent[0]), self.frame)
+
+    @patch("apps.chats.consumers.chat.async_chat_service")
+    async def test_snapshot_is_sent_as_one_frame(self, mock_service):
+        messages = [self.frame]
+        mock_service.get_snapshot = AsyncMock(return_value=([], 0, messages, False))
+        self.consumer.conv_id = "conv1"
+
+        await self.consumer.send_snapshot()
+
+        sent = await drain(self.consumer.outbound)
+        self.assertEqual(len(sent), 1)
+        frame = json.loads(sent[0])
+        self.assertEqual(frame, {
+            'type': 'snapshot', 'users': [], 'users_count': 0, 'messages': messages, 'has_more': False,
+            'resumed': False, 'cursor': self.cursor
+        })
+
+    @patch("apps.chats.consumers.chat.async_chat_service")
+    async def test_resumed_snapshot_keeps_cursor_without_new_messages(self, mock_service):
+        mock_service.get_snapshot = AsyncMock(return_value=([], 0, [], True))
+        self.consumer.conv_id = "conv1"
+
+        await self.consumer.send_snapshot(self.cursor)
+
+        frame = json.loads((await drain(self.consumer.outbound))[0])
+        self.assertTrue(frame['resumed'])
+        self.assertEqual(frame['cursor'], self.cursor)
+        self.assertEqual(mock_service.get_snapshot.await_args.kwargs['since'], self.cursor)
+
+    @patch("apps.chats.consumers.chat.async_chat_service")
+    async def test_sender_gets_ack_with_cursor(self, mock_service):
+        mock_service.get_throttle_limits = MagicMock(return_value=(1, 10))
+        mock_service.check_throttling_message = AsyncMock()
+        mock_service.send_message = AsyncMock(return_value={k: v for k, v in self.frame.items() if k != 'type'})
+        self.consumer.channel_layer = AsyncMock()
+        self.consumer.conv_id, self.consumer.conv_group_name, self.consumer.user_id = "conv1", "chat_conv1", 1
+
+        await self.consumer.receive(json.dumps({'text': 'hi', 'client_id': 'c-1'}))
+
+        ack = json.loads((await drain(self.consumer.outbound))[0])
+        self.assertEqual(ack, {'type': 'ack', 'client_id': 'c-1', 'id': self.frame['id'], 'cursor': self.cursor})
+        self.consumer.channel_layer.group_send.assert_awaited_once()
+
+    @patch("apps.chats.consumers.chat.async_chat_service")
+    async def test_message_outcomes_are_counted(self, mock_service):
+        mock_service.get_throttle_limits = MagicMock(return_value=(1, 10))
+        mock_service.check_throttling_message = AsyncMock(side_effect=[None, TooManyMessageException("slow down")])
+        mock_service.send_message = AsyncMock(return_value={k: v for k, v in self.frame.items() if k != 'type'})
+        self.consumer.channel_layer = AsyncMock()
+        self.consumer.conv_id, self.consumer.conv_group_name, self.consumer.user_id = "conv1", "chat_conv1", 1
+        sent, throttled = CHAT_MESSAGES.value('sent'), CHAT_MESSAGES.value('throttled')
+
+        await self.consumer.receive(json.dumps({'text': 'hi'}))
+        await self.consumer.receive(json.dumps({'text': 'hi again'}))
+
+        self.assertEqual(CHAT_MESSAGES.value('sent'), sent + 1)
+        self.assertEqual(CHAT_MESSAGES.value('throttled'), throttled + 1)
+
+
+class ChatConsumerRejectTests(IsolatedAsyncioTestCase):
+    @patch("apps.chats.consumers.chat.async_chat_service")
+    async def test_missing_room_is_closed_with_application_code(self, mock_service):
+        mock_service.conversation_exists = AsyncMock(side_effect=ConversationNotFoundError("conv1"))
+        consumer = ChatConsumer()
+        consumer.scope = {'url_route': {'kwargs': {'conv_id': 'conv1'}}, 'user': MagicMock(id=1)}
+        consumer.accept, consumer.close = AsyncMock(), AsyncMock()
+        consumer.channel_layer = AsyncMock()
+
+        await consumer.connect()
+
+        # Browsers only see the code of a socket that was accepted
+        consumer.accept.assert_awaited_once()
+        consumer.close.assert_awaited_once_with(code=NOT_FOUND_CLOSE_CODE)
+        consumer.channel_layer.group_add.assert_not_awaited()
+
+
+class ChatConsumerLifecycleTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.consumer = ChatConsumer()
+        self.consumer.scope = {'url_route': {'kwargs': {'conv_id': 'conv1'}}, 'user': MagicMock(id=1),
+                               'query_string': b''}
+        self.consumer.channel_name = 'channel1'
+        self.consumer.channel_layer = AsyncMock()
+        self.consumer.accept, self.consumer.close, self.consumer.base_send = AsyncMock(), AsyncMock(), AsyncMock()
+
+    @patch("apps.chats.consumers.chat.async_chat_service")
+    async def test_failure_after_accept_is_cleaned_up_on_disconnect(self, mock_service):
+        mock_service.conversation_exists = AsyncMock(return_value=True)
+        mock_service.add_active_user = AsyncMock(return_value=True)
+        mock_service.remove_active_user = AsyncMock(return_value=True)
+        mock_service.cleanup_conversation_if_empty = AsyncMock()
+        self.consumer.send_snapshot = AsyncMock(side_effect=RuntimeError("snapshot failed"))
+        connections = WEBSOCKET_CONNECTIONS.value('chat')
+
+        await self.consumer.connect()
+
+        self.consumer.close.assert_awaited_once_with(code=INTERNAL_ERROR_CLOSE_CODE)
+        self.assertIsNone(self.consumer.heartbeat_task)
+        writer_task = self.consumer.writer_task
+
+        await self.consumer.disconnect(INTERNAL_ERROR_CLOSE_CODE)
+        await asyncio.sleep(0)
+
+        self.assertTrue(writer_task.cancelled())
+        self.assertEqual(WEBSOCKET_CONNECTIONS.value('chat'), connections)
+        self.consumer.channel_layer.group_discard.assert_awaited_once_with('chat_conv1', 'channel1')
+        mock_service.remove_active_user.assert_awaited_once_with('conv1', 1, 'channel1')
+
+    @patch("apps.chats.consumers.chat.async_chat_service")
+    async def test_rejected_connection_skips_cleanup(self, mock_service):
+        mock_service.conversation_exists = AsyncMock(side_effect=ConversationNotFoundError("conv1"))
+
+        await self.consumer.connect()
+        await self.consumer.disconnect(NOT_FOUND_CLOSE_CODE)
+
+        self.consumer.channel_layer.group_discard.assert_not_awaited()
+        mock_service.remove_active_user.assert_not_called()
+
+
+class ChatConsumerResumeTests(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis_client = fakeredis.FakeAsyncRedis()
+        self.redis_repo = AsyncRedisMessageRepo(self.redis_client)
+        presence_repo = AsyncMock()
+        presence_repo.members.return_value = []
+        presence_repo.count.return_value = 0
+        service = AsyncChatService(MagicMock(), self.redis_repo, presence_repo)
+        patcher = patch("apps.chats.consumers.chat.async_chat_service", service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.consumer = ChatConsumer()
+        self.consumer.outbound = OutboundQueue(10)
+        self.consumer.conv_id = "conv1"
+
+    async def asyncTearDown(self):
+        await self.redis_client.aclose()
+
+    async def test_resume_from_live_message_with_shared_timestamp(self):
+        timestamp = '2025-01-01T12:00:00+00:00'
+        seen, missed = [
+            {'id': f'018d0000-0000-7000-8000-00000000000{i}', 'sender': 1, 'text': f'm{i}', 'timestamp': timestamp}
+            for i in (1, 2)
+        ]
+        await self.redis_repo.push_messages("conv1", [seen, missed])
+
+        # The cursor the dashboard keeps for the last live 'message' frame it received
+        live_frame = json.loads(create_group_event('chat_message', {'type': 'message', **seen})['text'])
+        await self.consumer.send_snapshot(create_cursor(live_frame))
+
+        frame = json.loads((await drain(self.consumer.outbound))[0])
+        self.assertTrue(frame['resumed'])
+        self.assertEqual(frame['messages'], [missed])
+        self.assertEqual(frame['cursor'], create_cursor(missed))
+
+
+class ChatConsumerTypingTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.enterContext(override_settings(CHAT_TYPING_INTERVAL=0.05))
+        self.consumer = ChatConsumer()
+        self.consumer.base_send = AsyncMock()
+        self.consumer.channel_layer = AsyncMock()
+        self.consumer.conv_group_name = 'chat_conv1'
+        self.consumer.user_id = 1
+        self.consumer.typing_pending = None
+        self.consumer.typing_sent_at = 0.0
+        self.consumer.typing_task = None
+        self.consumer.outbound = OutboundQueue(10)
+
+    def sent_typing_states(self):
+        return [json.loads(c.args[1]['text'])['typing'] for c in self.consumer.channel_layer.group_send.await_args_list]
+
+    @patch("apps.chats.consumers.chat.async_chat_service")
+    async def test_typing_skips_storage(self, mock_service):
+        await self.consumer.receive(json.dumps({'action': 'typing', 'typing': True}))
+        await self.consumer.typing_task
+
+        self.assertEqual(self.sent_typing_states(), [True])
+        self.assertEqual(mock_service.mock_calls, [])
+
+    async def test_keystrokes_are_coalesced(self):
+        for typing in (True, True, True):
+            self.consumer.queue_typing(typing)
+        await self.consumer.typing_task
+        self.assertEqual(self.sent_typing_states(), [True])
+
+        self.consumer.queue_typing(True)
+        self.consumer.queue_typing(False)
+        await self.consumer.typing_task
+
+        # The second window waits out the interval and carries only the latest state
+        self.assertEqual(self.sent_typing_states(), [True, False])
+
+    async def test_stale_and_own_typing_events_are_dropped(self):
+        frame = create_typing_message(2, True)
+        event = {**create_group_event('typing_status', frame), 'user_id': 2, 'expires_at': time.time() + 1}
+
+        await self.consumer.typing_status({**event, 'expires_at': time.time() - 1})
+        await self.consumer.typing_status({**event, 'user_id': 1})
+        self.assertEqual(len(self.consumer.outbound), 0)
+
+        await self.consumer.typing_status(event)
+        self.assertEqual(await drain(self.consumer.outbound), [event['text']])
+
+
+class OutboundQueueTests(IsolatedAsyncioTestCase):
+    async def test_ephemeral_frames_are_dropped_first(self):
+        queue = OutboundQueue(2)
+        queue.put('typing', 'ephemeral', 2)
+        queue.put('m1')
+
+        self.assertTrue(queue.put('m2'))
+        self.assertTrue(queue.put('typing again', 'ephemeral', 3))
+        self.assertEqual(await drain(queue), ['m1', 'm2'])
+        self.assertEqual(queue.stats(), {'depth': 0, 'dropped': 2, 'merged': 0})
+
+    async def test_status_frames_are_merged_in_place(self):
+        queue = OutboundQueue(3)
+        queue.put('joined 2', 'status', 2)
+        queue.put('m1')
+        queue.put('left 2', 'status', 2)
+
+        self.assertEqual(await drain(queue), ['left 2', 'm1'])
+        self.assertEqual(queue.stats()['merged'], 1)
+
+        # Once sent, a new status takes a fresh slot
+        queue.put('joined 2', 'status', 2)
+        self.assertEqual(await drain(queue), ['joined 2'])
+
+    async def test_message_overflow_is_reported(self):
+        queue = OutboundQueue(1)
+        queue.put('m1')
+
+        self.assertFalse(queue.put('m2'))
+        self.assertEqual(await drain(queue), ['m1'])
+        self.assertGreaterEqual(outbound_stats()['overflows'], 1)
+        # Whether the message is dropped is up to the consumer's policy
+        self.assertEqual(queue.stats()['dropped'], 0)
+
+
+class ChatConsumerBackpressureTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.consumer = ChatConsumer()
+        self.consumer.base_send = AsyncMock()
+        self.consumer.close = AsyncMock()
+        self.consumer.conv_id = 'conv1'
+        self.consumer.user_id = 1
+        self.consumer.closing = False
+        self.consumer.outbound = OutboundQueue(1)
+
+    async def test_overflow_closes_connection(self):
+        with override_settings(CHAT_OUTBOUND_OVERFLOW='disconnect'):
+            await self.consumer.push('m1')
+            await self.consumer.push('m2')
+            await self.consumer.push('m3')
+
+        self.consumer.close.assert_awaited_once_with(code=4008)
+        self.assertEqual(self.consumer.outbound.stats()['dropped'], 0)
+
+    async def test_overflow_drops_message_when_configured(self):
+        with override_settings(CHAT_OUTBOUND_OVERFLOW='drop'):
+            await self.consumer.push('m1')
+            await self.consumer.push('m2')
+
+        self.consumer.close.assert_not_awaited()
+        self.assertEqual(await drain(self.consumer.outbound), ['m1'])
+        self.assertEqual(self.consumer.outbound.stats()['dropped'], 1)
+
+    async def test_stalled_socket_closes_connection(self):
+        async def stalled(message):
+            await asyncio.sleep(1)
+        self.consumer.base_send = stalled
+        self.consumer.outbound.put('m1')
+
+        with override_settings(CHAT_OUTBOUND_SEND_TIMEOUT=0.01):
+            await self.consumer.write_outbound()
+
+        self.consumer.close.assert_awaited_once_with(code=4008)
@@ -3,11 +3,13 @@ from datetime import datetime, timezone, timedelta
 from unittest import mock
 from unittest.mock import MagicMock, patch
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 
-from apps.chats.exceptions import TooManyMessageException, MessageStorageError, MessageRetrievalError
+from apps.chats.conversation_cache import ConversationCache
+from apps.chats.exceptions import TooManyMessageException, MessageStorageError, MessageRetrievalError, \
+    ConversationNotFoundError
 from apps.chats.models import Conversation
 from apps.chats.repositories import DatabaseMessageRepo
 from apps.chats.repositories.inter import IMessageRepo, IConsumerRepo
@@ -70,11 +72,12 @@ class ChatServiceTestCase(TestCase):
         conv_id = self.service.create_conversation(title="Chat 2")
         self.service.join_conversation(conv_id, self.user1.id)
 
-        self.service.send_message(conv_id, self.user1.id, "Hello World")
+        message = self.service.send_message(conv_id, self.user1.id, "Hello World")
 
-        self.mock_redis_repo.push_message.assert_called_once()
+        self.mock_redis_repo.push_message.assert_called_once_with(conv_id, message)
         messages = self.db_repo.get_messages(conv_id)
         self.assertEqual(messages[0]['text'], "Hello World")
+        self.assertEqual(messages[0]['id'], message['id'])
 
     def test_get_active_users_returns_users(self):
         conv_id = self.service.create_conversation(title="Chat 3")
@@ -100,6 +103,171 @@ class ChatServiceTestCase(TestCase):
             self.service.conversation_exists('9999')
 
 
+class ConversationCacheServiceTests(TestCase):
+    def setUp(self):
+        self.service = ChatService(
+            user_repo=MyUser.objects,
+            conversation_repo=Conversation.objects,
+            redis_repo=mock.MagicMock(spec=IMessageRepo),
+            db_repo=DatabaseMessageRepo(),
+            redis_consumer_repo=mock.MagicMock(spec=IConsumerRepo),
+            conversation_cache=ConversationCache()
+        )
+
+    def test_title_served_from_cache(self):
+        conv = Conversation.objects.create(title="Cached")
+        self.assertEqual(self.service.get_conversation_title(str(conv.id)), "Cached")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.service.get_conversation_title(str(conv.id)), "Cached")
+            self.assertTrue(self.service.conversation_exists(str(conv.id)))
+
+    def test_title_survives_invalidation_after_cache_hit(self):
+        conv = Conversation.objects.create(title="Racy")
+        self.service.get_conversation_title(str(conv.id))
+        entry = self.service.conversation_cache.get(str(conv.id))
+
+        # An invalidation landing right after the hit must not turn it into a miss
+        with mock.patch.object(self.service.conversation_cache, 'get', side_effect=[entry, None]):
+            self.assertEqual(self.service.get_conversation_title(str(conv.id)), "Racy")
+
+    def test_missing_conversation_is_cached(self):
+        with self.assertRaises(ConversationNotFoundError):
+            self.service.conversation_exists('9999')
+
+        with self.assertNumQueries(0), self.assertRaises(ConversationNotFoundError):
+            self.service.conversation_exists('9999')
+
+    def test_forget_conversation_drops_cached_miss(self):
+        conv = Conversation.objects.create(title="Late")
+        self.service.conversation_cache.set_missing(str(conv.id))
+
+        self.service.forget_conversation(str(conv.id))
+
+        self.assertTrue(self.service.conversation_exists(str(conv.id)))
+
+
+class HistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.redis_repo = MagicMock()
+        self.db_repo = MagicMock()
+        self.chat_service = ChatService(
+            user_repo=MagicMock(),
+            conversation_repo=MagicMock(),
+            redis_repo=self.redis_repo,
+            db_repo=self.db_repo,
+            redis_consumer_repo=MagicMock(),
+        )
+
+    def test_latest_page_served_from_redis(self):
+        cached = [{"sender": 1, "text": "hi", "timestamp": "2025-01-01T12:00:00+00:00"}]
+        self.redis_repo.get_latest_messages.return_value = cached
+
+        result = self.chat_service.get_history("conv1", limit=10)
+
+        self.assertEqual(result, cached)
+        self.redis_repo.get_latest_messages.assert_called_once_with("conv1", 10)
+        self.db_repo.get_latest_messages.assert_not_called()
+
+    def test_latest_page_warms_cache_from_db(self):
+        stored = [{"sender": 1, "text": "hi", "timestamp": "2025-01-01T12:00:00+00:00"}]
+        self.redis_repo.get_latest_messages.return_value = []
+        self.db_repo.get_latest_messages.return_value = stored
+
+        result = self.chat_service.get_history("conv1", limit=10)
+
+        self.assertEqual(result, stored)
+        self.db_repo.get_latest_messages.assert_called_once_with("conv1", 10)
+        self.redis_repo.push_messages.assert_called_once_with("conv1", stored)
+
+    def test_db_warm_up_uses_single_bulk_push(self):
+        stored = [
+            {"sender": 1, "text": f"msg{i}", "timestamp": "2025-01-01T12:00:00+00:00"}
+            for i in range(3)
+        ]
+        self.db_repo.get_messages.return_value = stored
+
+        self.chat_service.get_messages_from_db("conv1")
+
+        self.redis_repo.push_messages.assert_called_once_with("conv1", stored)
+        self.redis_repo.push_message.assert_not_called()
+
+    def test_older_page_falls_back_to_db_past_cached_tail(self):
+        cached = [{"id": "018d0000-0000-7000-8000-000000000002", "sender": 1, "text": "b",
+                   "timestamp": "2025-01-01T12:01:00+00:00"}]
+        older = [{"sender": 1, "text": "a", "timestamp": "2025-01-01T12:00:00+00:00"}]
+        self.redis_repo.get_messages_before.return_value = cached
+        self.db_repo.get_messages_before.return_value = older
+
+        result = self.chat_service.get_history("conv1", before="2025-01-01T12:02:00+00:00", limit=2)
+
+        self.assertEqual(result, older + cached)
+        self.db_repo.get_messages_before.assert_called_once_with(
+            "conv1", "2025-01-01T12:01:00+00:00|018d0000-0000-7000-8000-000000000002", 1
+        )
+
+
+class ConversationListTests(TestCase):
+    def setUp(self):
+        self.list_repo = MagicMock()
+        self.service = ChatService(
+            user_repo=MyUser.objects,
+            conversation_repo=Conversation.objects,
+            redis_repo=MagicMock(),
+            db_repo=MagicMock(),
+            redis_consumer_repo=MagicMock(),
+            conversation_list_repo=self.list_repo
+        )
+        self.conversations = [Conversation.objects.create(title=f"room{i}") for i in range(3)]
+
+    def test_cold_cache_is_rebuilt_from_database(self):
+        self.list_repo.get_page.return_value = None
+        self.list_repo.rebuild.return_value = 1
+
+        page = self.service.get_conversations_page(0, 2)
+
+        rebuilt = self.list_repo.rebuild.call_args.args[0]
+        self.assertEqual([c['name'] for c in rebuilt], ["Chat room2", "Chat room1", "Chat room0"])
+        self.assertEqual(page['version'], 1)
+        self.assertEqual(page['total'], 3)
+        self.assertEqual([c['name'] for c in page['conversations']], ["Chat room2", "Chat room1"])
+        self.assertTrue(page['has_more'])
+
+    def test_warm_cache_skips_database(self):
+        self.list_repo.get_page.return_value = {
+            'version': 4, 'total': 1, 'conversations': [{'id': 'c1', 'name': 'Chat c1'}]
+        }
+
+        with self.assertNumQueries(0):
+            page = self.service.get_conversations_page(0, 10)
+
+        self.assertEqual(page['version'], 4)
+        self.assertFalse(page['has_more'])
+        self.list_repo.rebuild.assert_not_called()
+
+    def test_cache_error_falls_back_to_database(self):
+        self.list_repo.get_page.side_effect = MessageRetrievalError("Redis down")
+
+        page = self.service.get_conversations_page(2, 10)
+
+        self.assertIsNone(page['version'])
+        self.assertEqual([c['name'] for c in page['conversations']], ["Chat room0"])
+
+    def test_record_conversation_added_applies_change(self):
+        conversation = self.conversations[0]
+        self.list_repo.apply_change.return_value = 5
+
+        self.assertEqual(self.service.record_conversation_added(conversation), 5)
+        status, entry = self.list_repo.apply_change.call_args.args
+        self.assertEqual(status, 'joined')
+        self.assertEqual(entry['id'], str(conversation.id))
+        self.assertEqual(entry['name'], "Chat room0")
+
+    def test_record_conversation_removed_swallows_cache_errors(self):
+        self.list_repo.apply_change.side_effect = MessageStorageError("Redis down")
+        self.assertIsNone(self.service.record_conversation_removed("c1"))
+
+
 class ThrottlingTests(TestCase):
     def setUp(self):
         self.chat_service = ChatService(
@@ -149,6 +317,44 @@ class ThrottlingTests(TestCase):
         self.assertIsNone(result)
 
 
+class RateLimiterThrottlingTests(TestCase):
+    def setUp(self):
+        self.redis_repo = MagicMock()
+        self.rate_limiter_repo = MagicMock()
+        self.chat_service = ChatService(
+            user_repo=MagicMock(),
+            conversation_repo=MagicMock(),
+            redis_repo=self.redis_repo,
+            db_repo=MagicMock(),
+            redis_consumer_repo=MagicMock(),
+            rate_limiter_repo=self.rate_limiter_repo,
+        )
+
+    def test_allowed_does_not_read_message_cache(self):
+        self.rate_limiter_repo.hit.return_value = None
+
+        result = self.chat_service.check_throttling_message(1, 10, 1, "conv1")
+
+        self.assertIsNone(result)
+        self.rate_limiter_repo.hit.assert_called_once_with("throttle:conv1:1", 1, 10)
+        self.redis_repo.get_messages_by_user_id.assert_not_called()
+
+    def test_exceeded_raises(self):
+        self.rate_limiter_repo.hit.return_value = "minute"
+        with self.assertRaises(TooManyMessageException) as cm:
+            self.chat_service.check_throttling_message(1, 10, 1, "conv1")
+        self.assertIn("Too many messages per minute", str(cm.exception))
+
+    def test_limiter_failure_allows_message(self):
+        self.rate_limiter_repo.hit.side_effect = MessageStorageError("Redis down")
+        self.assertIsNone(self.chat_service.check_throttling_message(1, 10, 1, "conv1"))
+
+    @override_settings(CHAT_THROTTLE_LIMITS=(1, 10), CHAT_THROTTLE_OVERRIDES={"conv2": [2, 30]})
+    def test_throttle_limits_per_conversation(self):
+        self.assertEqual(self.chat_service.get_throttle_limits("conv1"), (1, 10))
+        self.assertEqual(self.chat_service.get_throttle_limits("conv2"), (2, 30))
+
+
 class TestCleanupConversationIfEmpty(TestCase):
 
     def setUp(self):
@@ -0,0 +1,58 @@
+import json
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from apps.chats.codecs import JsonMessageCodec, MsgpackMessageCodec, decode_message, get_codec, MSGPACK_V1_PREFIX
+from apps.chats.exceptions import MessageDecodeError, MessageRetrievalError
+from apps.chats.repositories import RedisMessageRepo
+
+
+class MessageCodecTests(TestCase):
+    def setUp(self):
+        self.message = {"sender": 1, "text": "Привіт", "timestamp": "2025-01-01T12:00:00+00:00"}
+
+    def test_json_codec_is_plain_json(self):
+        encoded = JsonMessageCodec().encode(self.message)
+        self.assertEqual(encoded, json.dumps(self.message))
+        self.assertEqual(decode_message(encoded.encode()), self.message)
+
+    def test_msgpack_codec_is_prefixed(self):
+        encoded = MsgpackMessageCodec().encode(self.message)
+        self.assertTrue(encoded.startswith(MSGPACK_V1_PREFIX))
+        self.assertEqual(decode_message(encoded), self.message)
+
+    def test_decode_invalid_payload(self):
+        with self.assertRaises(MessageDecodeError):
+            decode_message(b"not json")
+        with self.assertRaises(MessageDecodeError):
+            decode_message(MSGPACK_V1_PREFIX + b"\xc1")
+
+    def test_get_codec(self):
+        self.assertIsInstance(get_codec("msgpack"), MsgpackMessageCodec)
+        with self.assertRaises(ValueError):
+            get_codec("xml")
+
+
+class RedisMessageRepoCodecTests(TestCase):
+    def setUp(self):
+        self.mock_client = MagicMock()
+        self.repo = RedisMessageRepo(redis_client=self.mock_client, codec=MsgpackMessageCodec())
+        self.message = {"sender": 1, "text": "hi", "timestamp": "2025-01-01T12:00:00+00:00"}
+
+    def test_push_message_uses_codec(self):
+        self.repo.push_message("conv1", self.message)
+        pipe = self.mock_client.pipeline.return_value
+        pipe.rpush.assert_any_call("chat:conv1", MsgpackMessageCodec().encode(self.message))
+
+    def test_mixed_format_list_is_readable(self):
+        legacy = {"sender": 2, "text": "old", "timestamp": "2025-01-01T11:00:00+00:00"}
+        self.mock_client.lrange.return_value = [
+            json.dumps(legacy).encode(),
+            MsgpackMessageCodec().encode(self.message),
+        ]
+        self.assertEqual(self.repo.get_messages("conv1"), [legacy, self.message])
+
+    def test_corrupt_entry_raises_retrieval_error(self):
+        self.mock_client.lrange.return_value = [MSGPACK_V1_PREFIX + b"\xc1"]
+        with self.assertRaises(MessageRetrievalError):
+            self.repo.get_messages("conv1")
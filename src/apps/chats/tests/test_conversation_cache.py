@@ -0,0 +1,76 @@
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+import fakeredis
+
+from apps.chats.conversation_cache import ConversationCache
+
+
+class ConversationCacheTests(TestCase):
+    def setUp(self):
+        self.cache = ConversationCache(max_size=2, ttl=60, negative_ttl=5)
+
+    def test_found_and_missing_entries(self):
+        self.cache.set_found("conv1", "Room")
+        self.cache.set_missing("conv2")
+
+        self.assertEqual(self.cache.get("conv1"), (True, "Room"))
+        self.assertFalse(self.cache.get("conv2").exists)
+        self.assertIsNone(self.cache.get("conv3"))
+        self.assertEqual(self.cache.stats(), {'size': 2, 'hits': 2, 'misses': 1})
+
+    def test_missing_entries_expire_first(self):
+        with patch('apps.chats.conversation_cache.time.monotonic', return_value=100):
+            self.cache.set_found("conv1", "Room")
+            self.cache.set_missing("conv2")
+
+        with patch('apps.chats.conversation_cache.time.monotonic', return_value=110):
+            self.assertIsNotNone(self.cache.get("conv1"))
+            self.assertIsNone(self.cache.get("conv2"))
+
+        with patch('apps.chats.conversation_cache.time.monotonic', return_value=170):
+            self.assertIsNone(self.cache.get("conv1"))
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set_found("conv1", "One")
+        self.cache.set_found("conv2", "Two")
+        self.cache.get("conv1")
+        self.cache.set_found("conv3", "Three")
+
+        self.assertIsNone(self.cache.get("conv2"))
+        self.assertIsNotNone(self.cache.get("conv1"))
+
+    def test_invalidate(self):
+        self.cache.set_missing("conv1")
+        self.cache.invalidate("conv1")
+
+        self.assertIsNone(self.cache.get("conv1"))
+
+    def test_lookup_started_before_an_invalidation_is_not_cached(self):
+        generation = self.cache.start_lookup()
+        self.cache.invalidate("conv1")
+
+        self.cache.set_found("conv1", "Deleted", generation)
+
+        self.assertIsNone(self.cache.get("conv1"))
+
+
+class ConversationCacheInvalidationTests(TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        # Two workers sharing one Redis; neither has a conversation list socket open
+        self.first = ConversationCache(redis_client=fakeredis.FakeRedis(server=server))
+        self.second = ConversationCache(redis_client=fakeredis.FakeRedis(server=server))
+        self.addCleanup(self.first.close)
+        self.addCleanup(self.second.close)
+
+    def test_deleted_room_is_dropped_in_every_process(self):
+        self.first.set_found("conv1", "Room")
+
+        self.second.invalidate("conv1")
+
+        deadline = time.monotonic() + 2
+        while self.first.get("conv1") is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(self.first.get("conv1"))
@@ -1,10 +1,15 @@
+import uuid
+
+from django.db import OperationalError, connection
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from apps.chats.ids import uuid7
+from apps.chats.metrics import OPERATION_LATENCY
 from apps.chats.models import Conversation, Message
-from apps.chats.repositories import DatabaseMessageRepo, RedisMessageRepo
+from apps.chats.repositories import DatabaseMessageRepo, RedisMessageRepo, WriteBehindMessageRepo
 from apps.chats.exceptions import MessageStorageError, MessageRetrievalError
 from unittest.mock import patch, MagicMock
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 MyUser = get_user_model()
 
@@ -43,6 +48,22 @@ class DatabaseMessageRepoTests(TestCase):
         with self.assertRaises(MessageStorageError):
             self.repo.push_message(str(self.conversation.id), message)
 
+    def test_push_messages_bulk_insert(self):
+        messages = [
+            {"sender": self.user.id, "text": f"msg{i}", "timestamp": datetime.now(timezone.utc)}
+            for i in range(3)
+        ]
+        with self.assertNumQueries(1):
+            self.repo.push_messages(str(self.conversation.id), messages)
+        self.assertEqual(Message.objects.filter(conversation=self.conversation).count(), 3)
+
+    def test_push_messages_keeps_ids_and_skips_duplicates(self):
+        message = {"id": str(uuid7()), "sender": self.user.id, "text": "once", "timestamp": datetime.now(timezone.utc)}
+        self.repo.push_messages(str(self.conversation.id), [message])
+        self.repo.push_messages(str(self.conversation.id), [message])
+
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [uuid.UUID(message["id"])])
+
     def test_get_messages_success(self):
         Message.objects.create(
             conversation=self.conversation,
@@ -68,3 +89,179 @@ class DatabaseMessageRepoTests(TestCase):
         with self.assertRaises(MessageRetrievalError):
             self.repo.get_messages(str(self.conversation.id))
 
+    def test_get_latest_messages_returns_newest_page_in_order(self):
+        base = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        for i in range(5):
+            Message.objects.create(
+                conversation=self.conversation,
+                sender=self.user,
+                text=f"msg{i}",
+                timestamp=base + timedelta(minutes=i)
+            )
+
+        messages = self.repo.get_latest_messages(str(self.conversation.id), 2)
+        self.assertEqual([m['text'] for m in messages], ["msg3", "msg4"])
+
+    def test_get_messages_before_cursor(self):
+        base = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        for i in range(5):
+            Message.objects.create(
+                conversation=self.conversation,
+                sender=self.user,
+                text=f"msg{i}",
+                timestamp=base + timedelta(minutes=i)
+            )
+
+        cursor = (base + timedelta(minutes=3)).isoformat()
+        messages = self.repo.get_messages_before(str(self.conversation.id), cursor, 2)
+        self.assertEqual([m['text'] for m in messages], ["msg1", "msg2"])
+
+    def test_get_messages_before_breaks_timestamp_ties_by_id(self):
+        timestamp = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        for i, _id in enumerate(sorted(uuid7(timestamp) for _ in range(4))):
+            Message.objects.create(id=_id, conversation=self.conversation, sender=self.user,
+                                   text=f"msg{i}", timestamp=timestamp)
+
+        newest = self.repo.get_messages_before(str(self.conversation.id), (timestamp + timedelta(minutes=1)).isoformat(), 2)
+        cursor = f"{newest[0]['timestamp']}|{newest[0]['id']}"
+        older = self.repo.get_messages_before(str(self.conversation.id), cursor, 2)
+
+        self.assertEqual([m['text'] for m in older + newest], ["msg0", "msg1", "msg2", "msg3"])
+
+
+class MessageHistoryQueryTests(TestCase):
+    def setUp(self):
+        self.repo = DatabaseMessageRepo()
+        self.user = MyUser.objects.create_user(first_name="user1", last_name='user1', email='example@gmail.com', password="pass")
+        self.other = MyUser.objects.create_user(first_name="user2", last_name='user2', email='other@gmail.com', password="pass")
+        self.conversation = Conversation.objects.create()
+        self.conv_id = str(self.conversation.id)
+        self.base = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+    def _add_messages(self, count):
+        offset = Message.objects.count()
+        Message.objects.bulk_create([
+            Message(
+                conversation=self.conversation,
+                sender=self.user if i % 2 else self.other,
+                text=f"msg{i}",
+                timestamp=self.base + timedelta(seconds=i)
+            ) for i in range(offset, offset + count)
+        ])
+
+    def _reads(self):
+        cursor = (self.base + timedelta(days=1)).isoformat()
+        return [
+            lambda: self.repo.get_messages(self.conv_id),
+            lambda: self.repo.get_messages_by_user_id(self.conv_id, self.user.id),
+            lambda: self.repo.get_latest_messages(self.conv_id, 20),
+            lambda: self.repo.get_messages_before(self.conv_id, cursor, 20),
+        ]
+
+    def test_query_count_is_constant_as_rows_grow(self):
+        for count in (5, 200):
+            self._add_messages(count)
+            for read in self._reads():
+                with self.assertNumQueries(1):
+                    read()
+
+    def test_messages_by_user_id_are_ordered_and_projected(self):
+        self._add_messages(6)
+        messages = self.repo.get_messages_by_user_id(self.conv_id, self.user.id)
+        self.assertEqual([m['text'] for m in messages], ["msg1", "msg3", "msg5"])
+        self.assertEqual(messages[0], {
+            'id': str(Message.objects.get(text="msg1").id),
+            'sender': self.user.id,
+            'text': "msg1",
+            'timestamp': (self.base + timedelta(seconds=1)).isoformat()
+        })
+
+    def test_equal_timestamps_are_ordered_by_id(self):
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, sender=self.user, text=f"msg{i}", timestamp=self.base)
+            for i in range(3)
+        ])
+        expected = [m.text for m in Message.objects.filter(conversation=self.conversation).order_by('id')]
+        self.assertEqual([m['text'] for m in self.repo.get_latest_messages(self.conv_id, 3)], expected)
+
+    def test_history_queries_use_composite_indexes(self):
+        self._add_messages(200)
+        if connection.vendor == 'postgresql':
+            # A table this small is cheaper to seq-scan; ask the planner what it would use at scale.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        latest = Message.objects.filter(conversation_id=self.conv_id).order_by('-timestamp', '-id')[:20]
+        by_user = Message.objects.filter(conversation_id=self.conv_id, sender_id=self.user.id).order_by('timestamp', 'id')
+        self.assertIn('chats_msg_conv_ts_idx', latest.explain())
+        self.assertIn('chats_msg_conv_sender_ts_idx', by_user.explain())
+
+
+class WriteBehindMessageRepoTests(TestCase):
+    def setUp(self):
+        self.repo = WriteBehindMessageRepo(batch_size=2, flush_interval=60)
+        self.user = MyUser.objects.create_user(first_name="user1", last_name='user1', email='example@gmail.com', password="pass")
+        self.conversation = Conversation.objects.create()
+        self.conv_id = str(self.conversation.id)
+
+    def _message(self, text):
+        return {
+            "sender": self.user.id,
+            "text": text,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+    def test_push_message_is_queued_until_flush(self):
+        self.repo.push_message(self.conv_id, self._message("Hello"))
+
+        self.assertEqual(Message.objects.count(), 0)
+        self.assertEqual(self.repo.pending_count, 1)
+
+        self.assertEqual(self.repo.flush(), 1)
+        self.assertEqual(Message.objects.get().text, "Hello")
+        self.assertEqual(self.repo.stats()["pending"], 0)
+        self.assertEqual(self.repo.stats()["flushed"], 1)
+
+    def test_enqueues_are_timed(self):
+        single = OPERATION_LATENCY.value('db', 'push_message')['count']
+        batch = OPERATION_LATENCY.value('db', 'push_messages')['count']
+
+        self.repo.push_message(self.conv_id, self._message("one"))
+        self.repo.push_messages(self.conv_id, [self._message("two"), self._message("three")])
+
+        self.assertEqual(OPERATION_LATENCY.value('db', 'push_message')['count'], single + 1)
+        self.assertEqual(OPERATION_LATENCY.value('db', 'push_messages')['count'], batch + 1)
+        self.assertEqual(self.repo.pending_count, 3)
+
+    def test_flush_writes_in_batches(self):
+        for i in range(5):
+            self.repo.push_message(self.conv_id, self._message(f"msg{i}"))
+
+        with self.assertNumQueries(3):
+            self.assertEqual(self.repo.flush(), 5)
+        self.assertEqual(Message.objects.count(), 5)
+
+    def test_full_batch_wakes_flusher(self):
+        self.repo.push_message(self.conv_id, self._message("one"))
+        self.assertFalse(self.repo._wakeup.is_set())
+
+        self.repo.push_message(self.conv_id, self._message("two"))
+        self.assertTrue(self.repo._wakeup.is_set())
+
+    def test_reads_flush_pending_messages(self):
+        self.repo.push_message(self.conv_id, self._message("Hello"))
+
+        messages = self.repo.get_latest_messages(self.conv_id, 10)
+        self.assertEqual([m["text"] for m in messages], ["Hello"])
+
+    def test_push_message_validation_error(self):
+        with self.assertRaises(MessageStorageError):
+            self.repo.push_message(self.conv_id, {"sender": self.user.id, "text": "Hello"})
+        self.assertEqual(self.repo.pending_count, 0)
+
+    @patch("apps.chats.repositories.db_repo.Message.objects.bulk_create")
+    def test_flush_requeues_when_database_unavailable(self, mock_bulk_create):
+        mock_bulk_create.side_effect = OperationalError("connection refused")
+        self.repo.push_message(self.conv_id, self._message("Hello"))
+
+        self.assertEqual(self.repo.flush(), 0)
+        self.assertEqual(self.repo.pending_count, 1)
@@ -0,0 +1,27 @@
+import uuid
+from datetime import datetime, timezone, timedelta
+from unittest import TestCase
+
+from apps.chats.ids import uuid7
+
+
+class Uuid7Tests(TestCase):
+    def test_layout(self):
+        value = uuid7()
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.variant, uuid.RFC_4122)
+
+    def test_ids_increase_within_a_millisecond(self):
+        now = datetime.now(timezone.utc)
+        ids = [uuid7(now) for _ in range(5000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual([str(i) for i in ids], sorted(str(i) for i in ids))
+
+    def test_time_is_encoded(self):
+        dt = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        self.assertEqual(uuid7(dt).int >> 80, int(dt.timestamp() * 1000))
+
+    def test_ids_sort_by_time(self):
+        dt = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        self.assertLess(uuid7(dt), uuid7(dt + timedelta(milliseconds=1)))
@@ -0,0 +1,73 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+import redis
+
+from apps.chats.invalidation import InvalidationChannel
+
+
+class InvalidationChannelTests(TestCase):
+    def setUp(self):
+        self.redis_client = MagicMock()
+        self.on_message = MagicMock()
+        self.on_reset = MagicMock()
+        self.channel = InvalidationChannel(self.redis_client, 'cache:invalidate', self.on_message, self.on_reset)
+
+    def test_subscribes_once(self):
+        self.assertTrue(self.channel.subscribe())
+        self.assertTrue(self.channel.subscribe())
+
+        self.redis_client.pubsub.return_value.subscribe.assert_called_once()
+        self.redis_client.pubsub.return_value.run_in_thread.assert_called_once()
+
+    @patch("apps.chats.invalidation.time.monotonic")
+    def test_failed_subscription_is_retried_after_backoff(self, mock_monotonic):
+        pubsub = self.redis_client.pubsub.return_value
+        pubsub.subscribe.side_effect = [redis.ConnectionError("down"), redis.ConnectionError("down"), None]
+        mock_monotonic.return_value = 100
+
+        self.assertFalse(self.channel.subscribe())
+        # Within the retry delay no connection is attempted
+        self.assertFalse(self.channel.subscribe())
+        self.assertEqual(pubsub.subscribe.call_count, 1)
+
+        mock_monotonic.return_value = 101
+        self.assertFalse(self.channel.subscribe())
+        # The delay doubles after every failure
+        mock_monotonic.return_value = 102.5
+        self.assertFalse(self.channel.subscribe())
+        self.assertEqual(pubsub.subscribe.call_count, 2)
+
+        mock_monotonic.return_value = 103
+        self.assertTrue(self.channel.subscribe())
+        self.assertEqual(pubsub.subscribe.call_count, 3)
+
+    def test_concurrent_subscribe_does_not_wait_for_attempt(self):
+        self.channel._lock.acquire()
+        try:
+            self.assertFalse(self.channel.subscribe())
+        finally:
+            self.channel._lock.release()
+        self.redis_client.pubsub.assert_not_called()
+
+    def test_interrupted_subscription_resets_cache(self):
+        self.channel.subscribe()
+        thread = self.redis_client.pubsub.return_value.run_in_thread.return_value
+
+        self.channel._on_error(redis.ConnectionError("lost"), None, thread)
+
+        thread.stop.assert_called_once()
+        self.on_reset.assert_called_once()
+        # The next store subscribes again
+        self.channel.subscribe()
+        self.assertEqual(self.redis_client.pubsub.return_value.run_in_thread.call_count, 2)
+
+    def test_messages_are_decoded(self):
+        self.channel._on_message({'type': 'message', 'data': b'conv1'})
+        self.on_message.assert_called_once_with('conv1')
+
+    def test_without_redis_the_cache_is_local(self):
+        channel = InvalidationChannel(None, 'cache:invalidate', self.on_message, self.on_reset)
+        self.assertTrue(channel.subscribe())
+        channel.publish('conv1')
+        self.on_message.assert_not_called()
@@ -0,0 +1,113 @@
+import asyncio
+from unittest import TestCase as UnitTestCase
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from apps.chats.metrics import Counter, Gauge, Histogram, Registry, OPERATION_ERRORS, OPERATION_LATENCY, \
+    CHANNEL_GROUPS, timed, group_joined, group_left
+
+MyUser = get_user_model()
+
+
+class RegistryTests(UnitTestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_renders_counters_and_gauges_with_labels(self):
+        counter = Counter('test_events_total', "Events", ['kind'], registry=self.registry)
+        gauge = Gauge('test_open', "Open things", registry=self.registry)
+        counter.labels('a"b').inc()
+        counter.labels('a"b').inc(2)
+        gauge.set(5)
+        gauge.dec()
+
+        self.assertEqual(self.registry.render(), (
+            '# HELP test_events_total Events\n'
+            '# TYPE test_events_total counter\n'
+            'test_events_total{kind="a\\"b"} 3.0\n'
+            '# HELP test_open Open things\n'
+            '# TYPE test_open gauge\n'
+            'test_open 4.0\n'
+        ))
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('test_seconds', "Latency", ['op'], buckets=(0.1, 1), registry=self.registry)
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.labels('read').observe(value)
+
+        lines = self.registry.render().splitlines()
+        self.assertIn('test_seconds_bucket{op="read",le="0.1"} 1.0', lines)
+        self.assertIn('test_seconds_bucket{op="read",le="1.0"} 3.0', lines)
+        self.assertIn('test_seconds_bucket{op="read",le="+Inf"} 4.0', lines)
+        self.assertIn('test_seconds_sum{op="read"} 4.05', lines)
+        self.assertIn('test_seconds_count{op="read"} 4.0', lines)
+
+    def test_function_metrics_are_read_at_render_time(self):
+        depth = [1]
+        Gauge('test_depth', "Depth", registry=self.registry).set_function(lambda: depth[0])
+        depth[0] = 7
+
+        self.assertIn('test_depth 7.0', self.registry.render().splitlines())
+
+    def test_counters_only_increase_and_names_are_unique(self):
+        counter = Counter('test_total', "Total", registry=self.registry)
+        with self.assertRaises(ValueError):
+            counter.inc(-1)
+        with self.assertRaises(ValueError):
+            Counter('test_total', "Again", registry=self.registry)
+
+
+class TimedTests(UnitTestCase):
+    def test_records_latency_and_errors_for_sync_and_async_calls(self):
+        @timed('test', 'sync_op')
+        def fails():
+            raise KeyError('missing')
+
+        @timed('test', 'async_op')
+        async def succeeds():
+            return 'ok'
+
+        with self.assertRaises(KeyError):
+            fails()
+        self.assertEqual(asyncio.run(succeeds()), 'ok')
+
+        self.assertEqual(OPERATION_LATENCY.value('test', 'sync_op')['count'], 1)
+        self.assertEqual(OPERATION_LATENCY.value('test', 'async_op')['count'], 1)
+        self.assertEqual(OPERATION_ERRORS.value('test', 'sync_op', 'KeyError'), 1)
+        self.assertEqual(OPERATION_ERRORS.value('test', 'async_op', 'KeyError'), 0)
+
+    def test_groups_are_counted_once_per_process(self):
+        before = CHANNEL_GROUPS.value()
+        group_joined('test_group')
+        group_joined('test_group')
+        self.assertEqual(CHANNEL_GROUPS.value(), before + 1)
+
+        group_left('test_group')
+        self.assertEqual(CHANNEL_GROUPS.value(), before + 1)
+        group_left('test_group')
+        self.assertEqual(CHANNEL_GROUPS.value(), before)
+
+
+class MetricsViewTests(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user(first_name="user1", last_name='user1', email='example@gmail.com', password="pass")
+
+    def test_requires_staff_user(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        self.user.is_admin = True
+        self.user.save()
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'# TYPE chat_operation_duration_seconds histogram', response.content)
+
+    @override_settings(CHAT_METRICS_TOKEN='secret')
+    def test_accepts_bearer_token(self):
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import TestCase as SimpleTestCase, skipIf, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import TestCase
+
+from apps.chats.models import Conversation, Message
+from apps.chats.partitions import month_start, partition_name, partition_month, months_between, expired_partitions, \
+    default_partition_name, enable_partitioning, is_partitioned, list_partitions
+from apps.chats.repositories import DatabaseMessageRepo
+
+MyUser = get_user_model()
+
+
+class PartitionHelpersTests(SimpleTestCase):
+    def test_month_start_offsets_across_years(self):
+        dt = datetime(2025, 1, 15, 10, 30, tzinfo=timezone.utc)
+        self.assertEqual(month_start(dt), datetime(2025, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(month_start(dt, -1), datetime(2024, 12, 1, tzinfo=timezone.utc))
+        self.assertEqual(month_start(dt, 12), datetime(2026, 1, 1, tzinfo=timezone.utc))
+
+    def test_partition_name_round_trips(self):
+        month = datetime(2025, 3, 1, tzinfo=timezone.utc)
+        name = partition_name(month)
+        self.assertEqual(name, "chats_message_p202503")
+        self.assertEqual(partition_month(name), month)
+        self.assertIsNone(partition_month("chats_message"))
+
+    def test_months_between_is_inclusive(self):
+        months = months_between(
+            datetime(2024, 11, 20, tzinfo=timezone.utc),
+            datetime(2025, 2, 1, tzinfo=timezone.utc)
+        )
+        self.assertEqual([f"{m:%Y%m}" for m in months], ["202411", "202412", "202501", "202502"])
+
+    def test_expired_partitions_keep_retention_window(self):
+        names = ["chats_message_p202412", "chats_message_p202501", "chats_message_p202502", "other"]
+        now = datetime(2025, 4, 10, tzinfo=timezone.utc)
+        self.assertEqual(expired_partitions(names, now, 2), ["chats_message_p202412", "chats_message_p202501"])
+
+
+@skipIf(connection.vendor == 'postgresql', "Checks the error on other backends")
+class PartitionCommandTests(TestCase):
+    def test_requires_postgres(self):
+        with self.assertRaises(CommandError):
+            call_command('chat_message_partitions', 'maintain')
+
+
+class PartitionedHistoryReadTests(TestCase):
+    def setUp(self):
+        self.repo = DatabaseMessageRepo(partitioned=True)
+        self.user = MyUser.objects.create_user(first_name="user1", last_name='user1', email='example@gmail.com', password="pass")
+        self.conversation = Conversation.objects.create()
+        self.conv_id = str(self.conversation.id)
+        self.now = datetime.now(timezone.utc)
+
+    def _add(self, text, timestamp):
+        Message.objects.create(conversation=self.conversation, sender=self.user, text=text, timestamp=timestamp)
+
+    def test_recent_page_reads_only_newest_partitions(self):
+        for i in range(3):
+            self._add(f"new{i}", self.now - timedelta(seconds=3 - i))
+
+        with self.assertNumQueries(1):
+            messages = self.repo.get_latest_messages(self.conv_id, 2)
+        self.assertEqual([m['text'] for m in messages], ["new1", "new2"])
+
+    def test_short_page_continues_into_older_partitions(self):
+        self._add("old0", month_start(self.now, -3))
+        self._add("old1", month_start(self.now, -2))
+        self._add("new0", self.now - timedelta(seconds=1))
+
+        with self.assertNumQueries(2):
+            messages = self.repo.get_latest_messages(self.conv_id, 2)
+        self.assertEqual([m['text'] for m in messages], ["old1", "new0"])
+
+    def test_before_page_is_bounded_by_cursor_month(self):
+        cursor = month_start(self.now, -4)
+        self._add("older", cursor - timedelta(days=45))
+        self._add("recent", cursor - timedelta(days=1))
+        self._add("after", cursor + timedelta(days=1))
+
+        messages = self.repo.get_messages_before(self.conv_id, cursor.isoformat(), 5)
+        self.assertEqual([m['text'] for m in messages], ["older", "recent"])
+
+
+@skipUnless(connection.vendor == 'postgresql', "Message partitioning requires PostgreSQL")
+class PostgresPartitioningTests(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user(first_name="user1", last_name='user1', email='example@gmail.com', password="pass")
+        self.conversation = Conversation.objects.create()
+        self.conv_id = str(self.conversation.id)
+        self.now = datetime.now(timezone.utc)
+
+    def _add(self, text, timestamp):
+        return Message.objects.create(conversation=self.conversation, sender=self.user, text=text, timestamp=timestamp)
+
+    def _count(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {connection.ops.quote_name(table)}")
+            return cursor.fetchone()[0]
+
+    def test_enable_keeps_rows_and_history(self):
+        self._add("old", month_start(self.now, -2) + timedelta(days=1))
+        self._add("new", self.now - timedelta(seconds=1))
+
+        self.assertEqual(enable_partitioning(self.now, 2), 2)
+
+        self.assertTrue(is_partitioned())
+        names = list_partitions()
+        self.assertIn(default_partition_name(), names)
+        self.assertIn(partition_name(month_start(self.now, -2)), names)
+        self.assertIn(partition_name(month_start(self.now, 2)), names)
+
+        repo = DatabaseMessageRepo(partitioned=True)
+        self.assertEqual([m['text'] for m in repo.get_latest_messages(self.conv_id, 5)], ["old", "new"])
+
+        # The primary key is (id, timestamp), so re-pushing the same message is still ignored
+        message = {'id': str(Message.objects.get(text="new").id), 'sender': self.user.id, 'text': "new",
+                   'timestamp': (self.now - timedelta(seconds=1)).isoformat()}
+        repo.push_messages(self.conv_id, [message])
+        self.assertEqual(Message.objects.filter(conversation=self.conversation).count(), 2)
+
+    def test_missing_month_lands_in_default_until_maintained(self):
+        enable_partitioning(self.now, 1)
+        later = month_start(self.now, 6) + timedelta(days=2)
+        self._add("later", later)
+        self.assertEqual(self._count(default_partition_name()), 1)
+
+        out, err = StringIO(), StringIO()
+        call_command('chat_message_partitions', 'maintain', '--months-ahead', '1', stdout=out, stderr=err)
+
+        self.assertIn(partition_name(later), err.getvalue())
+        self.assertEqual(self._count(default_partition_name()), 0)
+        self.assertEqual(self._count(partition_name(later)), 1)
+        self.assertEqual(Message.objects.get(text="later").timestamp, later)
@@ -2,15 +2,28 @@ import json
 import uuid
 from datetime import datetime, timedelta, timezone
 
+import fakeredis
 import redis
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
+from apps.chats.codecs import decode_message
 from apps.chats.exceptions import MessageStorageError, MessageRetrievalError, TooManyMessageException
 from apps.chats.repositories import RedisMessageRepo
-from apps.chats.repositories.redis_repo import RedisConsumerRepo
+from apps.chats.repositories.redis_repo import RedisConsumerRepo, RedisRateLimiterRepo, RedisPresenceRepo, \
+    RedisConversationListRepo
 from apps.chats.services.chat_services import ChatService
 
 
+# A local server when one is running, otherwise an in-process fake that still runs the Lua scripts
+def integration_redis_client() -> redis.Redis:
+    client = redis.Redis(host='localhost', port=6379, db=1)
+    try:
+        client.ping()
+        return client
+    except redis.ConnectionError:
+        return fakeredis.FakeRedis()
+
+
 class RedisMessageRepoTests(TestCase):
     def setUp(self):
         patcher = patch("apps.chats.repositories.redis_repo.redis.from_url")
@@ -21,9 +34,72 @@ class RedisMessageRepoTests(TestCase):
         self.repo = RedisMessageRepo(redis_client=self.mock_redis_client)
 
     def test_push_message_success(self):
-        message = {"sender": "user1", "text": "Hello", "timestamp": datetime(2025, 1, 1, 12, 0).timestamp()}
+        pipe = self.mock_redis_client.pipeline.return_value
+        timestamp = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        message = {"id": "m1", "sender": "user1", "text": "Hello", "timestamp": timestamp.isoformat()}
         self.repo.push_message("conv1", message)
-        self.mock_redis_client.rpush.assert_called_once_with("chat:conv1", json.dumps(message))
+
+        self.mock_redis_client.pipeline.assert_called_once_with(transaction=True)
+        pipe.rpush.assert_called_once_with("chat:conv1", json.dumps(message))
+        pipe.zadd.assert_any_call("chat:conv1:sender_ids:user1", {"m1": timestamp.timestamp()})
+        pipe.zadd.assert_any_call("chat:conv1:ids", {"m1": timestamp.timestamp()})
+        pipe.hset.assert_called_once_with("chat:conv1:payloads", mapping={"m1": json.dumps(message)})
+        pipe.sadd.assert_called_once_with("chat:conv1:senders", "user1")
+        pipe.ltrim.assert_not_called()
+        pipe.zremrangebyrank.assert_not_called()
+        pipe.eval.assert_not_called()
+        pipe.execute.assert_called_once()
+
+    def test_push_message_capped_trims_atomically(self):
+        repo = RedisMessageRepo(redis_client=self.mock_redis_client, max_length=100)
+        pipe = self.mock_redis_client.pipeline.return_value
+        message = {"id": "m1", "sender": "user1", "text": "Hello", "timestamp": "2025-01-01T12:00:00+00:00"}
+
+        repo.push_message("conv1", message)
+
+        self.mock_redis_client.pipeline.assert_called_once_with(transaction=True)
+        pipe.rpush.assert_called_once_with("chat:conv1", json.dumps(message))
+        pipe.ltrim.assert_called_once_with("chat:conv1", -100, -1)
+        pipe.zremrangebyrank.assert_called_once_with("chat:conv1:sender_ids:user1", 0, -101)
+        self.assertEqual(pipe.eval.call_args.args[1:], (2, "chat:conv1:ids", "chat:conv1:payloads", 100))
+        pipe.execute.assert_called_once()
+        self.mock_redis_client.rpush.assert_not_called()
+
+    def test_push_message_capped_redis_error(self):
+        repo = RedisMessageRepo(redis_client=self.mock_redis_client, max_length=100)
+        self.mock_redis_client.pipeline.return_value.execute.side_effect = redis.RedisError("Redis error")
+        message = {"sender": "user1", "text": "Hello", "timestamp": datetime(2025, 1, 1, 12, 0).timestamp()}
+
+        with self.assertRaises(MessageStorageError):
+            repo.push_message("conv1", message)
+
+    def test_push_messages_single_pipeline_chunked(self):
+        pipe = self.mock_redis_client.pipeline.return_value
+        messages = [{"sender": "user1", "text": f"msg{i}", "timestamp": "2025-01-01T12:00:00+00:00"} for i in range(2500)]
+
+        self.repo.push_messages("conv1", messages)
+
+        self.mock_redis_client.pipeline.assert_called_once()
+        main_pushes = [c for c in pipe.rpush.call_args_list if c.args[0] == "chat:conv1"]
+        self.assertEqual(len(main_pushes), 3)
+        self.assertEqual(len(main_pushes[0].args), 1 + RedisMessageRepo.PUSH_CHUNK_SIZE)
+        pipe.execute.assert_called_once()
+        self.mock_redis_client.rpush.assert_not_called()
+
+    def test_push_messages_capped_pushes_only_tail(self):
+        repo = RedisMessageRepo(redis_client=self.mock_redis_client, max_length=10)
+        pipe = self.mock_redis_client.pipeline.return_value
+        messages = [{"sender": "user1", "text": f"msg{i}", "timestamp": "2025-01-01T12:00:00+00:00"} for i in range(50)]
+
+        repo.push_messages("conv1", messages)
+
+        pipe.rpush.assert_any_call("chat:conv1", *[json.dumps(m) for m in messages[-10:]])
+        pipe.ltrim.assert_any_call("chat:conv1", -10, -1)
+
+    def test_push_messages_validation_error(self):
+        with self.assertRaises(ValueError):
+            self.repo.push_messages("conv1", [{"sender": "user1", "text": "Hello"}])
+        self.mock_redis_client.pipeline.assert_not_called()
 
     def test_push_message_validation_error(self):
         invalid_message = {"sender": "user1", "text": "Hello"}
@@ -32,7 +108,7 @@ class RedisMessageRepoTests(TestCase):
 
     def test_push_message_redis_error(self):
         message = {"sender": "user1", "text": "Hello", "timestamp": datetime(2025, 1, 1, 12, 0).timestamp()}
-        self.mock_redis_client.rpush.side_effect = redis.RedisError("Redis error")
+        self.mock_redis_client.pipeline.return_value.execute.side_effect = redis.RedisError("Redis error")
         with self.assertRaises(MessageStorageError):
             self.repo.push_message("conv1", message)
 
@@ -59,32 +135,155 @@ class RedisMessageRepoTests(TestCase):
             self.repo.get_messages("conv1")
 
 
+class RedisMessagePaginationTests(TestCase):
+    def setUp(self):
+        self.mock_client = MagicMock()
+        self.repo = RedisMessageRepo(redis_client=self.mock_client)
+        base = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        self.stored = [
+            json.dumps({"sender": 1, "text": f"msg{i}", "timestamp": (base + timedelta(minutes=i)).isoformat()})
+            for i in range(250)
+        ]
+        self.cursor = (base + timedelta(minutes=120)).isoformat()
+
+        def lrange(key, start, end):
+            end = len(self.stored) + end + 1 if end < 0 else end + 1
+            start = max(len(self.stored) + start, 0) if start < 0 else start
+            return self.stored[start:end]
+
+        self.mock_client.lrange.side_effect = lrange
+
+    def test_get_latest_messages_uses_tail_range(self):
+        messages = self.repo.get_latest_messages("conv1", 3)
+        self.mock_client.lrange.assert_called_once_with("chat:conv1", -3, -1)
+        self.assertEqual([m["text"] for m in messages], ["msg247", "msg248", "msg249"])
+
+    def test_get_messages_before_walks_back_from_tail(self):
+        messages = self.repo.get_messages_before("conv1", self.cursor, 3)
+        self.assertEqual([m["text"] for m in messages], ["msg117", "msg118", "msg119"])
+        self.assertEqual(self.mock_client.lrange.call_count, 2)
+
+    def test_get_messages_before_stops_at_list_head(self):
+        cursor = datetime(2025, 1, 1, 12, 2, tzinfo=timezone.utc).isoformat()
+        messages = self.repo.get_messages_before("conv1", cursor, 10)
+        self.assertEqual([m["text"] for m in messages], ["msg0", "msg1"])
+
+    def test_get_messages_before_redis_error(self):
+        self.mock_client.lrange.side_effect = redis.RedisError("fail")
+        with self.assertRaises(MessageRetrievalError):
+            self.repo.get_messages_before("conv1", self.cursor, 3)
+
+    def test_get_messages_before_breaks_timestamp_ties_by_id(self):
+        timestamp = "2025-01-01T12:00:00+00:00"
+        ids = [f"018d0000-0000-7000-8000-00000000000{i}" for i in range(4)]
+        self.stored[:] = [json.dumps({"id": _id, "sender": 1, "text": _id, "timestamp": timestamp}) for _id in ids]
+
+        messages = self.repo.get_messages_before("conv1", f"{timestamp}|{ids[2]}", 10)
+
+        self.assertEqual([m["id"] for m in messages], ids[:2])
+
+
 class RedisMessageUserByIdRepoTests(TestCase):
     def setUp(self):
         self.mock_client = MagicMock()
         self.repo = RedisMessageRepo(redis_client=self.mock_client)
 
-    def test_get_messages_by_user_id_success(self):
+    def test_get_messages_by_user_id_reads_indexed_payloads(self):
+        conv_id = str(uuid.uuid4())
+        mine = {"id": "m2", "sender": 1, "text": "hi", "timestamp": "2025-09-25T12:01:00+00:00"}
+        self.mock_client.zrange.return_value = [b"m1", b"m2"]
+        self.mock_client.hmget.return_value = [None, json.dumps(mine)]
+
+        result = self.repo.get_messages_by_user_id(conv_id, 1)
+
+        self.mock_client.zrange.assert_called_once_with(f"chat:{conv_id}:sender_ids:1", 0, -1)
+        self.mock_client.hmget.assert_called_once_with(f"chat:{conv_id}:payloads", [b"m1", b"m2"])
+        self.mock_client.lrange.assert_not_called()
+        # m1 was trimmed with the conversation list, so it isn't returned and leaves the index
+        self.assertEqual(result, [mine])
+        self.mock_client.zrem.assert_called_once_with(f"chat:{conv_id}:sender_ids:1", b"m1")
+
+    def test_get_messages_by_user_id_without_index_skips_payloads(self):
+        self.mock_client.zrange.return_value = []
+        self.assertEqual(self.repo.get_messages_by_user_id("conv1", 1), [])
+        self.mock_client.hmget.assert_not_called()
+
+    def test_push_messages_indexes_each_sender_once(self):
+        pipe = self.mock_client.pipeline.return_value
         messages = [
-            json.dumps({"sender": "1", "text": "hi", "timestamp": "2025-09-25T12:00:00Z"}),
-            json.dumps({"sender": "2", "text": "hello", "timestamp": "2025-09-25T12:01:00Z"}),
+            {"id": "a", "sender": 1, "text": "a", "timestamp": "2025-09-25T12:00:00+00:00"},
+            {"id": "b", "sender": 2, "text": "b", "timestamp": "2025-09-25T12:01:00+00:00"},
+            {"id": "c", "sender": 1, "text": "c", "timestamp": "2025-09-25T12:02:00+00:00"},
         ]
-        self.repo.redis_client.lrange.return_value = messages
-        result = self.repo.get_messages_by_user_id(str(uuid.uuid4()), 1)
-        self.assertEqual(len(result), 1)
-        self.assertEqual(result[0]["text"], "hi")
+        self.repo.push_messages("conv1", messages)
+
+        pipe.rpush.assert_called_once_with("chat:conv1", *[json.dumps(m) for m in messages])
+        pipe.zadd.assert_any_call("chat:conv1:sender_ids:1", {"a": 1758801600.0, "c": 1758801720.0})
+        pipe.zadd.assert_any_call("chat:conv1:sender_ids:2", {"b": 1758801660.0})
+        pipe.sadd.assert_called_once_with("chat:conv1:senders", "1", "2")
+
+    def test_clear_messages_removes_sender_index(self):
+        self.mock_client.smembers.return_value = {b"1"}
+        self.mock_client.delete.return_value = 3
+        self.repo.clear_messages("conv1")
+        self.mock_client.delete.assert_called_once_with(
+            "chat:conv1", "chat:conv1:senders", "chat:conv1:ids", "chat:conv1:payloads",
+            "chat:conv1:sender_ids:1", "chat:conv1:sender:1"
+        )
 
     def test_get_messages_by_user_id_redis_error(self):
-        self.repo.redis_client.lrange.side_effect = redis.RedisError("fail")
+        self.repo.redis_client.zrange.side_effect = redis.RedisError("fail")
         with self.assertRaises(MessageRetrievalError):
             self.repo.get_messages_by_user_id(str(uuid.uuid4()), 1)
 
     def test_get_messages_by_user_id_json_error(self):
-        self.repo.redis_client.lrange.return_value = ["not json"]
+        self.repo.redis_client.zrange.return_value = [b"m1"]
+        self.repo.redis_client.hmget.return_value = ["not json"]
         with self.assertRaises(MessageRetrievalError):
             self.repo.get_messages_by_user_id(str(uuid.uuid4()), 1)
 
 
+class RedisSenderIndexIntegrationTests(TestCase):
+    def setUp(self):
+        self.redis_client = integration_redis_client()
+        self.redis_client.flushdb()
+        self.repo = RedisMessageRepo(self.redis_client, max_length=4)
+
+    def tearDown(self):
+        self.redis_client.flushdb()
+        self.redis_client.close()
+
+    def test_sender_index_is_trimmed_with_conversation_list(self):
+        base = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        messages = [
+            {"id": f"m{i}", "sender": i % 2, "text": f"msg{i}", "timestamp": (base + timedelta(minutes=i)).isoformat()}
+            for i in range(10)
+        ]
+        for message in messages:
+            self.repo.push_message("conv1", message)
+
+        cached = self.repo.get_messages("conv1")
+        for sender in (0, 1):
+            self.assertEqual(self.repo.get_messages_by_user_id("conv1", sender),
+                             [m for m in cached if m["sender"] == sender])
+            self.assertLessEqual(self.redis_client.zcard(f"chat:conv1:sender_ids:{sender}"), 4)
+        self.assertEqual(self.redis_client.hlen("chat:conv1:payloads"), 4)
+
+    def test_sender_lookup_cost_ignores_other_senders(self):
+        repo = RedisMessageRepo(self.redis_client, max_length=1000)
+        base = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        mine = {"id": "mine", "sender": 1, "text": "first", "timestamp": base.isoformat()}
+        repo.push_message("conv1", mine)
+        repo.push_messages("conv1", [
+            {"id": f"m{i}", "sender": 2, "text": f"msg{i}", "timestamp": (base + timedelta(seconds=i + 1)).isoformat()}
+            for i in range(999)
+        ])
+
+        with patch("apps.chats.repositories.redis_repo.decode_message", wraps=decode_message) as decode:
+            self.assertEqual(repo.get_messages_by_user_id("conv1", 1), [mine])
+        self.assertEqual(decode.call_count, 1)
+
+
 class TestDeleteSetMethod(TestCase):
 
     def setUp(self):
@@ -140,14 +339,192 @@ class TestDeleteSetMethod(TestCase):
         mock_logger.error.assert_called_once()
 
 
+class RedisRateLimiterRepoTests(TestCase):
+    def setUp(self):
+        self.redis_client_mock = MagicMock()
+        self.script = self.redis_client_mock.register_script.return_value
+        self.limiter = RedisRateLimiterRepo(self.redis_client_mock)
+
+    def test_script_registered_once(self):
+        self.redis_client_mock.register_script.assert_called_once_with(RedisRateLimiterRepo.HIT_SCRIPT)
+
+    def test_hit_allowed(self):
+        self.script.return_value = 0
+        self.assertIsNone(self.limiter.hit("throttle:conv1:1", 1, 10))
+
+        kwargs = self.script.call_args.kwargs
+        self.assertEqual(kwargs["keys"], ["throttle:conv1:1"])
+        self.assertEqual(kwargs["args"][:2], [1, 10])
+
+    def test_hit_exceeded(self):
+        self.script.return_value = 1
+        self.assertEqual(self.limiter.hit("throttle:conv1:1", 1, 10), "second")
+        self.script.return_value = 2
+        self.assertEqual(self.limiter.hit("throttle:conv1:1", 1, 10), "minute")
+
+    def test_hit_redis_error(self):
+        self.script.side_effect = redis.RedisError("fail")
+        with self.assertRaises(MessageStorageError):
+            self.limiter.hit("throttle:conv1:1", 1, 10)
+
+
+class RedisRateLimiterIntegrationTests(TestCase):
+    def setUp(self):
+        self.redis_client = integration_redis_client()
+
+        self.redis_client.flushdb()
+        self.limiter = RedisRateLimiterRepo(self.redis_client)
+
+    def tearDown(self):
+        if hasattr(self, 'redis_client'):
+            self.redis_client.flushdb()
+            self.redis_client.close()
+
+    def test_sliding_window_real_redis(self):
+        key = "throttle:integration:1"
+        self.assertIsNone(self.limiter.hit(key, 2, 3))
+        self.assertIsNone(self.limiter.hit(key, 2, 3))
+        self.assertEqual(self.limiter.hit(key, 2, 3), "second")
+        self.assertEqual(self.redis_client.zcard(key), 2)
+        self.assertGreater(self.redis_client.pttl(key), 0)
+
+
+class RedisPresenceRepoTests(TestCase):
+    def setUp(self):
+        self.redis_client_mock = MagicMock()
+        self.script = self.redis_client_mock.register_script.return_value
+        self.presence = RedisPresenceRepo(self.redis_client_mock, ttl=45)
+
+    def test_touch_passes_keys_and_ttl(self):
+        self.script.return_value = 2
+        self.assertEqual(self.presence.touch("conv1", 1, "chan-a"), 2)
+
+        kwargs = self.script.call_args.kwargs
+        self.assertEqual(kwargs["keys"], ["presence:conv1", "presence:conv1:user:1"])
+        self.assertEqual(kwargs["args"], [1, "chan-a", 45000])
+
+    def test_expire_returns_user_ids(self):
+        self.script.return_value = [b"1", b"2"]
+        self.assertEqual(self.presence.expire("conv1"), ["1", "2"])
+        self.assertEqual(self.script.call_args.kwargs["args"], ["presence:conv1:user:", 45000])
+
+    def test_members_are_paginated(self):
+        self.redis_client_mock.zrevrange.return_value = [b"3"]
+        self.assertEqual(self.presence.members("conv1", 10, 5), ["3"])
+        self.redis_client_mock.zrevrange.assert_called_once_with("presence:conv1", 10, 14)
+
+    def test_count_reads_cardinality(self):
+        self.redis_client_mock.zcard.return_value = 7
+        self.assertEqual(self.presence.count("conv1"), 7)
+        self.redis_client_mock.zcard.assert_called_once_with("presence:conv1")
+
+    def test_touch_redis_error(self):
+        self.script.side_effect = redis.RedisError("fail")
+        with self.assertRaises(MessageStorageError):
+            self.presence.touch("conv1", 1, "chan-a")
+
+
+class RedisPresenceIntegrationTests(TestCase):
+    def setUp(self):
+        self.redis_client = integration_redis_client()
+
+        self.redis_client.flushdb()
+        self.presence = RedisPresenceRepo(self.redis_client, ttl=45)
+
+    def tearDown(self):
+        if hasattr(self, 'redis_client'):
+            self.redis_client.flushdb()
+            self.redis_client.close()
+
+    def test_user_stays_until_last_connection_leaves(self):
+        self.assertEqual(self.presence.touch("conv1", 1, "tab-a"), 1)
+        self.assertEqual(self.presence.touch("conv1", 1, "tab-b"), 2)
+        self.assertEqual(self.presence.touch("conv1", 2, "tab-c"), 1)
+        self.assertEqual(self.presence.count("conv1"), 2)
+
+        self.assertEqual(self.presence.leave("conv1", 1, "tab-a"), 1)
+        self.assertEqual(self.presence.count("conv1"), 2)
+        self.assertEqual(self.presence.leave("conv1", 1, "tab-b"), 0)
+        self.assertEqual(self.presence.members("conv1"), ["2"])
+
+    def test_expire_removes_users_without_recent_heartbeat(self):
+        self.presence.touch("conv1", 1, "tab-a")
+        self.presence.touch("conv1", 2, "tab-b")
+        # Simulate user 1's worker dying a minute ago
+        self.redis_client.zadd("presence:conv1", {"1": 0})
+
+        self.assertEqual(self.presence.expire("conv1"), ["1"])
+        self.assertEqual(self.presence.members("conv1"), ["2"])
+        self.assertFalse(self.redis_client.exists("presence:conv1:user:1"))
+        self.assertGreater(self.redis_client.pttl("presence:conv1"), 0)
+
+
+class RedisConversationListIntegrationTests(TestCase):
+    def setUp(self):
+        self.redis_client = integration_redis_client()
+
+        self.redis_client.flushdb()
+        self.repo = RedisConversationListRepo(self.redis_client, changes_limit=2)
+
+    def tearDown(self):
+        if hasattr(self, 'redis_client'):
+            self.redis_client.flushdb()
+            self.redis_client.close()
+
+    def test_cold_cache_ignores_changes(self):
+        self.assertIsNone(self.repo.get_page(0, 10))
+        self.assertIsNone(self.repo.apply_change('joined', {'id': 'c1', 'name': 'Chat c1', 'created_at': 1}))
+        self.assertIsNone(self.repo.get_page(0, 10))
+
+    def test_pages_are_newest_first(self):
+        version = self.repo.rebuild([
+            {'id': 'c1', 'name': 'Chat c1', 'created_at': 1},
+            {'id': 'c2', 'name': 'Chat c2', 'created_at': 2},
+        ])
+
+        page = self.repo.get_page(0, 1)
+        self.assertEqual(page, {'version': version, 'total': 2, 'conversations': [{'id': 'c2', 'name': 'Chat c2'}]})
+
+    def test_changes_are_versioned(self):
+        version = self.repo.rebuild([{'id': 'c1', 'name': 'Chat c1', 'created_at': 1}])
+
+        added = self.repo.apply_change('joined', {'id': 'c2', 'name': 'Chat c2', 'created_at': 2})
+        removed = self.repo.apply_change('left', {'id': 'c1'})
+
+        self.assertEqual([added, removed], [version + 1, version + 2])
+        self.assertEqual(self.repo.get_page(0, 10)['conversations'], [{'id': 'c2', 'name': 'Chat c2'}])
+        changes = self.repo.get_changes(version + 1)
+        self.assertEqual(changes['version'], version + 2)
+        self.assertEqual(changes['changes'], [{'version': version + 2, 'status': 'left', 'id': 'c1', 'name': None}])
+
+    def test_version_survives_cache_expiry(self):
+        repo = RedisConversationListRepo(self.redis_client, changes_limit=2, ttl=60)
+        version = repo.rebuild([{'id': 'c1', 'name': 'Chat c1', 'created_at': 1}])
+        self.assertEqual(repo.apply_change('left', {'id': 'c1'}), version + 1)
+        self.assertEqual(self.redis_client.ttl(RedisConversationListRepo.VERSION_KEY), -1)
+
+        self.redis_client.delete(RedisConversationListRepo.WARM_KEY)
+        self.assertIsNone(repo.get_page(0, 10))
+        self.assertIsNone(repo.apply_change('joined', {'id': 'c2', 'name': 'Chat c2', 'created_at': 2}))
+        self.assertIsNone(repo.get_changes(version + 1))
+
+        # A client still holding version + 1 must not see older versions after the rebuild
+        self.assertEqual(repo.rebuild([]), version + 2)
+        self.assertEqual(repo.apply_change('joined', {'id': 'c3', 'name': 'Chat c3', 'created_at': 3}), version + 3)
+
+    def test_client_behind_change_log_gets_none(self):
+        version = self.repo.rebuild([])
+        for i in range(3):
+            self.repo.apply_change('joined', {'id': f'c{i}', 'name': f'Chat c{i}', 'created_at': i})
+
+        self.assertIsNone(self.repo.get_changes(version))
+        self.assertEqual(len(self.repo.get_changes(version + 1)['changes']), 2)
+
+
 class TestCleanupConversationIntegration(TestCase):
 
     def setUp(self):
-        try:
-            self.redis_client = redis.Redis(host='localhost', port=6379, db=1)
-            self.redis_client.ping()
-        except redis.ConnectionError:
-            self.skipTest("Redis server not available")
+        self.redis_client = integration_redis_client()
 
         self.redis_client.flushdb()
 
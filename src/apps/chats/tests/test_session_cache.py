@@ -0,0 +1,220 @@
+import json
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import fakeredis
+import redis
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from apps.chats import session_cache
+from apps.chats.consumers import config
+from apps.chats.metrics import registry
+from apps.chats.middleware import AuthRequiredMiddleware, AUTH_REJECTED_CLOSE_CODE
+from apps.chats.session_cache import SessionUserCache, get_session_user_cache
+
+MyUser = get_user_model()
+
+
+class SessionUserCacheTests(TestCase):
+    def setUp(self):
+        self.cache = SessionUserCache(max_size=2, ttl=30)
+        self.user = MyUser.objects.create_user(first_name="user1", last_name='user1', email='example@gmail.com', password="pass")
+
+    def test_get_returns_snapshot_copy(self):
+        self.cache.set("s1", self.user)
+
+        cached = self.cache.get("s1")
+        self.assertEqual(cached.id, self.user.id)
+        self.assertEqual(cached.email, self.user.email)
+        self.assertTrue(cached.is_authenticated)
+        self.assertIsNot(cached, self.cache.get("s1"))
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set("s1", self.user)
+        self.cache.set("s2", self.user)
+        self.cache.get("s1")
+        self.cache.set("s3", self.user)
+
+        self.assertIsNone(self.cache.get("s2"))
+        self.assertIsNotNone(self.cache.get("s1"))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    @patch("apps.chats.session_cache.time.monotonic")
+    def test_entries_expire_after_ttl(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.cache.set("s1", self.user)
+
+        mock_monotonic.return_value = 131
+        self.assertIsNone(self.cache.get("s1"))
+
+    def test_invalidate_user_drops_all_sessions(self):
+        self.cache.set("s1", self.user)
+        self.cache.set("s2", self.user)
+
+        self.cache.invalidate_user(self.user.id)
+
+        self.assertIsNone(self.cache.get("s1"))
+        self.assertIsNone(self.cache.get("s2"))
+
+    def test_shared_layer_fills_local_cache(self):
+        redis_client = MagicMock()
+        cache = SessionUserCache(ttl=30, redis_client=redis_client)
+        snapshot = {field: None for field in SessionUserCache.SNAPSHOT_FIELDS}
+        snapshot.update(id=self.user.id, email=self.user.email)
+        redis_client.get.return_value = json.dumps(snapshot)
+
+        self.assertEqual(cache.get_shared("s1").id, self.user.id)
+        self.assertEqual(cache.get("s1").id, self.user.id)
+        redis_client.get.assert_called_once_with("session_user:s1")
+        self.assertEqual(cache.stats()['shared_hits'], 1)
+
+    def test_shared_miss_is_counted(self):
+        self.assertIsNone(self.cache.get_shared("s1"))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_snapshot_loaded_before_an_invalidation_is_not_cached(self):
+        generation = self.cache.generation
+        self.cache.invalidate_user(self.user.id)
+
+        self.cache.set("s1", self.user, generation=generation)
+
+        self.assertIsNone(self.cache.get("s1"))
+
+    def test_stats_are_exported(self):
+        rendered = registry.render()
+        for name in ('chat_session_cache_size', 'chat_session_cache_hits_total', 'chat_session_cache_misses_total'):
+            self.assertIn(f'\n{name} ', rendered)
+
+
+class SessionUserCacheInvalidationTests(TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.user = MyUser.objects.create_user(first_name="user1", last_name='user1', email='example@gmail.com', password="pass")
+        # Two workers sharing one Redis
+        self.first = SessionUserCache(ttl=30, redis_client=fakeredis.FakeRedis(server=server), shared=False)
+        self.second = SessionUserCache(ttl=30, redis_client=fakeredis.FakeRedis(server=server), shared=False)
+        self.addCleanup(self.first.close)
+        self.addCleanup(self.second.close)
+
+    def wait_until_dropped(self, cache: SessionUserCache, session_key: str) -> bool:
+        deadline = time.monotonic() + 2
+        while cache.get(session_key) is not None:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def test_logout_in_another_process_drops_local_entry(self):
+        self.first.set("s1", self.user)
+        self.assertIsNotNone(self.first.get("s1"))
+
+        self.second.invalidate("s1")
+
+        self.assertTrue(self.wait_until_dropped(self.first, "s1"))
+
+    def test_user_update_in_another_process_drops_local_entries(self):
+        self.first.set("s1", self.user)
+        self.first.set("s2", self.user)
+
+        self.second.invalidate_user(self.user.id)
+
+        self.assertTrue(self.wait_until_dropped(self.first, "s1"))
+        self.assertTrue(self.wait_until_dropped(self.first, "s2"))
+
+    def test_entries_are_dropped_when_invalidations_may_have_been_missed(self):
+        self.first.set("s1", self.user)
+
+        self.first.invalidations._on_reconnect(None)
+
+        self.assertIsNone(self.first.get("s1"))
+
+    def test_local_layer_is_skipped_without_a_subscription(self):
+        redis_client = MagicMock()
+        redis_client.pubsub.return_value.subscribe.side_effect = redis.ConnectionError("down")
+        cache = SessionUserCache(ttl=30, redis_client=redis_client, shared=False)
+
+        cache.set("s1", self.user)
+
+        self.assertIsNone(cache.get("s1"))
+
+
+class SessionUserCacheFactoryTests(TestCase):
+    def test_cache_is_built_on_first_use_with_the_services_client(self):
+        with patch.object(session_cache, '_session_user_cache', None):
+            cache = get_session_user_cache()
+            self.addCleanup(cache.close)
+
+            self.assertIs(cache.redis, config.redis_client)
+            self.assertIs(get_session_user_cache(), cache)
+
+    def test_use_redis_clients_moves_the_cache(self):
+        client = fakeredis.FakeRedis()
+        self.enterContext(patch.object(config, 'chat_service', MagicMock()))
+        self.enterContext(patch.object(config, 'async_chat_service', MagicMock()))
+        self.enterContext(patch.object(config, 'redis_client', config.redis_client))
+        self.enterContext(patch.object(config, 'async_redis_client', config.async_redis_client))
+        self.enterContext(patch.object(session_cache, '_session_user_cache', None))
+        previous = get_session_user_cache()
+
+        config.use_redis_clients(client, fakeredis.FakeAsyncRedis())
+        self.addCleanup(get_session_user_cache().close)
+
+        self.assertIsNot(get_session_user_cache(), previous)
+        self.assertIs(get_session_user_cache().redis, client)
+        self.assertTrue(get_session_user_cache().invalidations.subscribe())
+
+
+class AuthMiddlewareSessionCacheTests(TestCase):
+    def setUp(self):
+        redis_client = fakeredis.FakeRedis()
+        self.cache = get_session_user_cache()
+        self.enterContext(patch.object(self.cache, 'redis', redis_client))
+        self.enterContext(patch.object(self.cache.invalidations, 'redis', redis_client))
+        self.cache.clear()
+        self.user = MyUser.objects.create_user(first_name="user1", last_name='user1', email='example@gmail.com', password="pass")
+        self.client.force_login(self.user)
+        self.session_key = self.client.session.session_key
+        self.middleware = AuthRequiredMiddleware(MagicMock())
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_repeated_handshakes_hit_cache(self):
+        first = async_to_sync(self.middleware.get_user)(self.session_key)
+        with self.assertNumQueries(0):
+            second = async_to_sync(self.middleware.get_user)(self.session_key)
+
+        self.assertEqual(first.id, self.user.id)
+        self.assertEqual(second.id, self.user.id)
+
+    def test_user_update_invalidates_cache(self):
+        async_to_sync(self.middleware.get_user)(self.session_key)
+
+        self.user.first_name = "renamed"
+        self.user.save()
+
+        self.assertIsNone(self.cache.get(self.session_key))
+        self.assertEqual(async_to_sync(self.middleware.get_user)(self.session_key).first_name, "renamed")
+
+    def test_logout_invalidates_cache(self):
+        async_to_sync(self.middleware.get_user)(self.session_key)
+
+        self.client.logout()
+
+        self.assertIsNone(self.cache.get(self.session_key))
+        self.assertFalse(async_to_sync(self.middleware.get_user)(self.session_key).is_authenticated)
+
+    def test_rejected_handshake_is_closed_with_auth_code(self):
+        receive, send = AsyncMock(return_value={'type': 'websocket.connect'}), AsyncMock()
+
+        async_to_sync(self.middleware)({'type': 'websocket', 'headers': []}, receive, send)
+
+        # Accepted first so the browser sees the code instead of a failed handshake
+        self.assertEqual([c.args[0] for c in send.await_args_list], [
+            {'type': 'websocket.accept'},
+            {'type': 'websocket.close', 'code': AUTH_REJECTED_CLOSE_CODE},
+        ])
+        self.middleware.inner.assert_not_called()
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import marshal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.urls import reverse
+
+from apps.chats.metrics import timed
+from apps.chats.tracing import span, traced
+
+MyUser = get_user_model()
+
+
+def written_traces(logs) -> list:
+    return [json.loads(record.getMessage()) for record in logs.records]
+
+
+class SpanTests(SimpleTestCase):
+    @override_settings(CHAT_TRACE_SAMPLE_RATE=1)
+    def test_sampled_root_writes_nested_spans_across_threads(self):
+        @timed('test', 'lookup')
+        def lookup():
+            with span('json.encode', frame='test'):
+                return 'ok'
+
+        @traced('test.handler')
+        async def handler():
+            return await asyncio.to_thread(lookup)
+
+        with self.assertLogs('trace', level='INFO') as logs:
+            self.assertEqual(asyncio.run(handler()), 'ok')
+
+        [trace] = written_traces(logs)
+        self.assertEqual(trace['name'], 'test.handler')
+        spans = {s['name']: s for s in trace['spans']}
+        self.assertEqual(list(spans), ['test.handler', 'test.lookup', 'json.encode'])
+        self.assertIsNone(spans['test.handler']['parent'])
+        self.assertEqual(spans['test.lookup']['parent'], spans['test.handler']['id'])
+        self.assertEqual(spans['json.encode']['attrs'], {'frame': 'test'})
+        self.assertNotEqual(spans['test.lookup']['thread'], spans['test.handler']['thread'])
+
+    @override_settings(CHAT_TRACE_SAMPLE_RATE=1)
+    def test_errors_are_recorded(self):
+        with self.assertLogs('trace', level='INFO') as logs:
+            with self.assertRaises(KeyError):
+                with span('test.fails'):
+                    raise KeyError('missing')
+
+        self.assertEqual(written_traces(logs)[0]['spans'][0]['error'], 'KeyError')
+
+    @override_settings(CHAT_TRACE_SAMPLE_RATE=0.5)
+    def test_unsampled_root_skips_its_children(self):
+        with patch('apps.chats.tracing.random.random', side_effect=[0.9, 0.1]):
+            with self.assertLogs('trace', level='INFO') as logs:
+                with span('test.skipped'):
+                    with span('test.child'):
+                        pass
+                with span('test.kept'):
+                    pass
+
+        self.assertEqual([t['name'] for t in written_traces(logs)], ['test.kept'])
+
+    @override_settings(CHAT_TRACE_SAMPLE_RATE=1)
+    def test_tasks_outliving_their_trace_start_a_new_one(self):
+        async def background():
+            await asyncio.sleep(0)
+            with span('test.background'):
+                pass
+
+        async def main():
+            with span('test.connect'):
+                task = asyncio.create_task(background())
+            await task
+
+        with self.assertLogs('trace', level='INFO') as logs:
+            asyncio.run(main())
+
+        self.assertEqual([t['name'] for t in written_traces(logs)], ['test.connect', 'test.background'])
+
+
+class ProfileViewTests(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user(first_name="user1", last_name='user1', email='example@gmail.com', password="pass")
+        self.client.force_login(self.user)
+
+    def test_requires_staff_user(self):
+        self.assertEqual(self.client.get(reverse('profile'), {'seconds': 0}).status_code, 403)
+
+    def test_captures_text_and_pstats_reports(self):
+        self.user.is_admin = True
+        self.user.save()
+
+        response = self.client.get(reverse('profile'), {'seconds': 0.01, 'sort': 'tottime', 'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('function calls', response.content.decode())
+
+        response = self.client.get(reverse('profile'), {'seconds': 0.01, 'format': 'pstats'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(marshal.loads(response.content), dict)
+
+        self.assertEqual(self.client.get(reverse('profile'), {'sort': 'bogus'}).status_code, 400)
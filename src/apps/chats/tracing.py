@@ -0,0 +1,123 @@
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from django.conf import settings
+
+from loggers import get_trace_logger
+
+logger = get_trace_logger()
+
+
+# Spans of one sampled root, e.g. a consumer handler, and everything it called.
+# Spans opened in sync_to_async threads join the trace through the copied context,
+# so the thread name on each span shows where time went: the event loop, the
+# thread pool (the gap before a span on a worker thread is time spent queued),
+# Redis, the database or JSON encoding.
+class Trace:
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.finished = False
+        self._ids = itertools.count(1)
+
+    def next_span_id(self) -> int:
+        return next(self._ids)
+
+
+# (trace, span id) of the innermost open span, or _UNSAMPLED inside a root that lost the draw
+_current: contextvars.ContextVar = contextvars.ContextVar('chat_trace_span', default=None)
+_UNSAMPLED = object()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    current = _current.get()
+    if current is _UNSAMPLED:
+        yield
+        return
+
+    # Tasks started inside a span, e.g. a connection's heartbeat, outlive its trace and start their own
+    if current is None or current[0].finished:
+        rate = settings.CHAT_TRACE_SAMPLE_RATE
+        if rate <= 0:
+            yield
+            return
+        if random.random() >= rate:
+            token = _current.set(_UNSAMPLED)
+            try:
+                yield
+            finally:
+                _current.reset(token)
+            return
+        trace, parent_id = Trace(), None
+    else:
+        trace, parent_id = current
+
+    span_id = trace.next_span_id()
+    token = _current.set((trace, span_id))
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        ended = time.perf_counter()
+        _current.reset(token)
+        trace.spans.append({
+            'id': span_id,
+            'parent': parent_id,
+            'name': name,
+            'start_ms': round((started - trace.started) * 1000, 3),
+            'duration_ms': round((ended - started) * 1000, 3),
+            'thread': threading.current_thread().name,
+            **({'error': error} if error else {}),
+            **({'attrs': attrs} if attrs else {}),
+        })
+        if parent_id is None:
+            trace.finished = True
+            _write(trace, name, ended)
+
+
+def traced(name: str):
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def _write(trace: Trace, name: str, ended: float):
+    try:
+        logger.info(json.dumps({
+            'trace_id': trace.trace_id,
+            'name': name,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'duration_ms': round((ended - trace.started) * 1000, 3),
+            'spans': sorted(trace.spans, key=lambda s: s['id']),
+        }, default=str))
+    except Exception:
+        # Tracing must never break the call it wraps
+        pass
@@ -1,11 +1,15 @@
+import json
+import uuid
 from datetime import datetime, timezone
 from typing import Literal
+from urllib.parse import parse_qs
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.http import SimpleCookie
 from django.urls import reverse
 
+from apps.chats.tracing import span
 from apps.users.serializers import MyUserSerializer
 
 MyUser = get_user_model()
@@ -18,11 +22,48 @@ def create_user_status_message(user: MyUser, status: Literal['joined' ,'left'])
         'user': MyUserSerializer(user).data
     }
 
-def create_conversation_status_message(_id: str, status: Literal['joined' ,'left']) -> dict:
+# Sent for users whose connections stopped heartbeating; only the id is known without a DB read
+def create_user_expired_message(user_id: int | str) -> dict:
+    return {
+        'type': 'user_status',
+        'status': 'left',
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'user': {'id': int(user_id)}
+    }
+
+# Group events carry the frame already encoded, so a broadcast is serialized once
+# by the sender instead of once per recipient connection.
+def create_group_event(handler: str, frame: dict) -> dict:
+    with span('json.encode', frame=handler):
+        return {
+            'type': handler,
+            'text': json.dumps(frame)
+        }
+
+# Confirms to the sender that its message was stored, with the cursor to resume from
+def create_ack_message(client_id: str, message: dict) -> dict:
+    return {
+        'type': 'ack',
+        'client_id': client_id,
+        'id': message.get('id'),
+        'cursor': create_cursor(message)
+    }
+
+def create_typing_message(user_id: int, typing: bool) -> dict:
+    return {
+        'type': 'typing',
+        'user_id': user_id,
+        'typing': typing
+    }
+
+def create_conversation_status_message(_id: str, status: Literal['joined' ,'left'],
+                                       name: str | None = None, version: int | None = None) -> dict:
     return {
         'type': 'conversation_status',
         'status': status,
-        'id': _id
+        'id': _id,
+        'name': name,
+        'version': version
     }
 
 def get_cookie_from_scope(scope, name: str):
@@ -33,6 +74,10 @@ def get_cookie_from_scope(scope, name: str):
         return cookie[name].value
     return None
 
+def get_query_param_from_scope(scope, name: str):
+    values = parse_qs(scope.get('query_string', b'').decode()).get(name)
+    return values[-1] if values else None
+
 
 def parse_iso_aware(ts: str) -> datetime:
     dt = datetime.fromisoformat(ts)
@@ -40,6 +85,19 @@ def parse_iso_aware(ts: str) -> datetime:
         dt = dt.replace(tzinfo=timezone.utc)
     return dt
 
+# History and resume cursors are "<timestamp>|<id>". Messages are ordered by (timestamp, id),
+# so messages that share a timestamp across a page boundary are neither skipped nor repeated.
+# A bare timestamp from an older client is still accepted and compares on the timestamp alone.
+def create_cursor(message: dict) -> str:
+    return f"{message['timestamp']}|{message.get('id') or ''}"
+
+def parse_cursor(cursor: str) -> tuple[datetime, str]:
+    timestamp, _, message_id = cursor.partition('|')
+    return parse_iso_aware(timestamp), str(uuid.UUID(message_id)) if message_id else ''
+
+def message_position(message: dict) -> tuple[datetime, str]:
+    return parse_iso_aware(message['timestamp']), message.get('id') or ''
+
 def get_ws_chat_url(conversation_id: str):
     return f'ws://{settings.DOMAIN}/ws/chat/{conversation_id}/'
 
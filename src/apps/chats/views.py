@@ -1,10 +1,19 @@
+import hmac
+import uuid
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
 from django.shortcuts import render, redirect
 from django.urls import reverse
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 
+from apps.chats.consumers.config import chat_service
+from apps.chats.exceptions import ConversationNotFoundError, ProfileInProgressError
 from apps.chats.forms import ChatRoomForm
+from apps.chats.metrics import CONTENT_TYPE, registry
+from apps.chats.profiling import SORT_KEYS, capture_profile, dump_stats, format_stats
 from apps.chats.models import Conversation
 from apps.chats.services.notifier import ConversationNotifier
 from apps.chats.utils import get_ws_chat_url, get_ws_conversation_url, get_chat_select_url
@@ -34,7 +43,7 @@ class ConversationViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        ConversationNotifier.broadcast_conversations_add(str(conv.id))
+        ConversationNotifier.broadcast_conversations_add(conv)
 
         return Response(status=status.HTTP_201_CREATED)
 
@@ -71,6 +80,7 @@ def room_select_create_view(request):
                 title = form.cleaned_data.get('room')
                 conv = Conversation.objects.create(title=title)
                 logger.info(f"Room create: {conv.id}")
+                ConversationNotifier.broadcast_conversations_add(conv)
                 return redirect('chat', conv.id)
             except Exception as e:
                 logger.error(f'Room Creation failed: {e}')
@@ -84,18 +94,58 @@ def room_select_create_view(request):
 @login_required(login_url='login')
 def chat_dashboard_view(request, chat_id):
     try:
-        conv = Conversation.objects.get(id=chat_id)
+        conv_id = str(uuid.UUID(chat_id))
+        chat_name = chat_service.get_conversation_title(conv_id)
+    except (ValueError, ConversationNotFoundError):
+        return redirect('chat_not_found')
     except Exception as e:
         logger.error(f'chat dashboard failed: {e}')
         return redirect('chat_not_found')
 
     return render(request, 'chat/chat_dashboard.html',{
-        'chat_id': conv.id,
-        'chat_name':conv.get_title(),
-        'ws_chat_url': get_ws_chat_url(conv.id),
+        'chat_id': conv_id,
+        'chat_name': chat_name,
+        'ws_chat_url': get_ws_chat_url(conv_id),
         'chat_select_url': get_chat_select_url(),
         'user_id': request.user.id
     })
 
 def room_not_found_view(request):
-    return render(request, 'chat/not_found.html')
\ No newline at end of file
+    return render(request, 'chat/not_found.html')
+
+# Scrapers can't log in, so they send the configured token instead of a staff session
+def metrics_view(request):
+    token = settings.CHAT_METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    has_token = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    if not (request.user.is_staff or has_token):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
+
+# Async so the capture runs on the worker's event loop, alongside the consumers it profiles.
+# ?seconds=N&sort=cumulative&limit=50 for a text report, ?format=pstats for a .prof file.
+async def profile_view(request):
+    user = await request.auser()
+    if not user.is_staff:
+        return HttpResponseForbidden()
+
+    try:
+        seconds = min(max(float(request.GET.get('seconds', 10)), 0), settings.CHAT_PROFILE_MAX_SECONDS)
+        limit = int(request.GET.get('limit', 50))
+    except ValueError:
+        return HttpResponseBadRequest('seconds and limit must be numbers')
+    sort = request.GET.get('sort', 'cumulative')
+    if sort not in SORT_KEYS:
+        return HttpResponseBadRequest(f'sort must be one of {sorted(SORT_KEYS)}')
+
+    try:
+        profiler = await capture_profile(seconds)
+    except ProfileInProgressError as e:
+        return HttpResponse(str(e), status=409)
+    logger.info(f'Profile of {seconds}s captured by {user.email}')
+
+    if request.GET.get('format') == 'pstats':
+        response = HttpResponse(dump_stats(profiler), content_type='application/octet-stream')
+        response['Content-Disposition'] = 'attachment; filename="chat.prof"'
+        return response
+    return HttpResponse(format_stats(profiler, sort, limit), content_type='text/plain; charset=utf-8')
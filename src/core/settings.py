@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -94,14 +95,28 @@ DATABASES = {
     }
 }
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [os.getenv('REDIS_URL')],
+# Group fan-out. 'redis' spreads groups over CHANNEL_REDIS_URLS (comma separated, REDIS_URL by
+# default). channels_redis places each group, and so each conversation, on a host by a CRC32 of
+# its name, so every worker agrees on the placement as long as they share the same host list.
+# 'memory' keeps fan-out inside the process: only for single-worker deployments and tests.
+CHANNEL_LAYER_BACKEND = os.getenv('CHANNEL_LAYER_BACKEND', 'redis')
+CHANNEL_REDIS_URLS = os.getenv('CHANNEL_REDIS_URLS', os.getenv('REDIS_URL') or '').split(',')
+
+if CHANNEL_LAYER_BACKEND == 'memory':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
         },
-    },
-}
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [url.strip() or None for url in CHANNEL_REDIS_URLS],
+            },
+        },
+    }
 
 
 # Password validation
@@ -162,6 +177,7 @@ os.makedirs(LOG_DIR, exist_ok=True)
 DJANGO_LOG_FILE = os.path.join(LOG_DIR, 'django.log')
 REDIS_LOG_FILE = os.path.join(LOG_DIR, 'redis.log')
 GENERAL_LOG_FILE = os.path.join(LOG_DIR, 'general.log')
+TRACE_LOG_FILE = os.path.join(LOG_DIR, 'traces.jsonl')
 
 LOGGING = {
     'version': 1,
@@ -176,6 +192,10 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'bare': {
+            'format': '{message}',
+            'style': '{',
+        },
     },
 
     'handlers': {
@@ -202,6 +222,15 @@ LOGGING = {
             'class': 'logging.StreamHandler',
             'formatter': 'simple',
         },
+        # One JSON trace per line, see apps/chats/tracing.py
+        'trace_file': {
+            'level': 'INFO',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': TRACE_LOG_FILE,
+            'maxBytes': int(os.getenv('CHAT_TRACE_FILE_MAX_BYTES', 10 * 1024 * 1024)),
+            'backupCount': int(os.getenv('CHAT_TRACE_FILE_BACKUPS', 5)),
+            'formatter': 'bare',
+        },
     },
 
     'loggers': {
@@ -220,10 +249,85 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'trace': {
+            'handlers': ['trace_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
 REDIS_URL = os.getenv('REDIS_URL')
 GRAVATAR_URL = "https://www.gravatar.com/avatar/"
 HOST = os.getenv('HOST')
-DOMAIN = os.getenv('DOMAIN')
\ No newline at end of file
+DOMAIN = os.getenv('DOMAIN')
+
+# Chat
+
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 50))
+
+# Maximum number of messages kept in Redis per conversation (0 disables the cap)
+CHAT_REDIS_HISTORY_LIMIT = int(os.getenv('CHAT_REDIS_HISTORY_LIMIT', 1000))
+
+# Storage format for cached messages: 'json' or 'msgpack'. Both are always readable.
+CHAT_REDIS_CODEC = os.getenv('CHAT_REDIS_CODEC', 'json')
+
+# Queue messages and bulk insert them from a background thread instead of one INSERT per message
+CHAT_DB_WRITE_BEHIND = os.getenv('CHAT_DB_WRITE_BEHIND', 'false').lower() == 'true'
+CHAT_DB_WRITE_BATCH_SIZE = int(os.getenv('CHAT_DB_WRITE_BATCH_SIZE', 100))
+CHAT_DB_WRITE_FLUSH_INTERVAL = float(os.getenv('CHAT_DB_WRITE_FLUSH_INTERVAL', 0.5))
+
+# Message rate limits as (per second, per minute); overrides are keyed by conversation id
+CHAT_THROTTLE_LIMITS = (1, 10)
+CHAT_THROTTLE_OVERRIDES = json.loads(os.getenv('CHAT_THROTTLE_OVERRIDES', '{}'))
+# Monthly range partitioning of the message table (Postgres, see the chat_message_partitions command).
+# When enabled, history reads look at the two newest partitions before older ones.
+CHAT_MESSAGE_PARTITIONING = os.getenv('CHAT_MESSAGE_PARTITIONING', 'false').lower() == 'true'
+CHAT_MESSAGE_PARTITION_MONTHS_AHEAD = int(os.getenv('CHAT_MESSAGE_PARTITION_MONTHS_AHEAD', 3))
+CHAT_MESSAGE_RETENTION_MONTHS = int(os.getenv('CHAT_MESSAGE_RETENTION_MONTHS', 0))
+
+# A client reconnecting with ?since=<timestamp> gets only newer messages if at most this many are
+# still in the Redis cache after its cursor; otherwise it receives the latest page as usual
+CHAT_RESUME_LIMIT = int(os.getenv('CHAT_RESUME_LIMIT', 500))
+
+# Presence: each connection heartbeats every interval and is dropped after the TTL without one
+CHAT_PRESENCE_HEARTBEAT_INTERVAL = float(os.getenv('CHAT_PRESENCE_HEARTBEAT_INTERVAL', 15))
+CHAT_PRESENCE_TTL = float(os.getenv('CHAT_PRESENCE_TTL', 45))
+# Upper bound on users sent in the connect snapshot; the frame always carries the full count
+CHAT_SNAPSHOT_USERS_LIMIT = int(os.getenv('CHAT_SNAPSHOT_USERS_LIMIT', 200))
+
+# Typing indicators: at most one broadcast per user per interval; receivers drop older events
+CHAT_TYPING_INTERVAL = float(os.getenv('CHAT_TYPING_INTERVAL', 2))
+
+# Per-connection outbound queue. When it is full, typing frames are dropped first; a chat
+# message that still does not fit either closes the connection ('disconnect') or is dropped
+# ('drop'). Connections whose socket accepts nothing for CHAT_OUTBOUND_SEND_TIMEOUT are closed.
+CHAT_OUTBOUND_QUEUE_SIZE = int(os.getenv('CHAT_OUTBOUND_QUEUE_SIZE', 256))
+CHAT_OUTBOUND_OVERFLOW = os.getenv('CHAT_OUTBOUND_OVERFLOW', 'disconnect')
+CHAT_OUTBOUND_SEND_TIMEOUT = float(os.getenv('CHAT_OUTBOUND_SEND_TIMEOUT', 10))
+
+# Session -> user cache for WebSocket handshakes. Entries live CHAT_SESSION_CACHE_TTL seconds in
+# each process and are dropped in every process on logout or user changes, through Redis pub/sub.
+# With CHAT_SESSION_CACHE_REDIS on, snapshots are also shared through Redis for CHAT_SESSION_CACHE_REDIS_TTL.
+CHAT_SESSION_CACHE_SIZE = int(os.getenv('CHAT_SESSION_CACHE_SIZE', 10000))
+CHAT_SESSION_CACHE_TTL = float(os.getenv('CHAT_SESSION_CACHE_TTL', 30))
+CHAT_SESSION_CACHE_REDIS = os.getenv('CHAT_SESSION_CACHE_REDIS', 'false').lower() == 'true'
+CHAT_SESSION_CACHE_REDIS_TTL = int(os.getenv('CHAT_SESSION_CACHE_REDIS_TTL', 300))
+
+# Conversation list served to the room selector from a versioned Redis snapshot
+CHAT_CONVERSATIONS_PAGE_SIZE = int(os.getenv('CHAT_CONVERSATIONS_PAGE_SIZE', 100))
+CHAT_CONVERSATIONS_CACHE_TTL = int(os.getenv('CHAT_CONVERSATIONS_CACHE_TTL', 3600))
+
+# Per-process cache of which conversations exist, used by the chat page and consumer
+CHAT_CONVERSATION_CACHE_SIZE = int(os.getenv('CHAT_CONVERSATION_CACHE_SIZE', 10000))
+CHAT_CONVERSATION_CACHE_TTL = float(os.getenv('CHAT_CONVERSATION_CACHE_TTL', 60))
+CHAT_CONVERSATION_CACHE_NEGATIVE_TTL = float(os.getenv('CHAT_CONVERSATION_CACHE_NEGATIVE_TTL', 5))
+
+# Prometheus metrics at /admin/metrics/, for staff users or requests with this bearer token
+CHAT_METRICS_TOKEN = os.getenv('CHAT_METRICS_TOKEN', '')
+
+# Span tracing: the share of root spans (consumer handlers, service calls outside one) that
+# are recorded with all their children to TRACE_LOG_FILE. 0 turns tracing off.
+CHAT_TRACE_SAMPLE_RATE = float(os.getenv('CHAT_TRACE_SAMPLE_RATE', 0))
+# Longest profile a staff user can capture from /admin/profile/
+CHAT_PROFILE_MAX_SECONDS = float(os.getenv('CHAT_PROFILE_MAX_SECONDS', 60))
@@ -19,7 +19,11 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from apps.chats.views import metrics_view, profile_view
+
 urlpatterns = [
+    path('admin/metrics/', metrics_view, name='metrics'),
+    path('admin/profile/', profile_view, name='profile'),
     path('admin/', admin.site.urls),
 
     path('auth/', include('apps.users.urls')),